@@ -23,10 +23,10 @@ import numpy as np
 import base64
 import time
 import threading
-import colorsys
 import joblib
 import paho.mqtt.client as mqtt
 from banana_detector_no_grey import detect_banana_ultimate  # same as before
+from feature_registry import SPOILAGE, hue_ripeness
 
 # Read token and chat ID from BoxAPI.txt
 with open("BotAPI.txt", "r") as f:
@@ -50,8 +50,9 @@ MQTT_BROKER = "test.mosquitto.org"
 MQTT_PORT = 1883
 MQTT_TOPIC = "fruiture/#"
 
-# Load your trained model once
+# Load your trained model once (fails here, not mid-prediction, if its columns don't match)
 loaded_model = joblib.load("banana_spoilage_model.pkl")
+SPOILAGE.validate(model=loaded_model)
 
 # -------------------------------
 # Temporary storage for one batch of readings
@@ -68,15 +69,7 @@ entry_lock = threading.Lock()
 # -------------------------------
 # Convert RGB → ripeness (0 to 1)
 # -------------------------------
-def rgb_to_ripeness(r, g, b):
-    # normalize RGB to [0,1]
-    r_norm, g_norm, b_norm = r / 255.0, g / 255.0, b / 255.0
-    h, s, v = colorsys.rgb_to_hsv(r_norm, g_norm, b_norm)
-    h_deg = h * 360
-    # green ~120°, yellow ~60°, brown ~30°, black ~0°
-    ripeness = (120 - h_deg) / 120  # 0 = green, 1 = brown/black
-    ripeness = np.clip(ripeness, 0, 1)
-    return ripeness
+rgb_to_ripeness = hue_ripeness  # green ~120°, yellow ~60°, brown ~30°, black ~0° (see feature_registry)
 
 # -------------------------------
 # MQTT Callbacks
@@ -132,15 +125,14 @@ def check_and_predict():
 
     # If all fields are present, run prediction
     if all(current_entry.get(k) is not None for k in required):
-        temp = current_entry["temperature"]
-        hum = current_entry["humidity"]
         r, g, b = current_entry["rgb"]
 
-        # Convert RGB to ripeness
-        ripeness = rgb_to_ripeness(r, g, b)
-
-        # Prepare model input
-        new_sample = np.array([[temp, hum, ripeness]])
+        # Prepare model input: temperature, humidity, ripeness (RGB → hue ripeness)
+        new_sample = SPOILAGE.vector({
+            "temperature": current_entry["temperature"],
+            "humidity": current_entry["humidity"],
+            "avg_R": r, "avg_G": g, "avg_B": b,
+        })[None, :]
 
         # Predict
         predicted_days = loaded_model.predict(new_sample)[0]
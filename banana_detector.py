@@ -1,35 +1,57 @@
+import hashlib
+import json
+
 import cv2
 import numpy as np
 
+from detection_cache import default_cache, image_hash, result_from_cache, result_to_cache
+
+# yellow banana, then a lower threshold for browner/darker banana (HSV lower/upper)
+YELLOW_RANGES = (
+    ((10, 60, 60), (35, 255, 255)),
+    ((8, 40, 40), (40, 255, 255)),
+)
+BLUR_SIZE = 7
+KERNEL_SIZE = 7
+MIN_BANANA_AREA = 500
+
+# cache key part: changes whenever the thresholds above change, so cached results are not reused
+AVG_COLOR_FINGERPRINT = "avg_color_" + hashlib.sha256(json.dumps({
+    "ranges": YELLOW_RANGES, "blur": BLUR_SIZE, "kernel": KERNEL_SIZE, "min_area": MIN_BANANA_AREA,
+}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
 # returns (visual: img, meanRGB: int tuple)
 def detect_banana_and_avg_color(img):
     vis = img.copy()
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    hsv = cv2.GaussianBlur(hsv, (7, 7), 0)
+    banana_cnt, mean_rgb = analyze_banana_avg_color(img)
+    if mean_rgb is not None:
+        draw_avg_color(vis, banana_cnt, mean_rgb)
+    return vis, mean_rgb
 
-    # yellow banana
-    lower_yellow = np.array([10, 60, 60])
-    upper_yellow = np.array([35, 255, 255])
-    mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
+# returns (contour, meanRGB: int tuple) without drawing
+def analyze_banana_avg_color(img):
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    hsv = cv2.GaussianBlur(hsv, (BLUR_SIZE, BLUR_SIZE), 0)
 
-    # lower threshold for browner/darker banana
-    lower_yellow2 = np.array([8, 40, 40])
-    upper_yellow2 = np.array([40, 255, 255])
-    mask_yellow = cv2.bitwise_or(mask_yellow, cv2.inRange(hsv, lower_yellow2, upper_yellow2))
+    # yellow banana, or'ed with the browner/darker range
+    mask_yellow = None
+    for lower, upper in YELLOW_RANGES:
+        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        mask_yellow = mask if mask_yellow is None else cv2.bitwise_or(mask_yellow, mask)
 
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (KERNEL_SIZE, KERNEL_SIZE))
     mask = cv2.morphologyEx(mask_yellow, cv2.MORPH_CLOSE, kernel, iterations=2)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
 
     # Find contours and pick the largest
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
-        return vis, None
+        return None, None
 
     contours = sorted(contours, key=cv2.contourArea, reverse=True)
     banana_cnt = contours[0]
-    if cv2.contourArea(banana_cnt) < 500:
-        return vis, None
+    if cv2.contourArea(banana_cnt) < MIN_BANANA_AREA:
+        return None, None
 
     # Create mask for chosen contour
     banana_mask = np.zeros(mask.shape, dtype=np.uint8)
@@ -39,7 +61,9 @@ def detect_banana_and_avg_color(img):
     mean_bgr = cv2.mean(img, mask=banana_mask)[:3]
     mean_bgr = tuple(int(round(c)) for c in mean_bgr)
     mean_rgb = (mean_bgr[2], mean_bgr[1], mean_bgr[0])
+    return banana_cnt, mean_rgb
 
+def draw_avg_color(vis, banana_cnt, mean_rgb):
     # Draw bounding box for the banana
     cv2.drawContours(vis, [banana_cnt], -1, (0, 255, 0), 3)
     x, y, w, h = cv2.boundingRect(banana_cnt)
@@ -49,12 +73,28 @@ def detect_banana_and_avg_color(img):
     text = f"Avg RGB: {mean_rgb}"
     cv2.putText(vis, text, (x, y),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2, cv2.LINE_AA)
+    return vis
 
-    return vis, mean_rgb
+# cached by sha256(file bytes): repeat runs on the same image skip detection
+def detect_banana_and_avg_color_from_path(image_path: str, use_cache=True):
+    with open(image_path, "rb") as f:
+        data = f.read()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if not use_cache:
+        return detect_banana_and_avg_color(img)
+
+    cache, key = default_cache(), image_hash(data)
+    hit = cache.get(key, AVG_COLOR_FINGERPRINT)
+    if hit is not None:
+        banana_cnt, mean_rgb, _, _ = result_from_cache(hit)
+    else:
+        banana_cnt, mean_rgb = analyze_banana_avg_color(img)
+        cache.put(key, AVG_COLOR_FINGERPRINT, result_to_cache(banana_cnt, mean_rgb, None, None))
 
-def detect_banana_and_avg_color_from_path(image_path: str):
-    img = cv2.imread(image_path)
-    return detect_banana_and_avg_color(img)
+    vis = img.copy()
+    if mean_rgb is not None:
+        draw_avg_color(vis, banana_cnt, mean_rgb)
+    return vis, mean_rgb
 
 if __name__ == "__main__":
     image_path = "test_imgs/IMG_7173.JPG"
@@ -1,102 +1,425 @@
-import cv2
-import numpy as np
-
-def detect_banana_ultimate(img):
-    vis = img.copy()
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    hsv = cv2.GaussianBlur(hsv, (7, 7), 0)
-
-    # --- Adaptive brightness normalization ---
-    h, s, v = cv2.split(hsv)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    v_eq = clahe.apply(v)
-    hsv = cv2.merge([h, s, v_eq])
-
-    # --- Color ranges (calibrated for ESP32-CAM lighting) ---
-    lower_green  = np.array([30, 40, 40])
-    upper_green  = np.array([80, 255, 255])
-    lower_yellow = np.array([18, 60, 60])
-    upper_yellow = np.array([35, 255, 255])
-    lower_brown  = np.array([5, 50, 50])
-    upper_brown  = np.array([25, 200, 200])
-    lower_black  = np.array([0, 0, 20])
-    upper_black  = np.array([25, 120, 80])
-
-    # --- Masks ---
-    mask_green  = cv2.inRange(hsv, lower_green, upper_green)
-    mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
-    mask_brown  = cv2.inRange(hsv, lower_brown, upper_brown)
-    mask_black  = cv2.inRange(hsv, lower_black, upper_black)
-
-    # Merge everything
-    mask_total = cv2.bitwise_or(mask_yellow,
-                    cv2.bitwise_or(mask_green,
-                        cv2.bitwise_or(mask_brown, mask_black)))
-
-    # --- Reject gray areas (low saturation regardless of hue) ---
-    gray_reject = cv2.inRange(hsv, (0, 0, 0), (180, 40, 255))  # S < 40 = gray
-    mask_total = cv2.bitwise_and(mask_total, cv2.bitwise_not(gray_reject))
-
-    # --- Morphological smoothing ---
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_CLOSE, kernel, iterations=2)
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, kernel, iterations=2)
-
-    # --- Smooth mask + full contour detection ---
-    mask_smooth = cv2.GaussianBlur(mask_total, (9, 9), 0)
-    _, mask_smooth = cv2.threshold(mask_smooth, 127, 255, cv2.THRESH_BINARY)
-
-    contours, _ = cv2.findContours(mask_smooth, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    if not contours:
-        return vis, None, None, None
-
-    banana_cnt = max(contours, key=cv2.contourArea)
-    if cv2.contourArea(banana_cnt) < 400:
-        return vis, None, None, None
-
-    # --- Smooth contour using poly approximation ---
-    epsilon = 0.003 * cv2.arcLength(banana_cnt, True)
-    banana_cnt = cv2.approxPolyDP(banana_cnt, epsilon, True)
-
-    # --- Mask for final banana area ---
-    banana_mask = np.zeros(mask_total.shape, dtype=np.uint8)
-    cv2.drawContours(banana_mask, [banana_cnt], -1, 255, -1)
-
-    # --- Average RGB color (use median to resist gray outliers) ---
-    masked_pixels = img[banana_mask == 255]
-    if masked_pixels.size == 0:
-        return vis, None, None, None
-
-    mean_rgb = tuple(int(np.median(masked_pixels[:, i])) for i in [2, 1, 0])
-
-    # --- Color fractions ---
-    total_px = cv2.countNonZero(mask_total)
-    if total_px == 0:
-        return vis, mean_rgb, None, None
-
-    color_counts = {
-        "green":  cv2.countNonZero(cv2.bitwise_and(mask_green, banana_mask)),
-        "yellow": cv2.countNonZero(cv2.bitwise_and(mask_yellow, banana_mask)),
-        "brown":  cv2.countNonZero(cv2.bitwise_and(mask_brown, banana_mask)),
-        "black":  cv2.countNonZero(cv2.bitwise_and(mask_black, banana_mask))
-    }
-    proportions = {k: round(v / total_px * 100, 1) for k, v in color_counts.items()}
-
-    # --- Ripeness scoring (calibrated for realistic aging) ---
-    ripeness = int(round(100 * (
-        0.0 * proportions.get("green", 0) / 100 +
-        0.3 * proportions.get("yellow", 0) / 100 +
-        0.7 * proportions.get("brown", 0) / 100 +
-        1.0 * proportions.get("black", 0) / 100
-    )))
-
-    # --- Draw contour and label ---
-    x, y, w, h = cv2.boundingRect(banana_cnt)
-    cv2.rectangle(vis, (x, y), (x + w, y + h), (255, 0, 0), 2)
-    cv2.drawContours(vis, [banana_cnt], -1, (0, 220, 0), 3)
-
-    label = f"Ripeness: {ripeness}/100 | RGB {mean_rgb}"
-    cv2.putText(vis, label, (x, y - 10),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2, cv2.LINE_AA)
-
-    return vis, mean_rgb, ripeness, proportions
\ No newline at end of file
+import hashlib
+import json
+import threading
+
+import cv2
+import numpy as np
+
+from detection_cache import default_cache, image_hash, result_from_cache, result_to_cache
+
+# --- Color ranges (calibrated for ESP32-CAM lighting), HSV lower/upper ---
+COLOR_RANGES = {
+    "green":  ((30, 40, 40), (80, 255, 255)),
+    "yellow": ((18, 60, 60), (35, 255, 255)),
+    "brown":  ((5, 50, 50),  (25, 200, 200)),
+    "black":  ((0, 0, 20),   (25, 120, 80)),
+}
+GRAY_MAX_SATURATION = 40  # S <= 40 = gray, rejected regardless of hue
+MIN_BANANA_AREA = 400
+DETECTOR_VERSION = 1  # bump when scoring/processing changes in ways the constants above don't show
+
+
+def detector_fingerprint(mode="full", detector=None):
+    """Short hash of the detector configuration, used to key cached / resumed results."""
+    config = {
+        "version": DETECTOR_VERSION,
+        "mode": mode,
+        "ranges": COLOR_RANGES,
+        "gray_max_s": GRAY_MAX_SATURATION,
+        "min_area": MIN_BANANA_AREA,
+    }
+    if mode == "fast":
+        config["fast"] = (detector or _default_fast_detector).config()
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def detect_banana_ultimate(img):
+    vis = img.copy()
+    banana_cnt, mean_rgb, ripeness, proportions = analyze_banana(img)
+
+    # --- Draw contour and label ---
+    if ripeness is not None:
+        draw_overlay(vis, banana_cnt, ripeness, mean_rgb)
+
+    return vis, mean_rgb, ripeness, proportions
+
+
+def analyze_banana(img):
+    """Detection without drawing: (contour, mean_rgb, ripeness, proportions)."""
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    hsv = cv2.GaussianBlur(hsv, (7, 7), 0)
+
+    # --- Adaptive brightness normalization ---
+    h, s, v = cv2.split(hsv)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    v_eq = clahe.apply(v)
+    hsv = cv2.merge([h, s, v_eq])
+
+    # --- Color ranges (calibrated for ESP32-CAM lighting) ---
+    lower_green,  upper_green  = (np.array(b) for b in COLOR_RANGES["green"])
+    lower_yellow, upper_yellow = (np.array(b) for b in COLOR_RANGES["yellow"])
+    lower_brown,  upper_brown  = (np.array(b) for b in COLOR_RANGES["brown"])
+    lower_black,  upper_black  = (np.array(b) for b in COLOR_RANGES["black"])
+
+    # --- Masks ---
+    mask_green  = cv2.inRange(hsv, lower_green, upper_green)
+    mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
+    mask_brown  = cv2.inRange(hsv, lower_brown, upper_brown)
+    mask_black  = cv2.inRange(hsv, lower_black, upper_black)
+
+    # Merge everything
+    mask_total = cv2.bitwise_or(mask_yellow,
+                    cv2.bitwise_or(mask_green,
+                        cv2.bitwise_or(mask_brown, mask_black)))
+
+    # --- Reject gray areas (low saturation regardless of hue) ---
+    gray_reject = cv2.inRange(hsv, (0, 0, 0), (180, GRAY_MAX_SATURATION, 255))  # S < 40 = gray
+    mask_total = cv2.bitwise_and(mask_total, cv2.bitwise_not(gray_reject))
+
+    # --- Morphological smoothing ---
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, kernel, iterations=2)
+
+    # --- Smooth mask + full contour detection ---
+    mask_smooth = cv2.GaussianBlur(mask_total, (9, 9), 0)
+    _, mask_smooth = cv2.threshold(mask_smooth, 127, 255, cv2.THRESH_BINARY)
+
+    contours, _ = cv2.findContours(mask_smooth, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None, None, None, None
+
+    banana_cnt = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(banana_cnt) < MIN_BANANA_AREA:
+        return None, None, None, None
+
+    # --- Smooth contour using poly approximation ---
+    epsilon = 0.003 * cv2.arcLength(banana_cnt, True)
+    banana_cnt = cv2.approxPolyDP(banana_cnt, epsilon, True)
+
+    # --- Mask for final banana area ---
+    banana_mask = np.zeros(mask_total.shape, dtype=np.uint8)
+    cv2.drawContours(banana_mask, [banana_cnt], -1, 255, -1)
+
+    # --- Average RGB color (use median to resist gray outliers) ---
+    masked_pixels = img[banana_mask == 255]
+    if masked_pixels.size == 0:
+        return None, None, None, None
+
+    mean_rgb = tuple(int(np.median(masked_pixels[:, i])) for i in [2, 1, 0])
+
+    # --- Color fractions ---
+    total_px = cv2.countNonZero(mask_total)
+    if total_px == 0:
+        return banana_cnt, mean_rgb, None, None
+
+    color_counts = {
+        "green":  cv2.countNonZero(cv2.bitwise_and(mask_green, banana_mask)),
+        "yellow": cv2.countNonZero(cv2.bitwise_and(mask_yellow, banana_mask)),
+        "brown":  cv2.countNonZero(cv2.bitwise_and(mask_brown, banana_mask)),
+        "black":  cv2.countNonZero(cv2.bitwise_and(mask_black, banana_mask))
+    }
+    proportions = {k: round(v / total_px * 100, 1) for k, v in color_counts.items()}
+
+    ripeness = ripeness_score(proportions)
+    return banana_cnt, mean_rgb, ripeness, proportions
+
+
+def ripeness_score(proportions):
+    # --- Ripeness scoring (calibrated for realistic aging) ---
+    return int(round(100 * (
+        0.0 * proportions.get("green", 0) / 100 +
+        0.3 * proportions.get("yellow", 0) / 100 +
+        0.7 * proportions.get("brown", 0) / 100 +
+        1.0 * proportions.get("black", 0) / 100
+    )))
+
+
+def draw_overlay(vis, banana_cnt, ripeness, mean_rgb):
+    x, y, w, h = cv2.boundingRect(banana_cnt)
+    cv2.rectangle(vis, (x, y), (x + w, y + h), (255, 0, 0), 2)
+    cv2.drawContours(vis, [banana_cnt], -1, (0, 220, 0), 3)
+
+    label = f"Ripeness: {ripeness}/100 | RGB {mean_rgb}"
+    cv2.putText(vis, label, (x, y - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2, cv2.LINE_AA)
+    return vis
+
+
+# =====================================================================
+# Fast path
+# ---------------------------------------------------------------------
+# Same pipeline as detect_banana_ultimate, but:
+#  - runs on a frame downscaled to max_side (kernels/areas scaled to match)
+#  - on a static camera, only looks inside the previous banana box (+margin)
+#  - classifies all four colour bins + gray rejection in one LUT pass
+#    (each HSV range is a box, so bit(h) & bit(s) & bit(v) is exact)
+#  - colour counts from one bincount, medians from masked histograms
+#
+# Tolerance vs detect_banana_ultimate (test_imgs at 640x480–1280x1024,
+# brightness and flip variants): mean RGB within ±5 per channel,
+# colour % within ±5 points, ripeness within ±5 (measured worst case:
+# 2 / 3.4 / 3). Throughput is ~3.5x at 800x600 and ~5x at SXGA.
+# With an ROI, colour % are relative to the mask inside the ROI only
+# (clutter elsewhere in the frame is ignored).
+# =====================================================================
+COLOR_BITS = {"green": 1, "yellow": 2, "brown": 4, "black": 8}
+NOT_GRAY_BIT = 16
+
+
+def _build_luts():
+    luts = [np.zeros(256, np.uint8) for _ in range(3)]
+    idx = np.arange(256)
+    for color, (lower, upper) in COLOR_RANGES.items():
+        bit = COLOR_BITS[color]
+        for ch in range(3):
+            luts[ch][(idx >= lower[ch]) & (idx <= upper[ch])] |= bit
+    # gray rejection lives on the S channel; H and V always pass it
+    luts[0] |= NOT_GRAY_BIT
+    luts[1][idx > GRAY_MAX_SATURATION] |= NOT_GRAY_BIT
+    luts[2] |= NOT_GRAY_BIT
+
+    # bits → 255 if any colour bin and not gray
+    total = np.zeros(256, np.uint8)
+    bits = np.arange(256)
+    total[((bits & 15) != 0) & ((bits & NOT_GRAY_BIT) != 0)] = 255
+    return luts[0], luts[1], luts[2], total
+
+
+_LUT_H, _LUT_S, _LUT_V, _LUT_TOTAL = _build_luts()
+
+
+def _odd(n):
+    n = max(3, int(round(n)))
+    return n if n % 2 else n + 1
+
+
+def _masked_median(channel, mask):
+    """np.median(channel[mask == 255]) truncated to int, via a 256-bin histogram."""
+    cdf = np.cumsum(cv2.calcHist([channel], [0], mask, [256], [0, 256]).ravel())
+    n = int(cdf[-1])
+    lo = int(np.searchsorted(cdf, (n - 1) // 2 + 1))
+    hi = int(np.searchsorted(cdf, n // 2 + 1))
+    return int((lo + hi) / 2)
+
+
+class FastBananaDetector:
+    """
+    Stateful fast detector (one per camera). Returns the same
+    (vis, mean_rgb, ripeness, proportions) tuple as detect_banana_ultimate.
+    """
+
+    def __init__(self, max_side=320, roi_margin=0.25, static_threshold=6.0):
+        self.max_side = max_side
+        self.roi_margin = roi_margin
+        self.static_threshold = static_threshold
+        self._lock = threading.Lock()
+        self._prev_thumb = None
+        self._prev_box = None  # (x, y, w, h) in full-frame pixels
+
+    def config(self):
+        return {"max_side": self.max_side, "roi_margin": self.roi_margin, "static_threshold": self.static_threshold}
+
+    # ---------------------------------------------------
+    # ROI tracking
+    # ---------------------------------------------------
+    def _roi(self, img):
+        thumb = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (32, 24), interpolation=cv2.INTER_AREA)
+        with self._lock:
+            prev_thumb, prev_box = self._prev_thumb, self._prev_box
+            self._prev_thumb = thumb
+        if prev_box is None or prev_thumb is None:
+            return None
+        if float(cv2.absdiff(thumb, prev_thumb).mean()) > self.static_threshold:
+            return None  # camera or scene moved
+
+        H, W = img.shape[:2]
+        x, y, w, h = prev_box
+        mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(W, x + w + mx), min(H, y + h + my)
+        if (x1 - x0) * (y1 - y0) >= 0.8 * W * H:
+            return None  # not worth cropping
+        return x0, y0, x1, y1
+
+    def analyze(self, img):
+        """Detection without drawing: (full-frame contour, mean_rgb, ripeness, proportions)."""
+        return self.analyze_tracked(img)[0]
+
+    def analyze_tracked(self, img):
+        """(result, from_roi): from_roi is True when the result came from the tracked crop."""
+        roi = self._roi(img)
+        if roi is not None:
+            result = self._analyze_region(img, roi)
+            if result[1] is not None:
+                return result, True
+        return self._analyze_region(img, None), False  # no ROI yet, or lost it → full frame
+
+    def analyze_frame(self, img):
+        """Full-frame fast detection that neither reads nor updates the ROI tracker."""
+        return self._analyze_region(img, None, track=False)
+
+    def detect(self, img):
+        vis = img.copy()
+        banana_cnt, mean_rgb, ripeness, proportions = self.analyze(img)
+        if ripeness is not None:
+            draw_overlay(vis, banana_cnt, ripeness, mean_rgb)
+        return vis, mean_rgb, ripeness, proportions
+
+    # ---------------------------------------------------
+    # Detection on (a crop of) the frame
+    # ---------------------------------------------------
+    def _analyze_region(self, img, roi, track=True):
+        x0, y0 = 0, 0
+        region = img
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            region = img[y0:y1, x0:x1]
+
+        rh, rw = region.shape[:2]
+        scale = min(1.0, self.max_side / float(max(rh, rw)))
+        small = region if scale >= 1.0 else cv2.resize(
+            region, (max(1, int(rw * scale)), max(1, int(rh * scale))), interpolation=cv2.INTER_AREA)
+        # kernels / areas are expressed for the (up to 1280 px) full frame
+        k = scale
+
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        blur = _odd(7 * k)
+        hsv = cv2.GaussianBlur(hsv, (blur, blur), 0)
+        h, s, v = cv2.split(hsv)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        v = clahe.apply(v)
+
+        # --- One LUT pass: colour bins + gray rejection as bit flags ---
+        bits = cv2.bitwise_and(cv2.LUT(h, _LUT_H), cv2.bitwise_and(cv2.LUT(s, _LUT_S), cv2.LUT(v, _LUT_V)))
+        mask_total = cv2.LUT(bits, _LUT_TOTAL)
+
+        ksize = _odd(7 * k)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksize, ksize))
+        mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_CLOSE, kernel, iterations=2)
+        mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, kernel, iterations=2)
+
+        smooth = _odd(9 * k)
+        mask_smooth = cv2.GaussianBlur(mask_total, (smooth, smooth), 0)
+        _, mask_smooth = cv2.threshold(mask_smooth, 127, 255, cv2.THRESH_BINARY)
+
+        contours, _ = cv2.findContours(mask_smooth, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None, None, None, None
+        banana_cnt = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(banana_cnt) < MIN_BANANA_AREA * k * k:
+            return None, None, None, None
+
+        epsilon = 0.003 * cv2.arcLength(banana_cnt, True)
+        banana_cnt = cv2.approxPolyDP(banana_cnt, epsilon, True)
+
+        banana_mask = np.zeros(mask_total.shape, dtype=np.uint8)
+        cv2.drawContours(banana_mask, [banana_cnt], -1, 255, -1)
+        if cv2.countNonZero(banana_mask) == 0:
+            return None, None, None, None
+
+        b, g, r = cv2.split(small)
+        mean_rgb = (_masked_median(r, banana_mask), _masked_median(g, banana_mask), _masked_median(b, banana_mask))
+
+        # Full-frame contour / box (needed for the overlay and the next ROI)
+        full_cnt = (banana_cnt.astype(np.float32) / k + (x0, y0)).round().astype(np.int32)
+        if track:
+            with self._lock:
+                self._prev_box = cv2.boundingRect(full_cnt)
+
+        total_px = cv2.countNonZero(mask_total)
+        if total_px == 0:
+            return full_cnt, mean_rgb, None, None
+
+        # --- All four colour counts from one histogram of the bit flags ---
+        hist = np.bincount(bits[banana_mask == 255], minlength=32)
+        proportions = {}
+        for color, bit in COLOR_BITS.items():
+            count = int(hist[[i for i in range(32) if i & bit]].sum())
+            proportions[color] = round(count / total_px * 100, 1)
+
+        ripeness = ripeness_score(proportions)
+        return full_cnt, mean_rgb, ripeness, proportions
+
+
+# Default parameters, only ever used statelessly: one tracker shared by every camera (and by
+# historical frames) would mix their ROIs. Per-camera tracking needs its own FastBananaDetector.
+_default_fast_detector = FastBananaDetector()
+
+
+def detect_banana_fast(img):
+    """Drop-in fast replacement for detect_banana_ultimate (full frame, no ROI tracking)."""
+    vis = img.copy()
+    banana_cnt, mean_rgb, ripeness, proportions = analyze_banana_fast(img)
+    if ripeness is not None:
+        draw_overlay(vis, banana_cnt, ripeness, mean_rgb)
+    return vis, mean_rgb, ripeness, proportions
+
+
+def analyze_banana_fast(img):
+    return _default_fast_detector.analyze_frame(img)
+
+
+ANALYZERS = {"full": analyze_banana, "fast": analyze_banana_fast}
+
+
+# =====================================================================
+# Cached entry point
+# ---------------------------------------------------------------------
+# Same tuple as detect_banana_ultimate, but looked up in the detection
+# cache by sha256(JPEG bytes) + detector_fingerprint(mode, detector) first.
+# On a hit no detection runs; with with_vis=False nothing is decoded
+# either. In fast mode only full-frame results are stored: an ROI result
+# depends on the tracker's history, not just on the bytes.
+# =====================================================================
+def _decode(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image bytes")
+    return img
+
+
+def analyze_banana_cached(data, img=None, mode="full", cache=None, detector=None):
+    """
+    (banana_cnt, mean_rgb, ripeness, proportions) for encoded image bytes,
+    from the cache when possible. detector: the camera's FastBananaDetector
+    for mode="fast" (ROI tracking); without one, fast mode analyses the
+    full frame without touching any tracker (lazy overlays, reanalysis).
+    """
+    cache = cache if cache is not None else default_cache()
+    key, fingerprint = image_hash(data), detector_fingerprint(mode, detector)
+
+    hit = cache.get(key, fingerprint)
+    if hit is not None:
+        return result_from_cache(hit)
+    if img is None:
+        img = _decode(data)
+    from_roi = False
+    if mode == "fast" and detector is not None:
+        result, from_roi = detector.analyze_tracked(img)
+    else:  # no camera tracker: stateless full-frame analysis
+        result = ANALYZERS[mode](img)
+    if not from_roi:
+        cache.put(key, fingerprint, result_to_cache(*result))
+    return result
+
+
+def detect_banana_cached(data, img=None, mode="full", with_vis=True, cache=None, detector=None):
+    """
+    data: encoded image bytes (JPEG). img: already-decoded frame, if any.
+    Returns (vis, mean_rgb, ripeness, proportions); vis is None when
+    with_vis=False. Raises ValueError if the bytes cannot be decoded.
+    """
+    banana_cnt, mean_rgb, ripeness, proportions = analyze_banana_cached(data, img, mode, cache, detector)
+    if not with_vis:
+        return None, mean_rgb, ripeness, proportions
+    if img is None:
+        img = _decode(data)
+    vis = img.copy()
+    if ripeness is not None:
+        draw_overlay(vis, banana_cnt, ripeness, mean_rgb)
+    return vis, mean_rgb, ripeness, proportions
+
+
+def detect_banana_from_path(image_path, mode="full", with_vis=True):
+    with open(image_path, "rb") as f:
+        return detect_banana_cached(f.read(), mode=mode, with_vis=with_vis)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+📦 Fruiture Batch Predictor
+---------------------------------------------------------------
+Vectorised inference for the banana regression model:
+ - Feature order / summary keys come from feature_registry.REGRESSION;
+   the model and scaler are validated against it when loaded
+ - predict(X) scales and predicts N rows in a single call and returns
+   per-row day, clamped day (1–5) and servo angle
+ - predict_summaries(list_of_dicts) for many fruit bowls at once, with a
+   confidence per row: the share of the forest's trees voting for the
+   predicted day (what predict_proba gave the old classifier); servo
+   commands are only sent at MIN_CONFIDENCE or above (confident())
+ - MicroBatcher collects summaries arriving close together (streaming)
+   and answers them with one predict call
+ - load() prefers the compiled NumPy forest (compiled_forest.py) when its
+   export is current, so sklearn is only imported as a fallback
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import joblib
+import numpy as np
+
+from compiled_forest import COMPILED_FILE, CompiledForest
+from feature_registry import REGRESSION
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(BASE_DIR, "banana_regression_model.pkl")
+SCALER_FILE = os.path.join(BASE_DIR, "banana_scaler.pkl")
+
+# (summary key, model column) in the scaler's column order
+SUMMARY_FEATURES = [(f.sources[0], f.name) for f in REGRESSION.features]
+SUMMARY_KEYS = [k for k, _ in SUMMARY_FEATURES]
+FEATURE_COLUMNS = [c for _, c in SUMMARY_FEATURES]
+
+MIN_DAY, MAX_DAY = 1, 5
+SERVO_DEGREES_PER_DAY = 45  # day 1 → 0°, day 5 → 180°
+MIN_CONFIDENCE = 0.7        # same gate as the old classifier's predict_proba
+
+
+def summaries_to_matrix(summaries):
+    """List of summary dicts → (N×7 float array, mask of rows with every feature present)."""
+    return REGRESSION.matrix(summaries)
+
+
+def confident(result, min_confidence=MIN_CONFIDENCE):
+    """Whether a prediction may move the servo (models without per-tree votes always may)."""
+    return result.get("confidence") is None or result["confidence"] >= min_confidence
+
+
+class BatchPredictor:
+    def __init__(self, model, scaler, manifest=None):
+        REGRESSION.validate(model=model, scaler=scaler, manifest=manifest)
+        self.model = model
+        # StandardScaler.transform is (X - mean_) / scale_; kept as arrays so no DataFrame is needed
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+    @classmethod
+    def load(cls, model_file=MODEL_FILE, scaler_file=SCALER_FILE, compiled_file=COMPILED_FILE, manifest=None):
+        if compiled_file and os.path.exists(compiled_file):
+            try:
+                forest = CompiledForest.load(compiled_file)
+                if forest.is_current(model_file, scaler_file):
+                    print(f"🌲 Using compiled forest {os.path.basename(compiled_file)}")
+                    return cls(forest, forest.scaler, manifest)
+                print(f"⚠️ {compiled_file} is stale (model retrained); re-run compiled_forest.py. Using sklearn.")
+            except Exception as e:
+                print(f"⚠️ Could not load {compiled_file} ({e}); using sklearn.")
+        return cls(joblib.load(model_file), joblib.load(scaler_file), manifest)
+
+    def predict(self, X):
+        """X: N×7 in FEATURE_COLUMNS order → dict of arrays day / day_clamped / servo_angle."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if X.shape[0] == 0:
+            empty = np.empty(0)
+            return {"day": empty, "day_clamped": empty.astype(int), "servo_angle": empty.astype(int)}
+        day = self.model.predict((X - self.mean) / self.scale)
+        day_clamped = np.clip(np.rint(day), MIN_DAY, MAX_DAY).astype(int)
+        return {
+            "day": day,
+            "day_clamped": day_clamped,
+            "servo_angle": (day_clamped - MIN_DAY) * SERVO_DEGREES_PER_DAY,
+        }
+
+    def tree_votes(self, X, day_clamped):
+        """Share of trees whose own (clamped) day equals day_clamped, or None for non-forest models."""
+        Xs = (np.atleast_2d(np.asarray(X, dtype=np.float64)) - self.mean) / self.scale
+        if hasattr(self.model, "predict_trees"):
+            trees = self.model.predict_trees(Xs)
+        elif hasattr(self.model, "estimators_"):
+            trees = np.stack([tree.predict(Xs) for tree in self.model.estimators_], axis=1)
+        else:
+            return None
+        votes = np.clip(np.rint(trees), MIN_DAY, MAX_DAY) == np.asarray(day_clamped)[:, None]
+        return votes.mean(axis=1)
+
+    def predict_summaries(self, summaries):
+        """One result dict per summary; None where a feature is missing."""
+        X, ok = summaries_to_matrix(summaries)
+        out = [None] * len(summaries)
+        if ok.any():
+            res = self.predict(X[ok])
+            votes = self.tree_votes(X[ok], res["day_clamped"])
+            for i, idx in enumerate(np.flatnonzero(ok)):
+                out[idx] = {
+                    "day": round(float(res["day"][i]), 3),
+                    "predicted_day": int(res["day_clamped"][i]),
+                    "servo_angle": int(res["servo_angle"][i]),
+                    "confidence": round(float(votes[i]), 3) if votes is not None else None,
+                }
+        return out
+
+
+class MicroBatcher:
+    """
+    Streaming front end: submit() returns a Future; summaries submitted
+    within `window` seconds of the first one (or until max_batch) are
+    predicted together on a background thread.
+    """
+
+    def __init__(self, predictor, window=0.05, max_batch=64):
+        self.predictor = predictor
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending = []  # (summary, future)
+        self._stop = False
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0, "last_batch_ms": None}
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, summary):
+        future = Future()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("MicroBatcher is stopped")
+            self._pending.append((summary, future))
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if not self._pending and self._stop:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            start = time.perf_counter()
+            try:
+                results = self.predictor.predict_summaries([s for s, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["last_batch_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
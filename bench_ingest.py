@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+🏋️ Fruiture Ingestion Benchmark
+---------------------------------------------------------------
+Synthetic MQTT load against the collector's real on_message / pipeline:
+ - Firmware-shaped traffic per device: temp / humidity / mq2gas / rawgas /
+   trend every --sensor-period seconds, a Base64 SXGA JPEG every
+   --image-interval seconds (frames built from test_imgs)
+ - Messages go straight into on_message through a fake client, or through
+   a real broker with --broker (e.g. a local mosquitto)
+ - Scales the device count and publish rates; --speed compresses time,
+   --no-pacing fires the whole schedule as fast as possible
+ - Reports throughput, p50/p99 handler latency per message kind and the
+   decode / detect / persist / end-to-end stage times of the image pipeline
+ - All CSVs and images go to a throw-away FRUITURE_DATA_DIR
+
+Usage:
+    python bench_ingest.py --devices 4 --duration 120 --speed 10
+    python bench_ingest.py --devices 8 --image-interval 5 --no-pacing --mode fast
+    python bench_ingest.py --broker localhost --devices 2 --duration 60
+"""
+
+import argparse
+import base64
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE_FRAME_SIZE = (1280, 1024)  # FRAMESIZE_SXGA
+FIRMWARE_JPEG_QUALITY = 90          # esp32-cam quality 8 ≈ libjpeg 90
+SENSOR_TOPICS = ("temp", "humidity", "mq2gas", "rawgas", "trend")
+
+
+# ---------------------------------------------------
+# Synthetic traffic
+# ---------------------------------------------------
+def load_frames(image_dir, variants=8, seed=0):
+    """Base64 JPEG payloads at the camera's resolution, a few brightness variants per image."""
+    rng = random.Random(seed)
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, "*"))
+                   if p.lower().endswith((".jpg", ".jpeg", ".png")))
+    frames = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        img = cv2.resize(img, FIRMWARE_FRAME_SIZE, interpolation=cv2.INTER_AREA)
+        for _ in range(variants):
+            shifted = cv2.convertScaleAbs(img, alpha=1.0, beta=rng.uniform(-8, 8))
+            ok, buf = cv2.imencode(".jpg", shifted, [cv2.IMWRITE_JPEG_QUALITY, FIRMWARE_JPEG_QUALITY])
+            if ok:
+                frames.append(base64.b64encode(buf.tobytes()))
+    if not frames:
+        raise SystemExit(f"❌ No images found in {image_dir}")
+    return frames
+
+
+def sensor_payloads(rng, t):
+    """One firmware loop: the same strings mqtt_dht11_11.ino publishes."""
+    temperature = 24.0 + 2.0 * np.sin(t / 600.0) + rng.uniform(-0.2, 0.2)
+    humidity = 70.0 + rng.uniform(-1.5, 1.5)
+    filtered = 180.0 + t / 60.0 + rng.uniform(-3, 3)
+    corrected = max(filtered - 150.0, 0.0)
+    ratio = corrected / 150.0
+    level = "Fresh" if ratio < 0.2 else "Ripening" if ratio < 0.8 else "Ripe" if ratio < 1.5 else "Overripe"
+    return {
+        "temp": f"{temperature:.1f}°C",
+        "humidity": f"{humidity:.1f}%",
+        "mq2gas": f"{corrected:.2f} ppm ({level})",
+        "rawgas": f"{filtered:.2f} ppm (filtered)",
+        "trend": f"{temperature:.1f},{humidity:.1f},{corrected:.2f},{ratio:.2f},{level}",
+    }
+
+
+def build_schedule(devices, duration, sensor_period, image_interval, frames, seed=0):
+    """Time-ordered [(offset_s, topic, payload)] for every device."""
+    rng = random.Random(seed)
+    schedule = []
+    for d in range(devices):
+        device = f"dev{d}"
+        phase = rng.uniform(0, sensor_period)
+        t = phase
+        while t < duration:
+            for leaf, payload in sensor_payloads(rng, t).items():
+                schedule.append((t, f"fruiture/{device}/{leaf}", payload.encode("utf-8")))
+            t += sensor_period
+        t = rng.uniform(0, image_interval)
+        while t < duration:
+            schedule.append((t, f"fruiture/{device}/Base64image", rng.choice(frames)))
+            t += image_interval
+    schedule.sort(key=lambda m: m[0])
+    return schedule
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+# ---------------------------------------------------
+# Publishers
+# ---------------------------------------------------
+class DirectPublisher:
+    """Calls on_message in-process and times the handler per message kind."""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.client = types.SimpleNamespace(publish=lambda *a, **k: None)
+        self.handler_latency = {"sensor": [], "image": []}
+
+    def publish(self, topic, payload):
+        kind = "image" if topic.endswith("Base64image") else "sensor"
+        message = types.SimpleNamespace(topic=topic, payload=payload)
+        start = time.perf_counter()
+        self.collector.on_message(self.client, None, message)
+        self.handler_latency[kind].append(time.perf_counter() - start)
+
+    def close(self):
+        pass
+
+
+class BrokerPublisher:
+    """Publishes to a real broker; a second client feeds the collector's on_message."""
+
+    def __init__(self, collector, host, port):
+        import paho.mqtt.client as mqtt
+
+        self.handler_latency = {"sensor": [], "image": []}
+        self.received = 0
+
+        def on_message(client, userdata, message):
+            kind = "image" if message.topic.endswith("Base64image") else "sensor"
+            start = time.perf_counter()
+            collector.on_message(client, userdata, message)
+            self.handler_latency[kind].append(time.perf_counter() - start)
+            self.received += 1
+
+        self.sub = mqtt.Client()
+        self.sub.on_message = on_message
+        self.sub.connect(host, port)
+        self.sub.subscribe("fruiture/#")
+        self.sub.loop_start()
+        self.pub = mqtt.Client()
+        self.pub.connect(host, port)
+        self.pub.loop_start()
+        time.sleep(0.5)  # let the subscription settle
+
+    def publish(self, topic, payload):
+        self.pub.publish(topic, payload, qos=0)
+
+    def close(self, expected=0, timeout=30.0):
+        deadline = time.time() + timeout
+        while self.received < expected and time.time() < deadline:
+            time.sleep(0.05)
+        for client in (self.pub, self.sub):
+            client.loop_stop()
+            client.disconnect()
+
+
+# ---------------------------------------------------
+# Run
+# ---------------------------------------------------
+def run(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="fruiture_bench_")
+    os.environ["FRUITURE_DATA_DIR"] = data_dir
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    with quiet:
+        import data_collector_final as collector
+        from ingest_pipeline import IngestPipeline
+
+        collector.DETECTOR_MODE = args.mode
+        collector.DETECTION_CACHE = args.cache
+        if not args.dedup:
+            collector.images.dedup_distance = None  # brightness variants would hash as duplicates
+        collector.image_pipeline.stop()
+        collector.image_pipeline = IngestPipeline(
+            collector.process_image,
+            workers=args.workers,
+            max_queue=args.queue_size,
+            policy=args.policy,
+            executor=args.executor,
+            name="bench",
+        )
+
+    print(f"📂 Data dir: {data_dir}")
+    frames = load_frames(args.images)
+    schedule = build_schedule(args.devices, args.duration, args.sensor_period,
+                              args.image_interval, frames, args.seed)
+    n_images = sum(1 for _, topic, _ in schedule if topic.endswith("Base64image"))
+    print(f"🧾 {len(schedule)} messages ({n_images} images) from {args.devices} device(s) "
+          f"over {args.duration:.0f}s simulated, speed ×{args.speed}"
+          f"{' (no pacing)' if args.no_pacing else ''}")
+
+    stop = threading.Event()
+
+    def ticker():
+        while not stop.wait(0.5):
+            for session in collector.devices.sessions():
+                session.joiner.poll()
+
+    threading.Thread(target=ticker, daemon=True).start()
+
+    publisher = (BrokerPublisher(collector, args.broker, args.port) if args.broker
+                 else DirectPublisher(collector))
+    lag = []
+    with quiet:
+        start = time.perf_counter()
+        for offset, topic, payload in schedule:
+            if not args.no_pacing:
+                due = start + offset / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag.append(-delay)
+            publisher.publish(topic, payload)
+        publish_s = time.perf_counter() - start
+
+        if args.broker:
+            publisher.close(expected=len(schedule))
+        drained = collector.image_pipeline.join(timeout=args.drain_timeout)
+        total_s = time.perf_counter() - start
+        stop.set()
+        for session in collector.devices.sessions():
+            session.joiner.poll(time.time() + session.joiner.tolerance)
+        pipeline = collector.image_pipeline.metrics()
+        joins = {s.device_id: s.joiner.metrics() for s in collector.devices.sessions()}
+        records = sum(len(s.store) for s in collector.devices.sessions())
+        duplicates = collector.images.metrics()["duplicates"]
+        collector.image_pipeline.stop()
+        collector.devices.close()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items()},
+        "messages": len(schedule),
+        "images": n_images,
+        "publish_s": round(publish_s, 3),
+        "total_s": round(total_s, 3),
+        "drained": drained,
+        "throughput_msg_s": round(len(schedule) / publish_s, 1) if publish_s else None,
+        "throughput_img_s": round(pipeline["processed"] / total_s, 2) if total_s else None,
+        "records_saved": records,
+        "duplicates_skipped": duplicates,
+        "pacing_lag_ms_max": round(max(lag) * 1000, 2) if lag else 0.0,
+        "handler_ms": {},
+        "pipeline": pipeline,
+        "stream_join": {
+            "joined": sum(j["joined"] for j in joins.values()),
+            "unmatched": sum(j["unmatched"] for j in joins.values()),
+            "orphaned_files": sum(j["orphaned_files"] for j in joins.values()),
+            "max_skew_s": max((j["max_skew_s"] for j in joins.values()), default=0.0),
+        },
+    }
+    for kind, values in publisher.handler_latency.items():
+        values = sorted(values)
+        if values:
+            report["handler_ms"][kind] = {
+                "count": len(values),
+                "p50": round(percentile(values, 0.50) * 1000, 3),
+                "p99": round(percentile(values, 0.99) * 1000, 3),
+                "max": round(values[-1] * 1000, 3),
+            }
+    return report
+
+
+def print_report(report):
+    p = report["pipeline"]
+    print("\n📊 Ingestion benchmark")
+    print(f"   messages        {report['messages']} in {report['publish_s']}s "
+          f"→ {report['throughput_msg_s']} msg/s offered")
+    print(f"   images          {p['processed']} processed, {p['failed']} failed, "
+          f"{p['dropped_oldest'] + p['dropped_newest']} dropped (queue max {p['max_depth']}/{p['capacity']})")
+    print(f"   image rate      {report['throughput_img_s']} img/s over {report['total_s']}s"
+          f"{'' if report['drained'] else ' (queue not drained!)'}")
+    print(f"   records saved   {report['records_saved']} "
+          f"(joined {report['stream_join']['joined']}, unmatched {report['stream_join']['unmatched']}, "
+          f"max skew {report['stream_join']['max_skew_s']}s)")
+    if report["duplicates_skipped"]:
+        print(f"   ⚠️ {report['duplicates_skipped']} near-duplicate frames skipped detection (--dedup)")
+    if report["pacing_lag_ms_max"]:
+        print(f"   ⚠️ publisher fell behind schedule by up to {report['pacing_lag_ms_max']} ms")
+    print("   on_message (ms)   count      p50      p99      max")
+    for kind, s in report["handler_ms"].items():
+        print(f"     {kind:<14} {s['count']:>6} {s['p50']:>8} {s['p99']:>8} {s['max']:>8}")
+    print("   image stages (ms) count     mean      p50      p99")
+    for stage in ("decode", "detect", "persist", "end_to_end"):
+        s = p["stages"].get(stage)
+        if s:
+            print(f"     {stage:<14} {s['count']:>6} {s['mean_ms']:>8} {s['p50_ms']:>8} {s['p99_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic MQTT load benchmark for the data collector.")
+    parser.add_argument("--devices", type=int, default=1, help="simulated fruit bowls")
+    parser.add_argument("--duration", type=float, default=60.0, help="simulated seconds of traffic")
+    parser.add_argument("--sensor-period", type=float, default=2.0, help="seconds between sensor loops (firmware: 2)")
+    parser.add_argument("--image-interval", type=float, default=20.0, help="seconds between camera frames (firmware: 20)")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression factor when pacing")
+    parser.add_argument("--no-pacing", action="store_true", help="publish the whole schedule back to back")
+    parser.add_argument("--images", default=os.path.join(BASE_DIR, "test_imgs"), help="source images for frames")
+    parser.add_argument("--broker", default=None, help="publish through this MQTT broker instead of in-process")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--mode", choices=["full", "fast"], default="full", help="detector path")
+    parser.add_argument("--cache", action="store_true", help="enable the detection cache (frames repeat!)")
+    parser.add_argument("--dedup", action="store_true", help="enable near-duplicate frame skipping (frames repeat!)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--policy", choices=["block", "drop_oldest", "drop_newest"], default="drop_oldest")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--data-dir", default=None, help="where to write CSVs/images (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the collector's own log output")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
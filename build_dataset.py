@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+🧱 Fruiture Dataset Builder
+---------------------------------------------------------------
+Merges the hand-labelled session CSVs in data/ into one columnar table:
+ - One row per recorded frame; the *_with_days_left copies are treated as
+   the same session (the labels are derived here instead)
+ - Metadata per row: session, side (left/right), day, days_left (6 - day,
+   as in linear_regression_model.ipynb), source file
+ - Windowed features computed with the collector's own RollingAggregator
+   (sliding SUMMARY_WINDOW_SECONDS window ending at each row), so training
+   sees exactly what ml_input summaries contain in production
+ - valid = False for rows the notebook filtered out (zero temp/hum/RGB)
+ - Written as Parquet (or Feather) with an explicit Arrow schema and the
+   build parameters / source hashes in the file metadata
+
+Usage:
+    python build_dataset.py                          # data/*.csv → data/sessions.parquet
+    python build_dataset.py --format feather --window 300
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+from rolling_summary import SUMMARY_FIELDS, RollingAggregator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+OUT_FILE = os.path.join(DATA_DIR, "sessions.parquet")
+SCHEMA_VERSION = 1
+DEFAULT_WINDOW_SECONDS = 600  # the collector's SUMMARY_WINDOW_SECONDS
+
+DAY_RE = re.compile(r"[Dd]ay[_]?(\d+)")
+SIDE_RE = re.compile(r"(left|right)", re.IGNORECASE)
+LABEL_SUFFIX = "_with_days_left"
+LAST_DAY = 5  # days_left = LAST_DAY + 1 - day
+
+VALID_COLUMNS = ["temperature", "humidity", "avg_R", "avg_G", "avg_B"]
+SENSOR_COLUMNS = [
+    "temperature", "humidity", "gas", "ripeness", "avg_R", "avg_G", "avg_B",
+    "green_%", "yellow_%", "brown_%", "black_%",
+]
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    fields = [
+        ("session", pa.string()),
+        ("side", pa.string()),
+        ("day", pa.int8()),
+        ("days_left", pa.int8()),
+        ("source_file", pa.string()),
+        ("timestamp", pa.timestamp("s")),
+        ("ts", pa.float64()),
+    ]
+    fields += [(c, pa.float64()) for c in SENSOR_COLUMNS]
+    fields += [("image_path", pa.string()), ("processed_image_path", pa.string()), ("valid", pa.bool_())]
+    fields += [("window_record_count", pa.int32())]
+    fields += [(key, pa.float64()) for key in SUMMARY_FIELDS]
+    return pa.schema(fields)
+
+
+# ---------------------------------------------------
+# Sessions
+# ---------------------------------------------------
+def session_files(data_dir=DATA_DIR):
+    """session name → CSV path, preferring the plain file over its *_with_days_left copy."""
+    sessions = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        session = stem[:-len(LABEL_SUFFIX)] if stem.endswith(LABEL_SUFFIX) else stem
+        if session not in sessions or not stem.endswith(LABEL_SUFFIX):
+            sessions[session] = path
+    return sessions
+
+
+def session_metadata(session):
+    day = DAY_RE.search(session)
+    side = SIDE_RE.search(session)
+    if day is None:
+        raise ValueError(f"Cannot derive the day number from '{session}'")
+    day = int(day.group(1))
+    return {
+        "session": session,
+        "side": side.group(1).lower() if side else "unknown",
+        "day": day,
+        "days_left": LAST_DAY + 1 - day,
+    }
+
+
+def windowed_features(df, window_seconds):
+    """Per-row summary of the window ending at that row, via the collector's aggregator."""
+    aggregator = RollingAggregator(window_seconds, "sliding")
+    rows = []
+    for record, ts in zip(df[SENSOR_COLUMNS].to_dict("records"), df["ts"]):
+        aggregator.add(record, ts)
+        summary = aggregator.summary(now=ts)
+        rows.append({"window_record_count": summary["record_count"],
+                     **{key: summary[key] for key in SUMMARY_FIELDS}})
+    return pd.DataFrame(rows, index=df.index)
+
+
+def load_session(session, path, window_seconds):
+    df = pd.read_csv(path)
+    meta = session_metadata(session)
+    timestamps = pd.to_datetime(df["timestamp"], format="mixed")
+    df = df.assign(timestamp=timestamps, ts=timestamps.map(lambda x: x.timestamp()))
+    df = df.sort_values("ts", kind="stable").reset_index(drop=True)
+    for column in SENSOR_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for key, value in meta.items():
+        df[key] = value
+    df["source_file"] = os.path.basename(path)
+    df["valid"] = (df[VALID_COLUMNS].fillna(0) != 0).all(axis=1)
+    return pd.concat([df, windowed_features(df, window_seconds)], axis=1)
+
+
+# ---------------------------------------------------
+# Build / load
+# ---------------------------------------------------
+def build(data_dir=DATA_DIR, out_file=OUT_FILE, window_seconds=DEFAULT_WINDOW_SECONDS, fmt="parquet"):
+    import pyarrow as pa
+
+    start = time.perf_counter()
+    sessions = session_files(data_dir)
+    frames, sources = [], []
+    for session, path in sessions.items():
+        df = load_session(session, path, window_seconds)
+        frames.append(df)
+        with open(path, "rb") as f:
+            sources.append({"file": os.path.basename(path), "rows": len(df),
+                            "sha256": hashlib.sha256(f.read()).hexdigest()})
+        print(f"📄 {os.path.basename(path)}: {len(df)} rows (day {df['day'].iloc[0]}, {df['side'].iloc[0]})")
+
+    schema = arrow_schema()
+    combined = pd.concat(frames, ignore_index=True).sort_values(["ts", "session"], kind="stable")
+    combined["timestamp"] = combined["timestamp"].astype("datetime64[s]")
+    table = pa.Table.from_pandas(combined[schema.names], schema=schema, preserve_index=False)
+    table = table.replace_schema_metadata({"fruiture": json.dumps({
+        "schema_version": SCHEMA_VERSION,
+        "built": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "window_seconds": window_seconds,
+        "window_mode": "sliding",
+        "sources": sources,
+    })})
+
+    tmp = out_file + ".tmp"
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp, compression="zstd")
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, tmp, compression="zstd")
+    os.replace(tmp, out_file)
+    print(f"✅ {table.num_rows} rows from {len(sessions)} sessions → {out_file} "
+          f"({os.path.getsize(out_file) / 1024:.1f} KB) in {time.perf_counter() - start:.2f}s")
+    return out_file
+
+
+def load_table(path=OUT_FILE, valid_only=True, columns=None):
+    """Built table as a DataFrame (Parquet or Feather, by extension); `columns` limits what is decoded."""
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + (["valid"] if valid_only else [])))
+    if path.endswith(".feather"):
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = pd.read_parquet(path, columns=columns)
+    return df[df["valid"]].reset_index(drop=True) if valid_only else df
+
+
+def table_metadata(path=OUT_FILE):
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    schema = feather.read_table(path).schema if path.endswith(".feather") else pq.read_schema(path)
+    return json.loads(schema.metadata[b"fruiture"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge data/*.csv sessions into one columnar training table.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--out", default=None, help="output file (default: data/sessions.<format>)")
+    parser.add_argument("--format", choices=["parquet", "feather"], default="parquet")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW_SECONDS,
+                        help="summary window in seconds (match the collector's SUMMARY_WINDOW_SECONDS)")
+    args = parser.parse_args()
+    out = args.out or os.path.join(args.data_dir, f"sessions.{args.format}")
+    build(args.data_dir, out, args.window, args.format)
+
+
+if __name__ == "__main__":
+    main()
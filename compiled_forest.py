@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+🌲 Fruiture Compiled Forest
+---------------------------------------------------------------
+The regression RandomForest + StandardScaler flattened into NumPy node
+tables, so edge hosts can predict without importing sklearn:
+ - export: every tree's nodes concatenated into feature / threshold /
+   left / right / value arrays (+ tree roots, scaler mean/scale) in one .npz
+ - CompiledForest.predict walks all trees for all rows at once and
+   reproduces sklearn's arithmetic exactly (float32 split inputs,
+   NaN routing, tree-ordered sum then ÷ n_trees)
+ - The export is checked bit-for-bit against sklearn before it is written
+ - The .npz records the sha256 of the .pkl files it came from, so a stale
+   export is detected when the model is retrained
+
+Usage:
+    python compiled_forest.py                      # export + verify the default model
+    python compiled_forest.py --check              # verify an existing export
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(BASE_DIR, "banana_regression_model.pkl")
+SCALER_FILE = os.path.join(BASE_DIR, "banana_scaler.pkl")
+COMPILED_FILE = os.path.join(BASE_DIR, "banana_regression_model.npz")
+FORMAT_VERSION = 1
+TREE_LEAF = -1  # sklearn's marker for "no child"
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CompiledScaler:
+    """StandardScaler stand-in: transform is (X - mean_) / scale_, exactly as sklearn computes it."""
+
+    def __init__(self, mean, scale, feature_names):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class CompiledForest:
+    def __init__(self, arrays):
+        self.meta = json.loads(str(arrays["meta"]))
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.missing_left = arrays["missing_left"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(self.meta["max_depth"])
+        self.n_trees = len(self.roots)
+        self.n_features_in_ = int(self.meta["n_features"])
+        self.scaler = CompiledScaler(arrays["scaler_mean"], arrays["scaler_scale"], self.meta["feature_names"])
+
+    @classmethod
+    def load(cls, path=COMPILED_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {k: data[k] for k in data.files}
+        if json.loads(str(arrays["meta"])).get("format") != FORMAT_VERSION:
+            raise ValueError(f"{path} has an unsupported format version")
+        return cls(arrays)
+
+    def is_current(self, model_file=MODEL_FILE, scaler_file=SCALER_FILE):
+        """False if the .pkl files changed since this export (missing .pkl files count as current)."""
+        for key, path in (("model_sha256", model_file), ("scaler_sha256", scaler_file)):
+            if os.path.exists(path) and file_sha256(path) != self.meta[key]:
+                return False
+        return True
+
+    def predict(self, X):
+        """Already-scaled X (N×n_features) → mean of the tree predictions, identical to sklearn."""
+        values = self.predict_trees(X)
+        out = np.zeros(values.shape[0], dtype=np.float64)
+        for t in range(self.n_trees):  # same order as the forest's accumulation → same rounding
+            out += values[:, t]
+        out /= self.n_trees
+        return out
+
+    def predict_trees(self, X):
+        """Already-scaled X → N×n_trees leaf values (each tree's own prediction)."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, the forest expects {self.n_features_in_}")
+        # sklearn trees split on float32 inputs, compared against float64 thresholds
+        Xf = X.astype(np.float32).astype(np.float64)
+        rows = np.arange(Xf.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (Xf.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            x = Xf[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(x), self.missing_left[nodes], x <= self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])  # leaves point at themselves
+        return self.value[nodes]
+
+
+# ---------------------------------------------------
+# Export (needs sklearn/joblib; the evaluator above does not)
+# ---------------------------------------------------
+def flatten_forest(model, scaler):
+    features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in model.estimators_:
+        tree = est.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Only single-output regression forests can be compiled")
+        n = tree.node_count
+        idx = np.arange(n, dtype=np.int32) + offset
+        leaf = tree.children_left == TREE_LEAF
+        # Leaves loop back to themselves so every row can take max_depth steps
+        lefts.append(np.where(leaf, idx, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(leaf, idx, tree.children_right + offset).astype(np.int32))
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        mgl = getattr(tree, "missing_go_to_left", None)
+        missing.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    feature_names = [str(c) for c in getattr(scaler, "feature_names_in_", [])]
+    return {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "missing_left": np.concatenate(missing),
+        "value": np.concatenate(values),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "scaler_mean": np.asarray(scaler.mean_, dtype=np.float64),
+        "scaler_scale": np.asarray(scaler.scale_, dtype=np.float64),
+    }, {
+        "format": FORMAT_VERSION,
+        "max_depth": int(max_depth),
+        "n_features": int(model.n_features_in_),
+        "n_trees": len(model.estimators_),
+        "n_nodes": int(offset),
+        "feature_names": feature_names,
+    }
+
+
+def verification_inputs(scaler, n_random=20000, seed=0):
+    """Raw feature rows spanning (and beyond) the training distribution, plus NaN rows."""
+    rng = np.random.default_rng(seed)
+    k = len(scaler.mean_)
+    X = scaler.mean_ + scaler.scale_ * rng.normal(0.0, 2.0, size=(n_random, k))
+    nan_rows = X[:200].copy()
+    nan_rows[np.arange(200), rng.integers(0, k, 200)] = np.nan
+    return np.vstack([X, nan_rows])
+
+
+def verify(forest, model, scaler, X_raw):
+    """Exact (bitwise) agreement of scaling and prediction; returns the number of rows checked."""
+    names = getattr(scaler, "feature_names_in_", None)
+    X_scaled = scaler.transform(X_raw if names is None else _frame(X_raw, names))
+    ours = forest.scaler.transform(X_raw)
+    if not np.array_equal(ours, X_scaled, equal_nan=True):
+        raise AssertionError("Compiled scaler differs from sklearn's StandardScaler")
+    expected = model.predict(X_scaled)
+    got = forest.predict(ours)
+    if not np.array_equal(got.view(np.uint64), expected.view(np.uint64)):
+        bad = int(np.sum(got != expected))
+        raise AssertionError(f"Compiled forest differs from sklearn on {bad}/{len(expected)} rows")
+    return len(expected)
+
+
+def _frame(X, columns):
+    import pandas as pd
+    return pd.DataFrame(X, columns=list(columns))
+
+
+def export_forest(model_file=MODEL_FILE, scaler_file=SCALER_FILE, out_file=COMPILED_FILE, extra_rows=None):
+    import joblib
+
+    model = joblib.load(model_file)
+    scaler = joblib.load(scaler_file)
+    arrays, meta = flatten_forest(model, scaler)
+    meta["model_sha256"] = file_sha256(model_file)
+    meta["scaler_sha256"] = file_sha256(scaler_file)
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    forest = CompiledForest(arrays)
+    X_raw = verification_inputs(scaler)
+    if extra_rows is not None:
+        X_raw = np.vstack([np.asarray(extra_rows, dtype=np.float64), X_raw])
+    checked = verify(forest, model, scaler, X_raw)
+
+    tmp = out_file + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, out_file)
+    print(f"🌲 Compiled {meta['n_trees']} trees / {meta['n_nodes']} nodes → {out_file} "
+          f"({os.path.getsize(out_file) / 1024:.1f} KB), bit-identical on {checked} rows")
+    return out_file
+
+
+def training_rows():
+    """The rows the model was trained on (dataset3 app.xlsx), if pandas can read them."""
+    path = os.path.join(BASE_DIR, "dataset3 app.xlsx")
+    try:
+        import pandas as pd
+        from feature_registry import REGRESSION
+        return REGRESSION.frame_matrix(pd.read_excel(path))
+    except Exception as e:
+        print(f"⚠️ Skipping training rows in verification ({e})")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the regression forest into NumPy node tables.")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--scaler", default=SCALER_FILE)
+    parser.add_argument("--out", default=COMPILED_FILE)
+    parser.add_argument("--check", action="store_true", help="verify an existing export instead of writing one")
+    args = parser.parse_args()
+
+    if args.check:
+        import joblib
+
+        forest = CompiledForest.load(args.out)
+        if not forest.is_current(args.model, args.scaler):
+            raise SystemExit(f"❌ {args.out} is stale: the model or scaler changed since it was exported")
+        scaler = joblib.load(args.scaler)
+        X_raw = verification_inputs(scaler)
+        rows = training_rows()
+        if rows is not None:
+            X_raw = np.vstack([rows, X_raw])
+        checked = verify(forest, joblib.load(args.model), scaler, X_raw)
+        print(f"✅ {args.out} matches sklearn bit-for-bit on {checked} rows")
+    else:
+        export_forest(args.model, args.scaler, args.out, training_rows())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,159 @@
 # -*- coding: utf-8 -*-
-import cv2
-import numpy as np
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, jsonify, render_template_string, request, send_from_directory, stream_with_context
 import threading
 import paho.mqtt.client as mqtt
-import pandas as pd
 import base64
+import mimetypes
 import os
 import time
 import re
 import json
-from datetime import datetime
-import joblib
 
-from banana_detector_no_grey import detect_banana_ultimate  # <-- your existing detector
+from history_store import parse_resolution, parse_time, to_arrow
+from storage import open_storage, rollover_cutoff
+from live_feed import LIVE_BUFFER_SIZE, LiveFeed
+from model_manager import ModelManager
+from batch_predictor import confident
+from ingest_pipeline import IngestPipeline, decode_detect_persist
+from banana_detector_no_grey import FastBananaDetector
+from detection_cache import default_cache
+from image_store import ImageStore, check_overlay
+from overlay_renderer import OverlayRenderer
+from device_sessions import DeviceRegistry, DEFAULT_DEVICE, parse_topic, device_path, device_topic
 
 # -------------------------------
 # Configuration
 # -------------------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_FILE = os.path.join(BASE_DIR, "esp32_data.csv")
-SENSOR_LOG = os.path.join(BASE_DIR, "sensor_log.csv")
-IMAGE_DIR = os.path.join(BASE_DIR, "images")
-ML_JSON = os.path.join(BASE_DIR, "ml_input.json")
-ML_HISTORY = os.path.join(BASE_DIR, "ml_input_history.csv")
+# Where data/images are written; override with FRUITURE_DATA_DIR (benchmarks, replays)
+DATA_DIR = os.environ.get("FRUITURE_DATA_DIR", BASE_DIR)
+DATA_FILE = os.path.join(DATA_DIR, "esp32_data.csv")
+IMAGE_DIR = os.path.join(DATA_DIR, "images")
+ML_JSON = os.path.join(DATA_DIR, "ml_input.json")
+
+# Sensor log / records / summary history: "sqlite" (fruiture.sqlite, WAL, indexed) or "csv" (original files)
+STORAGE_BACKEND = os.environ.get("FRUITURE_STORAGE", "sqlite")
+# Group commit: a background writer commits buffered rows every STORAGE_BATCH_SIZE rows / STORAGE_FLUSH_SECONDS
+STORAGE_BATCH_SIZE = 200
+STORAGE_FLUSH_SECONDS = 2.0
+STORAGE_DURABILITY = "flush"         # "flush" (OS buffers) | "fsync" (every batch on disk)
+# Finished days move to Parquet partitions (archive/<table>/device=…/date=…) and leave the live DB/CSVs
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+ARCHIVE_ROLLOVER = True
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
 MQTT_BROKER = "test.mosquitto.org"
 MQTT_PORT = 1883
 MQTT_TOPIC = "fruiture/#"
 
+# Image pipeline: workers, queue bound and what to do when the queue is full
+PIPELINE_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_POLICY = "drop_oldest"      # "block" | "drop_oldest" | "drop_newest"
+PIPELINE_EXECUTOR = "thread"         # "thread" | "process"
+
+# "full" = detect_banana_ultimate, "fast" = downscaled + ROI-tracked fast path (see detector)
+DETECTOR_MODE = "full"
+DETECTION_CACHE = True               # reuse results for byte-identical frames (detection_cache.sqlite)
+
+# Image storage policy (image_store.py)
+IMAGE_OVERLAY = "lazy"               # "lazy" (drawn when viewed) | "jpeg" | "webp" | "thumb" | "png" | "none"
+IMAGE_QUALITY = 80
+OVERLAY_CACHE_MB = 32                # LRU of overlays rendered on request
+# Off by default: a skipped frame reuses the previous frame's colour features and ripeness
+IMAGE_DEDUP_DISTANCE = None          # dHash bits (e.g. 4); near-duplicate frames are not stored (None = store all)
+IMAGE_DEDUP_KEEP_SECONDS = 600       # … but one frame per device is kept at least this often
+IMAGE_HOT_DAYS = 7                   # then moved to images/archive/<day>.zip (downscaled, no overlays)
+IMAGE_DELETE_AFTER_DAYS = None       # drop archived days after this many days (None = keep)
+
+# ML summary window: "sliding" = last N seconds, "tumbling" = records since the previous summary
+SUMMARY_WINDOW_SECONDS = 600         # None → all-time averages (old behaviour)
+SUMMARY_WINDOW_MODE = "sliding"
+
+# Multi-device: topics fruiture/<device>/<sensor>; fruiture/<sensor> is the "default" device
+MAX_DEVICES = 64
+
+# Frame ↔ sensor join: samples must be within ±JOIN_TOLERANCE_SECONDS of the photo
+JOIN_TOLERANCE_SECONDS = 10.0
+JOIN_MODE = "interpolate"            # "nearest" | "interpolate"
+# Frames with no sample in the window are still saved (sensor fields empty) so their images stay referenced
+JOIN_KEEP_UNMATCHED = True
+
+# Summary / ML → servo cycle
+SUMMARY_INTERVAL_SECONDS = 600
+MQTT_TOPIC_SUMMARY = "fruiture/ml_input"
+MQTT_TOPIC_PREDICT = "fruiture/servo_angle"
+# One process owns the servo topic: by default prediction.py answers every published summary.
+# True = the collector commands the servo itself (no prediction service, replays); the summary then
+# carries its "prediction" and prediction.py only sends alerts for it. Predictions are always stored.
+PUBLISH_PREDICTIONS = False
+
+# Model hot reload: new artifacts/banana_regression_*/ folders go live without a restart
+MODEL_ARTIFACT_DIR = os.path.join(BASE_DIR, "artifacts")
+MODEL_POLL_SECONDS = 30
+
+# Dashboard: records kept in memory per device, and how many the page shows
+LIVE_RECORDS = LIVE_BUFFER_SIZE
+DASHBOARD_RECORDS = 10
+
+# Time source for message timestamps, joins and summary windows (replay.py swaps in a virtual clock)
+clock = time.time
+
 print("📁 Image folder:", IMAGE_DIR)
-print("📄 Main CSV file:", DATA_FILE)
-print("📄 Continuous log file:", SENSOR_LOG)
-print("📄 ML summary history:", ML_HISTORY)
+images = ImageStore(IMAGE_DIR, IMAGE_DEDUP_DISTANCE, IMAGE_DEDUP_KEEP_SECONDS, IMAGE_HOT_DAYS,
+                    IMAGE_DELETE_AFTER_DAYS)
+check_overlay(IMAGE_OVERLAY)
 
 # -------------------------------
-# Prepare CSV files
+# Storage (sensor log, records, ML summary history)
 # -------------------------------
-if not os.path.exists(DATA_FILE):
-    pd.DataFrame(columns=[
-        "timestamp", "temperature", "humidity", "gas",
-        "ripeness", "avg_R", "avg_G", "avg_B",
-        "green_%", "yellow_%", "brown_%", "black_%",
-        "image_path", "processed_image_path"
-    ]).to_csv(DATA_FILE, index=False)
-
-if not os.path.exists(SENSOR_LOG):
-    pd.DataFrame(columns=["timestamp", "temperature", "humidity", "gas"]).to_csv(SENSOR_LOG, index=False)
-
-if not os.path.exists(ML_HISTORY):
-    pd.DataFrame(columns=[
-        "timestamp", "record_count",
-        "average_temperature", "average_humidity",
-        "average_gas", "max_gas",
-        "average_R", "average_G", "average_B",
-        "predicted_day", "confidence", "servo_angle"
-    ]).to_csv(ML_HISTORY, index=False)
+storage = open_storage(STORAGE_BACKEND, DATA_DIR, STORAGE_BATCH_SIZE, STORAGE_FLUSH_SECONDS, STORAGE_DURABILITY,
+                       archive_dir=ARCHIVE_DIR)
+last_rollover = None  # cutoff (midnight) of the last successful archive rollover
+
+def archive_rollover():
+    """Once per day: archive every finished day and truncate it from live storage; age out old images."""
+    global last_rollover
+    cutoff = rollover_cutoff()
+    if not ARCHIVE_ROLLOVER or cutoff == last_rollover:
+        return
+    storage.archive_before(cutoff)
+    images.archive_older()
+    last_rollover = cutoff
+print(f"🗄️ Storage: {STORAGE_BACKEND} → {storage.metrics()['path']}")
 
 # -------------------------------
-# Global shared entry
+# Per-device shared entries (each with its own lock, store and summary)
 # -------------------------------
-current_entry = {
-    "timestamp": None,
-    "temperature": None,
-    "humidity": None,
-    "gas": None,
-    "ripeness": None,
-    "avg_R": None,
-    "avg_G": None,
-    "avg_B": None,
-    "green_%": None,
-    "yellow_%": None,
-    "brown_%": None,
-    "black_%": None,
-    "image_path": None,
-    "processed_image_path": None,
-}
-entry_lock = threading.Lock()
+def save_record(session, record, ts):
+    """Called by the device's stream joiner for every frame (unmatched ones carry empty sensor fields)."""
+    record["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+    session.store.append(record)
+    session.aggregator.add(record, ts)
+    feed.add_record(session.device_id, record)
+    print(f"✅ [{session.device_id}] Saved record: {record['timestamp']} | Ripeness {record.get('ripeness','?')}")
+
+feed = LiveFeed(LIVE_RECORDS)
+# processed_<ts>.jpg is drawn from raw_<ts>.jpg + the record's geometry when first requested
+overlays = OverlayRenderer(images, lookup=lambda raw_path: feed.find("image_path", raw_path),
+                           mode=DETECTOR_MODE, quality=IMAGE_QUALITY, cache_bytes=OVERLAY_CACHE_MB * 1024 * 1024)
+devices = DeviceRegistry(DATA_FILE, SUMMARY_WINDOW_SECONDS, SUMMARY_WINDOW_MODE, MAX_DEVICES,
+                         on_record=save_record, join_tolerance=JOIN_TOLERANCE_SECONDS, join_mode=JOIN_MODE,
+                         store_factory=storage.store_for, keep_unmatched=JOIN_KEEP_UNMATCHED)
+
+def set_clock(new_clock):
+    global clock
+    clock = new_clock
+    devices.set_clock(new_clock)
+
+def get_session(device_id):
+    new = devices.find(device_id) is None
+    session = devices.get(device_id)
+    if new:
+        feed.seed(device_id, session.store.tail(LIVE_RECORDS))
+    return session
+
+get_session(DEFAULT_DEVICE)
 
 # -------------------------------
 # MQTT Callbacks
@@ -88,156 +164,237 @@ def on_connect(client, userdata, flags, rc):
     print(f"📡 Subscribed to topic: {MQTT_TOPIC}")
 
 def on_message(client, userdata, message):
-    global current_entry
-    topic = message.topic
+    received_at = clock()
+    device_id, sensor = parse_topic(message.topic)
+    kind = sensor.lower()
+
+    # Camera frames are only queued here; decode/detect/save runs on the pipeline workers
+    if "base64image" in kind:
+        if image_pipeline.submit((device_id, message.payload, received_at)):
+            print(f"📥 Queued image from '{message.topic}' ({len(message.payload)} bytes)")
+        return
+
+    if not any(k in kind for k in ("temp", "hum", "gas")):
+        return  # summaries, servo feedback, baseline, trend…
+
     payload = message.payload.decode("utf-8", errors="ignore")
-    print(f"📥 Received from '{topic}': {payload[:80]}...")
+    print(f"📥 Received from '{message.topic}': {payload[:80]}...")
 
     try:
-        with entry_lock:
-            current_entry["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        session = get_session(device_id)
+        with session.lock:
+            entry = session.entry
+            entry["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(received_at))
 
-            sensor_updated = False
-            if "temp" in topic.lower():
+            sensor_updated = None
+            if "temp" in kind:
                 match = re.search(r"[-+]?\d*\.?\d+", payload)
                 if match:
-                    current_entry["temperature"] = float(match.group())
-                    sensor_updated = True
+                    entry["temperature"] = float(match.group())
+                    sensor_updated = "temperature"
 
-            elif "hum" in topic.lower():
+            elif "hum" in kind:
                 match = re.search(r"[-+]?\d*\.?\d+", payload)
                 if match:
-                    current_entry["humidity"] = float(match.group())
-                    sensor_updated = True
+                    entry["humidity"] = float(match.group())
+                    sensor_updated = "humidity"
 
-            elif "rawgas" in topic.lower():
+            elif "rawgas" in kind:
                 match = re.search(r"[-+]?\d*\.?\d+", payload)
                 if match:
-                    current_entry["raw_gas"] = float(match.group())
-                    print(f"🧪 Raw Gas (filtered): {current_entry['raw_gas']} ppm")
+                    entry["raw_gas"] = float(match.group())
+                    print(f"🧪 [{device_id}] Raw Gas (filtered): {entry['raw_gas']} ppm")
                     # You can choose to NOT mark this as sensor_updated, since you only want to view it
-                    # sensor_updated = True  # uncomment if you want to log it to CSV
+                    # sensor_updated = "raw_gas"  # uncomment if you want to log it to CSV
                     # (otherwise it just prints, not saved)
 
-            elif "gas" in topic.lower() and "rawgas" not in topic.lower():
+            elif "gas" in kind:
                 match = re.search(r"[-+]?\d*\.?\d+", payload)
                 if match:
-                    current_entry["gas"] = float(match.group())
-                    print(f"⚗️ Corrected Gas (after baseline): {current_entry['gas']} ppm")
-                    sensor_updated = True
-
-
+                    entry["gas"] = float(match.group())
+                    print(f"⚗️ [{device_id}] Corrected Gas (after baseline): {entry['gas']} ppm")
+                    sensor_updated = "gas"
 
             if sensor_updated:
-                log_sensor_data(current_entry)
-
-            elif "base64image" in topic.lower():
-                img_data = base64.b64decode(payload)
-                nparr = np.frombuffer(img_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                if img is None:
-                    print("⚠️ Image decode failed.")
-                    return
-
-                vis, mean_rgb, ripeness, proportions = detect_banana_ultimate(img)
-                timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-
-                processed_filename = f"processed_{timestamp}.png"
-                processed_path = os.path.join(IMAGE_DIR, processed_filename)
-                cv2.imwrite(processed_path, vis)
-                current_entry["processed_image_path"] = processed_filename
-
-                raw_filename = f"raw_{timestamp}.jpg"
-                raw_path = os.path.join(IMAGE_DIR, raw_filename)
-                with open(raw_path, "wb") as f:
-                    f.write(img_data)
-                current_entry["image_path"] = raw_filename
-
-                if mean_rgb:
-                    current_entry["avg_R"] = mean_rgb[0]
-                    current_entry["avg_G"] = mean_rgb[1]
-                    current_entry["avg_B"] = mean_rgb[2]
-                if ripeness is not None:
-                    current_entry["ripeness"] = ripeness
-                if proportions:
-                    for color, value in proportions.items():
-                        current_entry[f"{color}_%"] = value
-
-            check_and_save_entry()
+                log_sensor_data(entry, device_id)
+                value = entry[sensor_updated]
+
+        if sensor_updated:
+            session.joiner.add_sample(sensor_updated, received_at, value)
 
     except Exception as e:
         print("❌ Error processing message:", e)
 
+# -------------------------------
+# Image Worker (runs on the ingestion pipeline)
+# -------------------------------
+fast_detectors = {}  # device_id → FastBananaDetector (ROI tracking is per camera)
+
+def get_detector(device_id, pool=None):
+    """The device's FastBananaDetector; None → the detector module's default for DETECTOR_MODE."""
+    if DETECTOR_MODE != "fast" or pool is not None:
+        return None  # process workers keep a tracker per device_id (ingest_pipeline.device_detector)
+    detector = fast_detectors.get(device_id)
+    if detector is None:
+        detector = fast_detectors.setdefault(device_id, FastBananaDetector())
+    return detector
+
+def process_image(item, pool=None):
+    device_id, payload, received_at = item
+    session = get_session(device_id)
+    try:
+        data = base64.b64decode(payload)  # once: dedup, detection and the raw file all use these bytes
+    except ValueError:
+        print(f"⚠️ [{device_id}] Image decode failed.")
+        return
+    frame_hash, previous = images.duplicate_of(device_id, data, received_at)
+    if previous is not None:
+        # Near-duplicate of the last stored frame: no detection, no files, same fields
+        image_pipeline.record_stage("end_to_end", clock() - received_at)
+        session.joiner.add_frame(received_at, previous)
+        return
+
+    timestamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(received_at))
+    args = (data, IMAGE_DIR, timestamp, session.image_subdir, DETECTOR_MODE,
+            get_detector(device_id, pool), DETECTION_CACHE, IMAGE_OVERLAY, IMAGE_QUALITY)
+    if pool is not None:
+        fields = pool.submit(decode_detect_persist, *args, device_id=device_id).result()
+    else:
+        fields = decode_detect_persist(*args, device_id=device_id)
+    if fields is None:
+        print(f"⚠️ [{device_id}] Image decode failed.")
+        return
+    for stage, seconds in fields.pop("_stages", {}).items():
+        image_pipeline.record_stage(stage, seconds)
+    image_pipeline.record_stage("end_to_end", clock() - received_at)
+    images.remember(device_id, frame_hash, received_at, fields)
+
+    # Paired with the sensor samples around received_at by the device's stream joiner
+    session.joiner.add_frame(received_at, fields)
+
+image_pipeline = IngestPipeline(
+    process_image,
+    workers=PIPELINE_WORKERS,
+    max_queue=PIPELINE_QUEUE_SIZE,
+    policy=PIPELINE_POLICY,
+    executor=PIPELINE_EXECUTOR,
+    name="image",
+)
+
 # -------------------------------
 # Continuous Sensor Logging
 # -------------------------------
-def log_sensor_data(entry):
+def log_sensor_data(entry, device_id=DEFAULT_DEVICE):
     try:
-        df = pd.DataFrame([{
-            "timestamp": entry["timestamp"],
-            "temperature": entry.get("temperature"),
-            "humidity": entry.get("humidity"),
-            "gas": entry.get("gas")
-        }])
-        df.to_csv(SENSOR_LOG, mode="a", header=False, index=False)
+        storage.append("sensor", device_id, entry)
         print(f"📝 Logged continuous data at {entry['timestamp']}")
     except Exception as e:
         print("⚠️ Failed to log sensor data:", e)
 
 # -------------------------------
-# Save Complete Record
+# Join Ticker (flushes frames whose tolerance window has passed)
 # -------------------------------
-def check_and_save_entry():
-    global current_entry
-    required = ["timestamp", "temperature", "humidity", "gas", "image_path"]
-    if not all(current_entry.get(k) is not None for k in required):
-        return
-    try:
-        df = pd.read_csv(DATA_FILE)
-    except FileNotFoundError:
-        df = pd.DataFrame(columns=[
-            "timestamp", "temperature", "humidity", "gas",
-            "ripeness", "avg_R", "avg_G", "avg_B",
-            "green_%", "yellow_%", "brown_%", "black_%",
-            "image_path", "processed_image_path"
-        ])
-    df = pd.concat([df, pd.DataFrame([current_entry])], ignore_index=True)
-    df.to_csv(DATA_FILE, index=False)
-    print(f"✅ Saved record: {current_entry['timestamp']} | Ripeness {current_entry.get('ripeness','?')}")
-    current_entry = {k: None for k in current_entry}
+def run_join_ticker(interval=1.0):
+    while True:
+        for session in devices.sessions():
+            try:
+                session.joiner.poll()
+            except Exception as e:
+                print(f"⚠️ [{session.device_id}] Join ticker error:", e)
+        time.sleep(interval)
 
 # -------------------------------
-# 10-Minute Summary Thread (with ML)
+# Per-device Summary (+ optional ML)
 # -------------------------------
-def periodic_summary_task():
-    PUBLISH_INTERVAL = 600
-    MQTT_TOPIC_SUMMARY = "fruiture/ml_input"
-    MQTT_TOPIC_PREDICT = "fruiture/servo_angle"
+def publish_device_summary(client, session, summary, prediction, topic_summary, topic_predict):
+    device_id = session.device_id
+    ml_json = device_path(ML_JSON, device_id)
+    topic_summary = device_topic(topic_summary, device_id)
+    topic_predict = device_topic(topic_predict, device_id)
+
+    # ---- ML → Servo only if this process owns the servo topic and the forest agrees ----
+    command = PUBLISH_PREDICTIONS and prediction is not None
+    if command and not confident(prediction):
+        print(f"⚠️ [{device_id}] Low confidence ({prediction['confidence'] * 100:.1f}%), skipping servo command.")
+        command = False
+    # A summary that already carries its prediction is not answered again by prediction.py
+    outgoing = {**summary, "prediction": prediction} if command else summary
+
+    # Always save JSON + append history
+    try:
+        with open(ml_json, "w") as f:
+            json.dump(outgoing, f, indent=4)
+        print(f"💾 Wrote {ml_json}")
+    except Exception as e:
+        print(f"❌ Failed to write {ml_json}:", e)
 
-    # Try to load model & scaler, but don't abort if missing
-    model, scaler = None, None
     try:
-        model = joblib.load(os.path.join(BASE_DIR, "banana_model.pkl"))
-        scaler = joblib.load(os.path.join(BASE_DIR, "banana_scaler.pkl"))
-        print("✅ ML model and scaler loaded.")
+        storage.append("summaries", device_id, {**summary, **(prediction or {})})
+        print(f"📝 Appended summary to the [{device_id}] history")
     except Exception as e:
-        print("⚠️ ML model/scaler not loaded (will still publish summaries):", e)
+        print(f"❌ Failed to append the [{device_id}] summary history:", e)
 
-    def safe_mean(df, col):
-        if col in df.columns:
-            try:
-                return round(df[col].astype(float).mean(skipna=True), 3)
-            except Exception:
-                return None
-        return None
+    feed.add_summary(device_id, summary, prediction)
 
-    def safe_max(df, col):
-        if col in df.columns:
-            try:
-                return round(df[col].astype(float).max(skipna=True), 3)
-            except Exception:
-                return None
-        return None
+    # Publish summary (if MQTT is connected)
+    try:
+        client.publish(topic_summary, json.dumps(outgoing))
+        print(f"📡 Published 10-min summary → {topic_summary}")
+    except Exception as e:
+        print("❌ Failed to publish summary MQTT:", e)
+
+    if command:
+        payload = json.dumps({
+            "predicted_day": prediction["predicted_day"],
+            "servo_angle": prediction["servo_angle"],
+            "timestamp": summary["timestamp"]
+        })
+        client.publish(topic_predict, payload)
+        print(f"🤖 [{device_id}] Predicted day {prediction['predicted_day']} ({prediction['day']}) "
+              f"→ Servo {prediction['servo_angle']}°")
+
+# -------------------------------
+# 10-Minute Summary Thread (with ML)
+# -------------------------------
+models = ModelManager(MODEL_ARTIFACT_DIR, poll_interval=MODEL_POLL_SECONDS)
+
+def load_models():
+    """Live BatchPredictor (newest valid artifact, else the installed .pkl), or None — summaries are still published."""
+    if models.active is None:
+        models.check()
+    if models.active is not None:
+        print(f"✅ ML model {models.active.version} loaded.")
+    return models.predictor
+
+def publish_summaries(client, predictor):
+    """Summarise every device, predict all of them in one batch, then publish per device."""
+    ready = []
+    for session in devices.sessions():
+        summary = session.aggregator.summary()
+        if summary is None:
+            print(f"⚠️ [{session.device_id}] No records in the current summary window; no summary yet.")
+        else:
+            ready.append((session, summary))
+
+    predictions = [None] * len(ready)
+    if predictor is not None and ready:
+        try:
+            predictions = predictor.predict_summaries([summary for _, summary in ready])
+        except Exception as e:
+            print("⚠️ ML prediction failed:", e)
+        for (session, _), prediction in zip(ready, predictions):
+            if prediction is None:
+                print(f"ℹ️ [{session.device_id}] Missing summary fields for ML this cycle; skipping prediction.")
+
+    for (session, summary), prediction in zip(ready, predictions):
+        try:
+            publish_device_summary(client, session, summary, prediction,
+                                   MQTT_TOPIC_SUMMARY, MQTT_TOPIC_PREDICT)
+        except Exception as e:
+            print(f"⚠️ [{session.device_id}] Summary thread error:", e)
+
+def periodic_summary_task():
+    models.start()  # background watcher swaps in new artifacts between cycles
 
     client = mqtt.Client()
     try:
@@ -248,96 +405,17 @@ def periodic_summary_task():
         # Even if MQTT connect fails, we still compute JSON locally and retry next loop
 
     while True:
+        publish_summaries(client, models.predictor)
         try:
-            if not os.path.exists(DATA_FILE):
-                print("ℹ️ Waiting for esp32_data.csv to be created...")
-                time.sleep(PUBLISH_INTERVAL)
-                continue
-
-            df = pd.read_csv(DATA_FILE)
-            if df.empty:
-                print("⚠️ esp32_data.csv is empty; no summary yet.")
-                time.sleep(PUBLISH_INTERVAL)
-                continue
-
-            summary = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "record_count": int(len(df)),
-                "average_temperature": safe_mean(df, "temperature"),
-                "average_humidity": safe_mean(df, "humidity"),
-                "average_gas": safe_mean(df, "gas"),
-                "max_gas": safe_max(df, "gas"),
-                "average_R": safe_mean(df, "avg_R"),
-                "average_G": safe_mean(df, "avg_G"),
-                "average_B": safe_mean(df, "avg_B"),
-            }
-
-            # Always save JSON + append history
-            try:
-                with open(ML_JSON, "w") as f:
-                    json.dump(summary, f, indent=4)
-                print(f"💾 Wrote {ML_JSON}")
-            except Exception as e:
-                print("❌ Failed to write ml_input.json:", e)
-
-            try:
-                pd.DataFrame([summary]).to_csv(ML_HISTORY, mode="a", header=not os.path.exists(ML_HISTORY) or os.path.getsize(ML_HISTORY) == 0, index=False)
-                print(f"📝 Appended summary to {ML_HISTORY}")
-            except Exception as e:
-                print("❌ Failed to append to ml_input_history.csv:", e)
-
-            # Publish summary (if MQTT is connected)
-            try:
-                client.publish(MQTT_TOPIC_SUMMARY, json.dumps(summary))
-                print(f"📡 Published 10-min summary → {MQTT_TOPIC_SUMMARY}")
-            except Exception as e:
-                print("❌ Failed to publish summary MQTT:", e)
-
-            # ---- Optional ML → Servo (only if model loaded) ----
-            if (model is not None) and (scaler is not None):
-                try:
-                    X_input = pd.DataFrame([[
-                        summary["max_gas"],
-                        summary["average_gas"],
-                        summary["average_temperature"],
-                        summary["average_humidity"],
-                        summary["average_R"],
-                        summary["average_G"],
-                        summary["average_B"]
-                    ]], columns=[
-                        "Max_gas_diff", "Average_gas_diff", "temperature",
-                        "Humidity", "R", "G", "B"
-                    ])
-
-                    # If any are None, skip ML step this cycle
-                    if X_input.isnull().any().any():
-                        print("ℹ️ Missing summary fields for ML this cycle; skipping prediction.")
-                    else:
-                        X_scaled = scaler.transform(X_input)
-                        prediction = int(model.predict(X_scaled)[0])
-                        confidence = float(max(model.predict_proba(X_scaled)[0]))
-                        servo_angle = int((prediction - 1) * 45)  # 1–5 → 0–180
-
-                        payload = json.dumps({
-                            "predicted_day": prediction,
-                            "confidence": round(confidence, 3),
-                            "servo_angle": servo_angle,
-                            "timestamp": summary["timestamp"]
-                        })
-
-                        if confidence >= 0.7:
-                            client.publish(MQTT_TOPIC_PREDICT, payload)
-                            print(f"🤖 Predicted day {prediction} ({confidence*100:.1f}%) → Servo {servo_angle}°")
-                        else:
-                            print(f"⚠️ Low confidence ({confidence*100:.1f}%), skipping servo command.")
-                except Exception as e:
-                    print("⚠️ ML prediction failed:", e)
-
+            archive_rollover()
         except Exception as e:
-            print("⚠️ Summary thread error:", e)
-
+            print("⚠️ Archive rollover failed (rows stay in live storage):", e)
+        try:
+            storage.apply_retention()
+        except Exception as e:
+            print("⚠️ Storage retention failed:", e)
         print("⏳ Sleeping 10 minutes before next summary...\n")
-        time.sleep(PUBLISH_INTERVAL)
+        time.sleep(SUMMARY_INTERVAL_SECONDS)
 
 
 # -------------------------------
@@ -362,36 +440,147 @@ app = Flask(__name__)
 
 @app.route("/data")
 def get_data():
-    df = pd.read_csv(DATA_FILE)
-    return jsonify(df.tail(10).to_dict(orient="records"))
+    return jsonify(feed.recent(request.args.get("device", DEFAULT_DEVICE), DASHBOARD_RECORDS))
+
+@app.route("/devices")
+def get_devices():
+    return jsonify([
+        {"device": s.device_id, "records": len(s.store), "window_records": len(s.aggregator)}
+        for s in devices.sessions()
+    ])
+
+@app.route("/metrics")
+def get_metrics():
+    return jsonify({
+        "image_pipeline": image_pipeline.metrics(),
+        "stream_join": {s.device_id: s.joiner.metrics() for s in devices.sessions()},
+        "detection_cache": default_cache().stats() if DETECTION_CACHE else None,
+        "model": models.status(),
+        "live_feed": feed.metrics(),
+        "storage": storage.metrics(),
+        "images": images.metrics(),
+        "overlays": overlays.metrics(),
+    })
+
+@app.route("/model/rollback", methods=["POST"])
+def rollback_model():
+    try:
+        models.rollback()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(models.status())
+
+@app.route("/api/history")
+def get_history_index():
+    """Available series with their columns, row counts and time span for one device."""
+    return jsonify(storage.describe(request.args.get("device", DEFAULT_DEVICE)))
+
+@app.route("/api/history/<series>")
+def get_history(series):
+    """
+    ?start=&end= (local 'YYYY-MM-DD HH:MM:SS', a date or unix seconds; default last 24 h)
+    &resolution=raw|300|5m|1h|1d &columns=temperature,gas &limit=1000 &cursor=… &format=json|arrow
+    """
+    args = request.args
+    try:
+        result = storage.query(
+            series, args.get("device", DEFAULT_DEVICE),
+            start=parse_time(args.get("start")), end=parse_time(args.get("end")),
+            resolution=parse_resolution(args.get("resolution")),
+            columns=[c for c in args.get("columns", "").split(",") if c] or None,
+            limit=args.get("limit", 1000), cursor=args.get("cursor"))
+        if args.get("format") == "arrow":
+            return Response(to_arrow(result), mimetype="application/vnd.apache.arrow.stream")
+    except (ValueError, ImportError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
 
 @app.route("/images/<path:filename>")
 def serve_image(filename):
-    return send_from_directory(IMAGE_DIR, filename)
+    if os.path.isfile(os.path.join(IMAGE_DIR, filename)):
+        return send_from_directory(IMAGE_DIR, filename)
+    if overlays.handles(filename):  # lazy overlay: render now (LRU-cached)
+        rendered = overlays.render(filename)
+        if rendered is None:
+            return jsonify({"error": f"No raw frame for '{filename}'"}), 404
+        return Response(rendered[0], mimetype=rendered[1])
+    data = images.read(filename)  # aged out to the archive tier
+    if data is None:
+        return jsonify({"error": f"No image '{filename}'"}), 404
+    return Response(data, mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+
+@app.route("/stream")
+def stream():
+    """Server-Sent Events: new records and summaries/predictions as they happen."""
+    device = request.args.get("device")
+    last_id = request.headers.get("Last-Event-ID", request.args.get("last_id"))
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None  # malformed id: resume from now, like a fresh connection
+    return Response(stream_with_context(feed.stream(device, last_id)),
+                    mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+DASHBOARD_TEMPLATE = """
+<html><head><title>🍌 Fruiture Dashboard</title>
+<style>
+  body { font-family: Arial; text-align: center; background: #f9f9f9; }
+  .card { margin: 20px auto; max-width: 640px; border: 1px solid #ccc; padding: 10px; background: white; }
+  #prediction { font-size: 18px; margin: 10px; }
+</style></head>
+<body>
+  <h2>📊 ESP32-CAM + Sensor + Banana Detector</h2>
+  {% if devices|length > 1 %}
+    {% for d in devices %}<a href="/?device={{ d }}">{{ d }}</a>{% if not loop.last %} | {% endif %}{% endfor %}
+  {% endif %}
+  <div id="prediction"></div>
+  <div id="records"></div>
+<script>
+const device = {{ device|tojson }};
+const maxCards = {{ max_cards }};
+const records = document.getElementById("records");
+
+function text(v) { return v === null || v === undefined ? "" : v; }
+
+function addRecord(r) {
+  const card = document.createElement("div");
+  card.className = "card";
+  let html = `<p><b>${text(r.timestamp)}</b><br>`;
+  html += `🌡️ Temp: ${text(r.temperature)}°C | 💧 Hum: ${text(r.humidity)}% | 🧪 Gas: ${text(r.gas)} ppm<br>`;
+  if (r.ripeness != null) html += `🍌 Ripeness: ${r.ripeness}/100<br>`;
+  if (r.avg_R != null) html += `🎨 RGB: (${r.avg_R}, ${r.avg_G}, ${r.avg_B})<br>`;
+  html += `🟩 ${text(r["green_%"])}% 🟨 ${text(r["yellow_%"])}% 🟫 ${text(r["brown_%"])}% ⬛ ${text(r["black_%"])}%<br>`;
+  const image = r.processed_image_path || r.image_path;  // no overlay with IMAGE_OVERLAY = "none"
+  if (image) html += `<img src="/images/${encodeURI(image)}" width="320"><br>`;
+  card.innerHTML = html;
+  records.prepend(card);
+  while (records.children.length > maxCards) records.lastChild.remove();
+}
+
+function showSummary(s) {
+  if (!s) return;
+  const p = s.prediction;
+  document.getElementById("prediction").textContent = p
+    ? `🤖 Day ${p.predicted_day} (${p.day}) → Servo ${p.servo_angle}° · summary ${s.summary.timestamp}`
+    : `📝 Summary ${s.summary.timestamp} (no prediction)`;
+}
+
+{{ rows|tojson }}.forEach(addRecord);
+showSummary({{ latest|tojson }});
+
+const source = new EventSource("/stream?device=" + encodeURIComponent(device));
+source.addEventListener("record", e => addRecord(JSON.parse(e.data)));
+source.addEventListener("summary", e => showSummary(JSON.parse(e.data)));
+</script>
+</body></html>
+"""
 
 @app.route("/")
 def index():
-    df = pd.read_csv(DATA_FILE)
-    rows = df.tail(10).to_dict(orient="records")
-    html = """
-    <html><head><title>🍌 Fruiture Dashboard</title></head>
-    <body style='font-family:Arial; text-align:center; background:#f9f9f9;'>
-      <h2>📊 ESP32-CAM + Sensor + Banana Detector</h2>
-    """
-    for r in reversed(rows):
-        html += "<div style='margin:20px; border:1px solid #ccc; padding:10px; background:white;'>"
-        html += f"<p><b>{r['timestamp']}</b><br>"
-        html += f"🌡️ Temp: {r.get('temperature','')}°C | 💧 Hum: {r.get('humidity','')}% | 🧪 Gas: {r.get('gas','')} ppm<br>"
-        if r.get("ripeness") is not None:
-            html += f"🍌 Ripeness: {r['ripeness']}/100<br>"
-        if r.get("avg_R") is not None:
-            html += f"🎨 RGB: ({r['avg_R']}, {r['avg_G']}, {r['avg_B']})<br>"
-        html += f"🟩 {r.get('green_%','')}% 🟨 {r.get('yellow_%','')}% 🟫 {r.get('brown_%','')}% ⬛ {r.get('black_%','')}%<br>"
-        if r.get("processed_image_path"):
-            html += f"<img src='/images/{r['processed_image_path']}' width='320'><br>"
-        html += "</div>"
-    html += "</body></html>"
-    return html
+    device = request.args.get("device", DEFAULT_DEVICE)
+    return render_template_string(DASHBOARD_TEMPLATE, device=device, max_cards=DASHBOARD_RECORDS,
+                                  devices=[s.device_id for s in devices.sessions()],
+                                  rows=feed.recent(device, DASHBOARD_RECORDS), latest=feed.latest(device))
 
 # -------------------------------
 # Main Entry
@@ -403,5 +592,13 @@ if __name__ == "__main__":
     summary_thread = threading.Thread(target=periodic_summary_task, daemon=True)
     summary_thread.start()
 
+    join_thread = threading.Thread(target=run_join_ticker, daemon=True)
+    join_thread.start()
+
     print("🚀 Dashboard running: http://localhost:5001")
-    app.run(host="0.0.0.0", port=5001, debug=False)
+    try:
+        app.run(host="0.0.0.0", port=5001, debug=False)
+    finally:
+        image_pipeline.stop()
+        devices.close()
+        storage.close()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+🗄️ Fruiture Detection Cache
+---------------------------------------------------------------
+Content-addressed cache for banana detection results:
+ - Key: sha256(JPEG bytes) + detector fingerprint (thresholds/mode)
+ - Value: mean RGB, ripeness, colour proportions and the banana contour
+   (so the overlay can be redrawn without re-running detection)
+ - On-disk SQLite (WAL), safe to share between threads and processes
+ - LRU eviction once the cache grows past max_entries; hits only note
+   their access time in memory, written back in one batch with the next
+   put / eviction (or every TOUCH_FLUSH_ENTRIES hits / TOUCH_FLUSH_SECONDS)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Next to the collector's data, so benchmarks / replays (FRUITURE_DATA_DIR) get a throw-away cache
+DATA_DIR = os.environ.get("FRUITURE_DATA_DIR", BASE_DIR)
+DEFAULT_CACHE_FILE = os.path.join(DATA_DIR, "detection_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 50000
+TOUCH_FLUSH_ENTRIES = 256
+TOUCH_FLUSH_SECONDS = 60.0
+
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# ---------------------------------------------------
+# (contour, mean_rgb, ripeness, proportions) ↔ JSON-able dict
+# ---------------------------------------------------
+def result_to_cache(banana_cnt, mean_rgb, ripeness, proportions):
+    return {
+        "contour": banana_cnt.reshape(-1, 2).tolist() if banana_cnt is not None else None,
+        "mean_rgb": list(mean_rgb) if mean_rgb else None,
+        "ripeness": ripeness,
+        "proportions": proportions,
+    }
+
+
+def result_from_cache(value):
+    contour = value.get("contour")
+    banana_cnt = np.array(contour, dtype=np.int32).reshape(-1, 1, 2) if contour else None
+    mean_rgb = tuple(value["mean_rgb"]) if value.get("mean_rgb") else None
+    return banana_cnt, mean_rgb, value.get("ripeness"), value.get("proportions")
+
+
+class DetectionCache:
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES, evict_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._touched = {}  # (image_hash, detector) → last access not yet written
+        self._touched_since = None
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS detections (
+                image_hash  TEXT NOT NULL,
+                detector    TEXT NOT NULL,
+                result      TEXT NOT NULL,
+                created     REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (image_hash, detector)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_lru ON detections(last_access)")
+        self._conn.commit()
+
+    def get(self, img_hash, detector):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM detections WHERE image_hash = ? AND detector = ?",
+                (img_hash, detector)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            self._touched[(img_hash, detector)] = now
+            if self._touched_since is None:
+                self._touched_since = now
+            if len(self._touched) >= TOUCH_FLUSH_ENTRIES or now - self._touched_since >= TOUCH_FLUSH_SECONDS:
+                self._flush_touched()
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, img_hash, detector, result):
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?)",
+                (img_hash, detector, json.dumps(result), now, now))
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """Write the batched hit times (caller holds the lock and commits)."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE detections SET last_access = MAX(last_access, ?) WHERE image_hash = ? AND detector = ?",
+                [(t, h, d) for (h, d), t in self._touched.items()])
+            self._touched.clear()
+        self._touched_since = None
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM detections").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM detections WHERE rowid IN "
+                "(SELECT rowid FROM detections ORDER BY last_access LIMIT ?)", (excess,))
+            print(f"🧹 Detection cache: evicted {excess} least-recently-used entries")
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM detections").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache at DEFAULT_CACHE_FILE (opened lazily, once per process)."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = DetectionCache()
+    return _default_cache
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+🍌🍌 Fruiture Device Sessions
+---------------------------------------------------------------
+Per-device state so several fruit bowls can share one collector:
+ - Device id taken from the MQTT topic: fruiture/<device>/<sensor>
+   (legacy two-segment topics like fruiture/temp map to "default")
+ - Each device owns its latest readings, stream joiner, record store and summary
+ - Locks are sharded per device; the registry lock is only taken the
+   first time a device shows up
+"""
+
+import os
+import re
+import threading
+import time
+
+from record_store import RecordStore
+from rolling_summary import RollingAggregator
+from stream_join import StreamJoiner
+
+DEFAULT_DEVICE = "default"
+
+ENTRY_FIELDS = [
+    "timestamp", "temperature", "humidity", "gas",
+    "ripeness", "avg_R", "avg_G", "avg_B",
+    "green_%", "yellow_%", "brown_%", "black_%",
+    "image_path", "processed_image_path",
+]
+
+_DEVICE_ID_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def parse_topic(topic, root="fruiture"):
+    """'fruiture/bowl2/temp' → ('bowl2', 'temp'); 'fruiture/temp' → ('default', 'temp')."""
+    parts = [p for p in topic.split("/") if p]
+    if parts and parts[0] == root:
+        parts = parts[1:]
+    if len(parts) >= 2:
+        return sanitize_device_id(parts[0]), "/".join(parts[1:])
+    return DEFAULT_DEVICE, parts[0] if parts else ""
+
+
+def sanitize_device_id(device_id):
+    return _DEVICE_ID_RE.sub("_", device_id)[:64] or DEFAULT_DEVICE
+
+
+def device_path(path, device_id):
+    """Default device keeps the original file name; others get a _<device> suffix."""
+    if device_id == DEFAULT_DEVICE:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{device_id}{ext}"
+
+
+def device_topic(topic, device_id):
+    """'fruiture/servo_angle' → 'fruiture/<device>/servo_angle' for non-default devices."""
+    if device_id == DEFAULT_DEVICE:
+        return topic
+    root, _, leaf = topic.rpartition("/")
+    return f"{root}/{device_id}/{leaf}"
+
+
+class DeviceSession:
+    def __init__(self, device_id, data_file, summary_window, summary_mode,
+                 on_record=None, join_tolerance=10.0, join_mode="interpolate", clock=time.time, store=None,
+                 keep_unmatched=True):
+        self.device_id = device_id
+        self.lock = threading.Lock()
+        self.entry = {k: None for k in ENTRY_FIELDS}  # latest readings (sensor log / display)
+        self.store = store if store is not None else RecordStore(device_path(data_file, device_id))
+        self.aggregator = RollingAggregator(summary_window, summary_mode, clock=clock)
+        self.joiner = StreamJoiner(
+            lambda record, ts: on_record(self, record, ts) if on_record else None,
+            tolerance=join_tolerance,
+            mode=join_mode,
+            clock=clock,
+            keep_unmatched=keep_unmatched,
+        )
+        # Images for extra devices go in their own sub-folder of IMAGE_DIR
+        self.image_subdir = "" if device_id == DEFAULT_DEVICE else device_id
+
+
+class DeviceRegistry:
+    def __init__(self, data_file, summary_window=600, summary_mode="sliding", max_devices=64,
+                 on_record=None, join_tolerance=10.0, join_mode="interpolate", clock=time.time,
+                 store_factory=None, keep_unmatched=True):
+        self.data_file = data_file
+        self.summary_window = summary_window
+        self.summary_mode = summary_mode
+        self.max_devices = max_devices
+        self.on_record = on_record
+        self.join_tolerance = join_tolerance
+        self.join_mode = join_mode
+        self.clock = clock
+        self.store_factory = store_factory  # device_id → record store (default: RecordStore CSV)
+        self.keep_unmatched = keep_unmatched
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, device_id=DEFAULT_DEVICE):
+        session = self._sessions.get(device_id)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(device_id)
+            if session is None:
+                if len(self._sessions) >= self.max_devices:
+                    raise RuntimeError(f"Device limit reached ({self.max_devices}); ignoring '{device_id}'")
+                session = DeviceSession(device_id, self.data_file, self.summary_window, self.summary_mode,
+                                        self.on_record, self.join_tolerance, self.join_mode, self.clock,
+                                        self.store_factory(device_id) if self.store_factory else None,
+                                        self.keep_unmatched)
+                self._sessions = {**self._sessions, device_id: session}  # copy-on-write for lock-free reads
+                print(f"🆕 New device session: {device_id} → {session.store.path}")
+            return session
+
+    def find(self, device_id):
+        return self._sessions.get(device_id)
+
+    def sessions(self):
+        return list(self._sessions.values())
+
+    def set_clock(self, clock):
+        """Switch every session (and sessions created later) to another clock, e.g. a replay's virtual one."""
+        self.clock = clock
+        for session in self.sessions():
+            session.aggregator.clock = clock
+            session.joiner.clock = clock
+
+    def close(self):
+        for session in self.sessions():
+            session.store.close()
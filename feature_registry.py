@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+🗂️ Fruiture Feature Registry
+---------------------------------------------------------------
+One place that says what each model's input columns are:
+ - Feature = model column name + the source field(s) it is read from +
+   an optional transform (e.g. mean RGB → hue ripeness)
+ - FeatureSchema builds pre-ordered float64 vectors / matrices straight
+   from summary dicts, records or DataFrame columns (no DataFrame needed)
+ - validate() checks a loaded model / scaler / manifest against the
+   schema, so a renamed or re-ordered artifact fails at load time instead
+   of being silently skipped at prediction time
+ - Schemas: "regression" (banana_regression_model.pkl, ml_input summary
+   keys) and "spoilage" (banana_spoilage_model.pkl, per-record fields)
+ - Old column names (Max_gas_diff, Humidity, …) are known aliases, so the
+   error says which feature they were meant to be
+"""
+
+import colorsys
+
+import numpy as np
+
+from rolling_summary import SUMMARY_FIELDS
+
+# Names used by earlier scripts → the canonical model column
+ALIASES = {
+    "Max_gas_diff": "Max_gas",
+    "Average_gas_diff": "Average_Gas",
+    "Average_gas": "Average_Gas",
+    "Humidity": "humidity",
+    "Temperature": "temperature",
+    "temp": "temperature",
+    "hum": "humidity",
+}
+
+RECORD_FIELDS = ("temperature", "humidity", "gas", "ripeness", "avg_R", "avg_G", "avg_B")
+
+
+def hue_ripeness(r, g, b):
+    """Mean RGB → 0 (green, hue 120°) … 1 (brown/black, hue ≤ 0°), as in the spoilage notebook."""
+    h, _, _ = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
+    return float(np.clip((120 - h * 360) / 120, 0, 1))
+
+
+class Feature:
+    def __init__(self, name, sources, transform=None):
+        self.name = name
+        self.sources = (sources,) if isinstance(sources, str) else tuple(sources)
+        self.transform = transform
+        if transform is None and len(self.sources) != 1:
+            raise ValueError(f"Feature '{name}' reads {len(self.sources)} fields and needs a transform")
+
+    def value(self, row):
+        """Feature value from a dict-like row, or NaN if any source field is missing."""
+        values = []
+        for source in self.sources:
+            v = row.get(source)
+            if v is None or v != v:
+                return np.nan
+            values.append(float(v))
+        return self.transform(*values) if self.transform else values[0]
+
+
+class FeatureSchema:
+    def __init__(self, name, features, source_kind, target=None):
+        self.name = name
+        self.features = list(features)
+        self.source_kind = source_kind  # "summary" (ml_input dicts) or "record" (one saved frame)
+        self.target = target
+        self.names = [f.name for f in self.features]
+        self.sources = sorted({s for f in self.features for s in f.sources})
+        known = SUMMARY_FIELDS.keys() if source_kind == "summary" else RECORD_FIELDS
+        unknown = [s for s in self.sources if s not in known]
+        if unknown:
+            raise ValueError(f"Schema '{name}' reads unknown {source_kind} fields {unknown}")
+
+    def __len__(self):
+        return len(self.features)
+
+    # ---------------------------------------------------
+    # Vectors
+    # ---------------------------------------------------
+    def vector(self, row):
+        """One row (summary / record dict) → float64 array in model column order; NaN where missing."""
+        return np.array([f.value(row) for f in self.features], dtype=np.float64)
+
+    def matrix(self, rows):
+        """List of rows → (N×k float64 matrix, mask of rows with every feature present)."""
+        X = np.empty((len(rows), len(self.features)), dtype=np.float64)
+        for i, row in enumerate(rows):
+            for j, feature in enumerate(self.features):
+                X[i, j] = feature.value(row)
+        return X, ~np.isnan(X).any(axis=1)
+
+    def frame_matrix(self, df):
+        """
+        DataFrame → N×k float64 matrix. Uses the model column names when the
+        frame already has them (e.g. dataset3 app.xlsx), otherwise the source
+        fields (e.g. build_dataset.py's session table).
+        """
+        if all(name in df.columns for name in self.names):
+            return df[self.names].to_numpy(dtype=np.float64)
+        if all(f.transform is None for f in self.features):
+            return df[[f.sources[0] for f in self.features]].to_numpy(dtype=np.float64)
+        return self.matrix(df.to_dict("records"))[0]
+
+    # ---------------------------------------------------
+    # Validation
+    # ---------------------------------------------------
+    def check_names(self, names, what="artifact"):
+        names = [str(n) for n in names]
+        if names == self.names:
+            return
+        canonical = [ALIASES.get(n, n) for n in names]
+        if canonical == self.names:
+            raise ValueError(f"{what} uses legacy feature names {names}; schema '{self.name}' expects {self.names}")
+        if sorted(canonical) == sorted(self.names):
+            raise ValueError(f"{what} has the right features in the wrong order: {names} vs {self.names}")
+        raise ValueError(f"{what} was fitted on {names}, schema '{self.name}' expects {self.names}")
+
+    def validate(self, model=None, scaler=None, manifest=None):
+        """Raise ValueError unless every given artifact matches this schema (names, order, width)."""
+        for what, artifact in (("scaler", scaler), ("model", model)):
+            if artifact is None:
+                continue
+            names = getattr(artifact, "feature_names_in_", None)
+            if names is not None:
+                self.check_names(names, what)
+            n = getattr(artifact, "n_features_in_", None)
+            if n is not None and int(n) != len(self.features):
+                raise ValueError(f"{what} expects {n} features, schema '{self.name}' has {len(self.features)}")
+        if manifest is not None:
+            schema = manifest.get("schema", manifest)
+            if schema.get("name", self.name) != self.name:
+                raise ValueError(f"manifest is for schema '{schema.get('name')}', not '{self.name}'")
+            self.check_names([f["name"] for f in schema.get("features", [])], "manifest")
+            for entry in schema.get("features", []):
+                feature = self.features[self.names.index(entry["name"])]
+                if "sources" in entry and list(entry["sources"]) != list(feature.sources):
+                    raise ValueError(f"manifest reads '{entry['name']}' from {entry['sources']}, "
+                                     f"schema '{self.name}' reads it from {list(feature.sources)}")
+
+    def manifest(self):
+        return {
+            "name": self.name,
+            "source_kind": self.source_kind,
+            "target": self.target,
+            "features": [
+                {"name": f.name, "sources": list(f.sources),
+                 "transform": f.transform.__name__ if f.transform else None, "dtype": "float64"}
+                for f in self.features
+            ],
+        }
+
+
+# ---------------------------------------------------
+# Schemas
+# ---------------------------------------------------
+REGRESSION = FeatureSchema("regression", [
+    Feature("Max_gas", "max_gas"),
+    Feature("Average_Gas", "average_gas"),
+    Feature("temperature", "average_temperature"),
+    Feature("humidity", "average_humidity"),
+    Feature("R", "average_R"),
+    Feature("G", "average_G"),
+    Feature("B", "average_B"),
+], source_kind="summary", target="day")
+
+SPOILAGE = FeatureSchema("spoilage", [
+    Feature("temperature", "temperature"),
+    Feature("humidity", "humidity"),
+    Feature("ripeness", ("avg_R", "avg_G", "avg_B"), hue_ripeness),
+], source_kind="record", target="days_left")
+
+SCHEMAS = {schema.name: schema for schema in (REGRESSION, SPOILAGE)}
+
+
+def get_schema(name):
+    try:
+        return SCHEMAS[name]
+    except KeyError:
+        raise ValueError(f"Unknown feature schema '{name}', expected one of {sorted(SCHEMAS)}") from None
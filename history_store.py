@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+🕰️ Fruiture History Store
+---------------------------------------------------------------
+Time-range queries over the collector's append-only CSVs (sensor_log,
+esp32_data records, ml_input_history) without re-reading whole files:
+ - Each file is indexed incrementally: only bytes appended since the last
+   query are parsed (complete lines only, so a half-written row waits)
+ - Sparse index (timestamp → byte offset every INDEX_STRIDE rows) so a raw
+   range query seeks straight to its start
+ - Per-column count / sum / min / max rollups at ROLLUP_LEVELS (1 min,
+   1 h); a month of 2-second samples at 1 h resolution is ~720 buckets
+ - query() returns raw rows or min / max / mean buckets at any resolution,
+   limit-sized pages plus an opaque cursor for the next page
+ - Timestamps are the collector's local "%Y-%m-%d %H:%M:%S" strings; they
+   are handled as naive seconds so buckets line up with local hours/days
+ - Rows are assumed to be appended in (roughly) time order, as the
+   collector writes them
+"""
+
+import bisect
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+INDEX_STRIDE = 512
+ROLLUP_LEVELS = (60, 3600)
+MAX_LIMIT = 10000
+MAX_ROWS_SCANNED = 1_000_000   # raw rows aggregated for resolutions without a rollup
+READ_BLOCK = 1 << 20
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+RESOLUTION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# ---------------------------------------------------
+# Parameter parsing (shared with the Flask routes)
+# ---------------------------------------------------
+def parse_time(value, default=None):
+    """'2025-11-05 16:06:39' / '2025-11-05' / unix seconds → naive local seconds."""
+    if value is None or value == "":
+        return default
+    try:
+        return naive_seconds(time.localtime(float(value)))
+    except ValueError:
+        pass
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f"Cannot parse time '{value}'") from None
+    return int(ts.value // 10**9) if ts.tzinfo is None else naive_seconds(time.localtime(ts.timestamp()))
+
+
+def naive_seconds(struct):
+    return int(np.datetime64(time.strftime("%Y-%m-%dT%H:%M:%S", struct), "s").astype(np.int64))
+
+
+def parse_resolution(value):
+    """None / 'raw' → None; '300', '5m', '1h', '1d' → seconds."""
+    if value is None or value in ("", "raw"):
+        return None
+    unit = RESOLUTION_UNITS.get(value[-1:])
+    seconds = int(float(value[:-1] if unit else value) * (unit or 1))
+    if seconds <= 0:
+        raise ValueError(f"Resolution must be positive, got '{value}'")
+    return seconds
+
+
+def format_times(seconds):
+    stamps = np.asarray(seconds, dtype=np.int64).astype("datetime64[s]")
+    return np.char.replace(np.datetime_as_string(stamps), "T", " ").tolist()
+
+
+def now_seconds():
+    return naive_seconds(time.localtime())
+
+
+# ---------------------------------------------------
+# One CSV file
+# ---------------------------------------------------
+class CsvSeries:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.columns = None       # header, timestamp first
+        self.value_columns = []
+        self.rows = 0
+        self.first = self.last = None
+        self._offset = 0          # bytes indexed so far (always at a line start)
+        self._sparse_ts = []      # timestamp of every INDEX_STRIDE-th row …
+        self._sparse_off = []     # … and its byte offset
+        self._rollups = {level: {} for level in ROLLUP_LEVELS}  # level → bucket → 4×k [count, sum, min, max]
+        self._keys = {level: [] for level in ROLLUP_LEVELS}
+
+    # ---------------------------------------------------
+    # Incremental indexing
+    # ---------------------------------------------------
+    def refresh(self):
+        """Index whatever was appended since the last call."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return self
+            size = os.path.getsize(self.path)
+            if size < self._offset:  # file replaced / truncated: start over
+                self._reset()
+            with open(self.path, "rb") as f:
+                if self.columns is None:
+                    header = f.readline()
+                    if not header.endswith(b"\n"):
+                        return self
+                    self.columns = header.decode("utf-8").strip().split(",")
+                    self.value_columns = self.columns[1:]
+                    self._offset = len(header)
+                f.seek(self._offset)
+                while True:
+                    block = f.read(READ_BLOCK)
+                    end = block.rfind(b"\n") + 1
+                    if end == 0:
+                        break
+                    self._index_block(block[:end], self._offset)
+                    self._offset += end
+                    f.seek(self._offset)
+        return self
+
+    def _parse(self, block, base_offset):
+        """Complete CSV lines → (row offsets, timestamps, values matrix)."""
+        lengths = np.fromiter((len(line) + 1 for line in block.split(b"\n")[:-1]), dtype=np.int64)
+        offsets = base_offset + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        df = pd.read_csv(io.BytesIO(block), header=None, names=self.columns, skip_blank_lines=False)
+        ts = pd.to_datetime(df[self.columns[0]], format="ISO8601", errors="coerce")
+        ok = ts.notna().to_numpy()
+        seconds = ts.to_numpy(dtype="datetime64[s]").astype(np.int64)
+        values = df[self.value_columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        return offsets[ok], seconds[ok], values[ok]
+
+    def _index_block(self, block, base_offset):
+        offsets, seconds, values = self._parse(block, base_offset)
+        if len(seconds) == 0:
+            return
+        for i in range((-self.rows) % INDEX_STRIDE, len(seconds), INDEX_STRIDE):
+            self._sparse_ts.append(max(int(seconds[i]), self._sparse_ts[-1] if self._sparse_ts else 0))
+            self._sparse_off.append(int(offsets[i]))
+        self.rows += len(seconds)
+        self.first = int(seconds.min()) if self.first is None else min(self.first, int(seconds.min()))
+        self.last = int(seconds.max()) if self.last is None else max(self.last, int(seconds.max()))
+        for level in ROLLUP_LEVELS:
+            keys, stats = bucket_stats(seconds, values, level)
+            table, sorted_keys = self._rollups[level], self._keys[level]
+            for key, stat in zip(keys.tolist(), stats):
+                old = table.get(key)
+                if old is None:
+                    table[key] = stat
+                    if sorted_keys and key < sorted_keys[-1]:
+                        bisect.insort(sorted_keys, key)
+                    else:
+                        sorted_keys.append(key)
+                else:
+                    table[key] = merge_stats(old, stat)
+
+    # ---------------------------------------------------
+    # Queries
+    # ---------------------------------------------------
+    def _scan(self, start, end, limit, cursor=None):
+        """(seconds, values, next cursor) of up to `limit` rows with start <= t < end."""
+        with self._lock:
+            if cursor is not None:
+                offset = int(cursor)
+            elif self._sparse_off:
+                offset = self._sparse_off[max(0, bisect.bisect_left(self._sparse_ts, start) - 1)]
+            else:
+                offset = self._offset
+            stop = self._offset
+            seconds_out, values_out, next_cursor = [], [], None
+            taken = 0
+            with open(self.path, "rb") as f:
+                while offset < stop and taken < limit:
+                    f.seek(offset)
+                    block = f.read(min(READ_BLOCK, stop - offset))
+                    cut = block.rfind(b"\n") + 1
+                    if cut == 0:
+                        break
+                    offsets, seconds, values = self._parse(block[:cut], offset)
+                    idx = np.flatnonzero((seconds >= start) & (seconds < end))[:limit - taken]
+                    seconds_out.append(seconds[idx])
+                    values_out.append(values[idx])
+                    taken += len(idx)
+                    if taken >= limit:
+                        after = idx[-1] + 1
+                        resume = int(offsets[after]) if after < len(offsets) else offset + cut
+                        next_cursor = str(resume) if resume < stop else None
+                        break
+                    if len(seconds) and seconds[-1] >= end:
+                        break  # past the range (append order ≈ time order)
+                    offset += cut
+        if not seconds_out:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(self.value_columns or []))), None
+        return np.concatenate(seconds_out), np.vstack(values_out), next_cursor
+
+    def raw(self, start, end, columns, limit, cursor=None):
+        """Rows with start <= t < end, at most limit, resuming at `cursor` (a byte offset) if given."""
+        if self.columns is None:
+            return {"t": [], "columns": {c: [] for c in columns}}, None
+        seconds, values, next_cursor = self._scan(start, end, limit, cursor)
+        col_idx = [self.value_columns.index(c) for c in columns]
+        return {"t": format_times(seconds),
+                "columns": {c: nan_to_none(values[:, j]) for c, j in zip(columns, col_idx)}}, next_cursor
+
+    def buckets(self, start, end, resolution, columns, limit, cursor=None):
+        """min / max / mean per column in resolution-sized buckets over [start, end)."""
+        if cursor is not None:
+            start = int(cursor)
+        start -= start % resolution
+        level = max((lv for lv in ROLLUP_LEVELS if resolution % lv == 0), default=None)
+        with self._lock:
+            if self.columns is None:
+                return {"t": [], "count": [], "columns": {c: {"min": [], "max": [], "mean": []} for c in columns}}, None
+            col_idx = [self.value_columns.index(c) for c in columns]
+            if level is not None:
+                keys = self._keys[level]
+                lo, hi = bisect.bisect_left(keys, start), bisect.bisect_left(keys, end)
+                seconds = np.asarray(keys[lo:hi], dtype=np.int64)
+                stats = np.stack([self._rollups[level][k] for k in keys[lo:hi]]) if hi > lo else None
+            else:
+                seconds, stats = None, None
+        if level is None:  # not a multiple of a rollup level: aggregate the raw rows of this page
+            raw_s, raw_v, _ = self._scan(start, min(end, start + resolution * (limit + 1)), MAX_ROWS_SCANNED)
+            seconds, stats = bucket_stats(raw_s, raw_v, resolution) if len(raw_s) else (raw_s, None)
+        if stats is None or len(seconds) == 0:
+            return {"t": [], "count": [], "columns": {c: {"min": [], "max": [], "mean": []} for c in columns}}, None
+
+        keys, merged = regroup(seconds, stats, resolution)
+        next_cursor = None
+        if len(keys) > limit:
+            next_cursor = str(int(keys[limit]))
+            keys, merged = keys[:limit], merged[:limit]
+        count = merged[:, 0, col_idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = merged[:, 1, col_idx] / count
+        return {
+            "t": format_times(keys),
+            "count": merged[:, 0, col_idx].max(axis=1).astype(int).tolist(),
+            "columns": {c: {"min": nan_to_none(merged[:, 2, j]), "max": nan_to_none(merged[:, 3, j]),
+                            "mean": nan_to_none(mean[:, n])}
+                        for n, (c, j) in enumerate(zip(columns, col_idx))},
+        }, next_cursor
+
+    def describe(self):
+        return {"rows": self.rows, "columns": self.value_columns,
+                "first": format_times([self.first])[0] if self.first is not None else None,
+                "last": format_times([self.last])[0] if self.last is not None else None}
+
+
+# ---------------------------------------------------
+# Bucket maths
+# ---------------------------------------------------
+def bucket_stats(seconds, values, size):
+    """Rows → (sorted bucket starts, B×4×k array of count / sum / min / max), NaN-aware."""
+    keys = seconds - seconds % size
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    unique, starts = np.unique(keys, return_index=True)
+    present = ~np.isnan(values)
+    stats = np.empty((len(unique), 4, values.shape[1]))
+    stats[:, 0] = np.add.reduceat(present, starts, axis=0)
+    stats[:, 1] = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+    stats[:, 2] = np.fmin.reduceat(values, starts, axis=0)
+    stats[:, 3] = np.fmax.reduceat(values, starts, axis=0)
+    return unique, stats
+
+
+def merge_stats(a, b):
+    return np.stack([a[0] + b[0], a[1] + b[1], np.fmin(a[2], b[2]), np.fmax(a[3], b[3])])
+
+
+def regroup(seconds, stats, size):
+    """Merge finer buckets (sorted) into `size`-second buckets."""
+    keys = seconds - seconds % size
+    unique, starts = np.unique(keys, return_index=True)
+    merged = np.empty((len(unique),) + stats.shape[1:])
+    merged[:, 0] = np.add.reduceat(stats[:, 0], starts, axis=0)
+    merged[:, 1] = np.add.reduceat(stats[:, 1], starts, axis=0)
+    merged[:, 2] = np.fmin.reduceat(stats[:, 2], starts, axis=0)
+    merged[:, 3] = np.fmax.reduceat(stats[:, 3], starts, axis=0)
+    return unique, merged
+
+
+def nan_to_none(column):
+    return [None if v != v else round(float(v), 4) for v in column]
+
+
+# ---------------------------------------------------
+# Store (all series for all devices)
+# ---------------------------------------------------
+class HistoryStore:
+    """
+    series name → path resolver, e.g. {"sensor": lambda device: ".../sensor_log_<device>.csv"}.
+    CsvSeries indexes are built on first use and kept warm between queries.
+    """
+
+    def __init__(self, series_paths):
+        self.series_paths = dict(series_paths)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series(self, name, device_id):
+        if name not in self.series_paths:
+            raise ValueError(f"Unknown series '{name}', expected one of {sorted(self.series_paths)}")
+        path = self.series_paths[name](device_id)
+        with self._lock:
+            series = self._series.get(path)
+            if series is None:
+                series = self._series[path] = CsvSeries(path)
+        return series.refresh()
+
+    def query(self, name, device_id, start=None, end=None, resolution=None, columns=None,
+              limit=1000, cursor=None):
+        series = self.series(name, device_id)
+        end = now_seconds() + 1 if end is None else end
+        start = end - 86400 if start is None else start
+        if start >= end:
+            raise ValueError("start must be before end")
+        columns = list(columns or series.value_columns)
+        unknown = [c for c in columns if c not in series.value_columns]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown} for '{name}', expected some of {series.value_columns}")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        t0 = time.perf_counter()
+        if resolution is None:
+            data, next_cursor = series.raw(start, end, columns, limit, cursor)
+        else:
+            data, next_cursor = series.buckets(start, end, resolution, columns, limit, cursor)
+        return {
+            "series": name,
+            "device": device_id,
+            "start": format_times([start])[0],
+            "end": format_times([end])[0],
+            "resolution": resolution or "raw",
+            **data,
+            "next_cursor": next_cursor,
+            "query_ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+
+    def describe(self, device_id):
+        return {name: self.series(name, device_id).describe() for name in self.series_paths}
+
+
+def to_arrow(result):
+    """query() result → Arrow IPC stream bytes (needs pyarrow)."""
+    import pyarrow as pa
+
+    arrays = {"t": pa.array(pd.to_datetime(result["t"]), type=pa.timestamp("s"))}
+    if "count" in result:
+        arrays["count"] = pa.array(result["count"], type=pa.int64())
+        for column, stats in result["columns"].items():
+            for stat, values in stats.items():
+                arrays[f"{column}_{stat}"] = pa.array(values, type=pa.float64())
+    else:
+        for column, values in result["columns"].items():
+            arrays[column] = pa.array(values, type=pa.float64())
+    table = pa.table(arrays).replace_schema_metadata({
+        k: str(result[k]) for k in ("series", "device", "start", "end", "resolution", "next_cursor")})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
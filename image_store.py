@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+🖼️ Fruiture Image Store
+---------------------------------------------------------------
+Storage policy for camera frames (raw_<ts>.jpg + processed_<ts>.*):
+ - Near-duplicate frames are skipped before detection: from one 1/8-scale
+   JPEG decode, a 64-bit difference hash (dHash, structure) and a hue
+   histogram of the saturated pixels (colour, which dHash cannot see) are
+   compared with the device's last stored frame; within DEDUP_DISTANCE
+   bits and DEDUP_HUE_DISTANCE the new frame reuses that frame's files and
+   detection fields, so a banana changing colour is never a duplicate.
+   One frame is still stored every DEDUP_KEEP_SECONDS.
+ - Overlay output: "lazy" (geometry only, drawn on request by
+   overlay_renderer.py), "jpeg" / "webp" (quality-tuned), "thumb" (small
+   JPEG), "png" (the old full-size PNG) or "none" (no processed view; the
+   dashboard shows the raw frame)
+ - Tiers: hot files in images/ for HOT_DAYS, then each day is moved into
+   images/archive/<subdir>/<YYYY-MM-DD>.zip (raw frames downscaled and
+   re-encoded, overlays dropped); read() serves a path from either tier.
+   Archive days older than DELETE_AFTER_DAYS are removed (None = keep)
+"""
+
+import glob
+import os
+import re
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+OVERLAY_FORMATS = ("lazy", "jpeg", "webp", "thumb", "png", "none")
+OVERLAY_QUALITY = 80
+THUMB_MAX_SIDE = 320
+
+DEDUP_DISTANCE = 4            # bits out of 64
+DEDUP_HUE_DISTANCE = 0.05     # L1 distance of normalised hue histograms (0..2)
+HUE_BINS = 18                 # 10° of OpenCV's 0..180 hue each
+MIN_SATURATION = 40           # hue of grey / dark pixels is noise
+DEDUP_KEEP_SECONDS = 600      # store at least one frame per device this often
+
+HOT_DAYS = 7
+ARCHIVE_MAX_SIDE = 640
+ARCHIVE_QUALITY = 70
+DELETE_AFTER_DAYS = None
+ARCHIVE_SUBDIR = "archive"
+
+FRAME_RE = re.compile(r"^(raw|processed)_(\d{4}-\d{2}-\d{2})_\d{2}-\d{2}-\d{2}\.\w+$")
+
+
+# ---------------------------------------------------
+# Hashing / encoding
+# ---------------------------------------------------
+def gradient_hash(grey):
+    small = cv2.resize(grey, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def dhash(data):
+    """64-bit difference hash of encoded image bytes (None if they cannot be decoded)."""
+    grey = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return gradient_hash(grey) if grey is not None else None
+
+
+def hue_histogram(small):
+    """Normalised hue histogram of a BGR frame's saturated, non-dark pixels (all zeros if there are none)."""
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    mask = ((hsv[..., 1] >= MIN_SATURATION) & (hsv[..., 2] >= MIN_SATURATION)).astype(np.uint8)
+    hist = cv2.calcHist([hsv], [0], mask, [HUE_BINS], [0, 180]).reshape(-1)
+    total = hist.sum()
+    return hist / total if total else hist
+
+
+def frame_signature(data):
+    """(dHash, hue histogram) of encoded image bytes from one 1/8-scale decode (None if they cannot be decoded)."""
+    small = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_COLOR_8)
+    if small is None:
+        return None
+    return gradient_hash(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)), hue_histogram(small)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def hue_distance(a, b):
+    return float(np.abs(a - b).sum())
+
+
+def check_overlay(fmt):
+    if fmt not in OVERLAY_FORMATS:
+        raise ValueError(f"Unknown overlay format '{fmt}', expected one of {OVERLAY_FORMATS}")
+    return fmt
+
+
+def downscale(img, max_side):
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode_overlay(vis, fmt="jpeg", quality=OVERLAY_QUALITY, thumb_side=THUMB_MAX_SIDE):
+    """Overlay frame → (file extension, encoded bytes); None for "lazy" / "none"."""
+    if fmt in ("lazy", "none"):
+        return None
+    if fmt == "png":
+        ext, params = ".png", []
+    elif fmt == "webp":
+        ext, params = ".webp", [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        ext, params = ".jpg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+        if fmt == "thumb":
+            vis = downscale(vis, thumb_side)
+    ok, buf = cv2.imencode(ext, vis, params)
+    if not ok:
+        raise ValueError(f"Could not encode overlay as {fmt}")
+    return ext, buf.tobytes()
+
+
+# ---------------------------------------------------
+# Store
+# ---------------------------------------------------
+class ImageStore:
+    def __init__(self, image_dir, dedup_distance=DEDUP_DISTANCE, keep_seconds=DEDUP_KEEP_SECONDS,
+                 hot_days=HOT_DAYS, delete_after_days=DELETE_AFTER_DAYS, hue_distance=DEDUP_HUE_DISTANCE):
+        self.image_dir = image_dir
+        self.dedup_distance = dedup_distance   # None disables dedup
+        self.hue_distance = hue_distance
+        self.keep_seconds = keep_seconds
+        self.hot_days = hot_days
+        self.delete_after_days = delete_after_days
+        self._last = {}   # device → (signature, ts, fields) of the last stored frame
+        self._lock = threading.Lock()
+        self._archive_lock = threading.Lock()
+        self.stats = {"stored": 0, "duplicates": 0, "archived_files": 0, "archived_bytes_saved": 0,
+                      "deleted_days": 0}
+
+    # ---------------------------------------------------
+    # Dedup (ingest)
+    # ---------------------------------------------------
+    def duplicate_of(self, device_id, data, ts):
+        """
+        (signature, fields): fields of the device's last stored frame when
+        `data` is a near-duplicate of it in structure and colour (skip this
+        frame), else None.
+        """
+        if self.dedup_distance is None:
+            return None, None
+        sig = frame_signature(data)
+        with self._lock:
+            last = self._last.get(device_id)
+            if (sig is not None and last is not None and ts - last[1] < self.keep_seconds
+                    and hamming(sig[0], last[0][0]) <= self.dedup_distance
+                    and hue_distance(sig[1], last[0][1]) <= self.hue_distance):
+                self.stats["duplicates"] += 1
+                return sig, dict(last[2])
+        return sig, None
+
+    def remember(self, device_id, sig, ts, fields):
+        """Record a stored frame as the device's dedup reference."""
+        with self._lock:
+            self.stats["stored"] += 1
+            if sig is not None:
+                self._last[device_id] = (sig, ts, {k: v for k, v in fields.items() if not k.startswith("_")})
+
+    # ---------------------------------------------------
+    # Tiers
+    # ---------------------------------------------------
+    def archive_path(self, subdir, day):
+        return os.path.join(self.image_dir, ARCHIVE_SUBDIR, subdir, f"{day}.zip")
+
+    def archive_older(self, now=None):
+        """Move every day older than hot_days into its archive zip; returns files moved."""
+        if self.hot_days is None:
+            return 0
+        now = time.time() if now is None else now
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(now - self.hot_days * 86400))
+        moved = 0
+        with self._archive_lock:
+            for folder in self._folders():
+                days = {}
+                for name in os.listdir(folder):
+                    m = FRAME_RE.match(name)
+                    if m and m.group(2) < cutoff:
+                        days.setdefault(m.group(2), []).append(name)
+                subdir = os.path.relpath(folder, self.image_dir)
+                subdir = "" if subdir == "." else subdir
+                for day, names in sorted(days.items()):
+                    moved += self._archive_day(folder, subdir, day, sorted(names))
+            self._delete_old(now)
+        if moved:
+            print(f"🧊 Moved {moved} images older than {cutoff} to the archive tier")
+        return moved
+
+    def _folders(self):
+        folders = [self.image_dir]
+        for path in sorted(glob.glob(os.path.join(self.image_dir, "*"))):
+            if os.path.isdir(path) and os.path.basename(path) != ARCHIVE_SUBDIR:
+                folders.append(path)
+        return folders
+
+    def _archive_day(self, folder, subdir, day, names):
+        path = self.archive_path(subdir, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with zipfile.ZipFile(path, "a", compression=zipfile.ZIP_STORED) as zf:
+            present = set(zf.namelist())
+            for name in names:
+                src = os.path.join(folder, name)
+                size = os.path.getsize(src)
+                if name.startswith("raw_") and name not in present:
+                    with open(src, "rb") as f:
+                        data = self._recompress(f.read())
+                    zf.writestr(name, data)  # already JPEG: deflate would not gain anything
+                    self.stats["archived_bytes_saved"] += size - len(data)
+                else:
+                    self.stats["archived_bytes_saved"] += size  # overlays are not kept
+        for name in names:
+            os.remove(os.path.join(folder, name))
+        self.stats["archived_files"] += len(names)
+        return len(names)
+
+    @staticmethod
+    def _recompress(data):
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return data
+        ok, buf = cv2.imencode(".jpg", downscale(img, ARCHIVE_MAX_SIDE), [cv2.IMWRITE_JPEG_QUALITY, ARCHIVE_QUALITY])
+        return buf.tobytes() if ok and len(buf) < len(data) else data
+
+    def _delete_old(self, now):
+        if self.delete_after_days is None:
+            return
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(now - self.delete_after_days * 86400))
+        for path in glob.glob(os.path.join(self.image_dir, ARCHIVE_SUBDIR, "**", "*.zip"), recursive=True):
+            if os.path.basename(path)[:10] < cutoff:
+                os.remove(path)
+                self.stats["deleted_days"] += 1
+
+    def read(self, rel_path):
+        """Bytes of an image path as stored in a record, from the hot folder or the archive; None if gone."""
+        path = os.path.normpath(os.path.join(self.image_dir, rel_path))
+        if not path.startswith(os.path.normpath(self.image_dir) + os.sep):
+            return None
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return f.read()
+        subdir, name = os.path.split(os.path.normpath(rel_path))
+        m = FRAME_RE.match(name)
+        zpath = self.archive_path(subdir, m.group(2)) if m else None
+        if zpath is None or not os.path.exists(zpath):
+            return None
+        with self._archive_lock, zipfile.ZipFile(zpath) as zf:
+            try:
+                return zf.read(name)
+            except KeyError:
+                return None
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "hot_days": self.hot_days, "dedup_distance": self.dedup_distance}
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+🧵 Fruiture Ingestion Pipeline
+---------------------------------------------------------------
+Keeps heavy camera work off the paho network thread:
+ - on_message only enqueues the Base64 payload into a bounded queue; the
+   worker decodes it once and passes JPEG bytes on (dedup, detection and a
+   process pool all share them, and less data is pickled)
+ - A pool of worker threads decodes, runs banana detection and saves images
+ - Optional process pool for the CPU-bound part ("process" executor)
+ - Backpressure policies when the queue is full: block / drop_oldest / drop_newest
+ - Queue-depth, throughput and per-stage latency metrics for the dashboard
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from banana_detector_no_grey import ANALYZERS, FastBananaDetector, analyze_banana_cached, draw_overlay
+from image_store import OVERLAY_QUALITY, THUMB_MAX_SIDE, encode_overlay
+from overlay_renderer import geometry_fields
+
+POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+# ---------------------------------------------------
+# Frame work (top-level so a process pool can pickle it)
+# ---------------------------------------------------
+_fast_detectors = {}  # device_id → FastBananaDetector of this process (process-pool workers)
+
+
+def device_detector(device_id):
+    """This process's ROI-tracking fast detector for one camera."""
+    detector = _fast_detectors.get(device_id)
+    if detector is None:
+        detector = _fast_detectors.setdefault(device_id, FastBananaDetector())
+    return detector
+
+
+def decode_detect_persist(img_data, image_dir, timestamp, subdir="", mode="full",
+                          detector=None, use_cache=True, overlay="png", quality=OVERLAY_QUALITY,
+                          thumb_side=THUMB_MAX_SIDE, device_id=None):
+    """
+    JPEG bytes → detection → raw JPEG + processed overlay on disk.
+    Returns the record fields to merge into the current entry, or None
+    when the image cannot be decoded. Paths are relative to image_dir
+    (prefixed with subdir for non-default devices). mode picks the
+    detector ("full" / "fast"); in fast mode, detector is the camera's
+    FastBananaDetector; without one, frames with a device_id use that
+    device's tracker in this process, so cameras never share ROI state in
+    process workers. With use_cache, repeated frames are
+    answered from the detection cache. The banana's bbox / contour go into
+    the fields. overlay is an image_store format ("png" / "jpeg" / "webp" /
+    "thumb"; "lazy" records the processed path but leaves drawing it to
+    overlay_renderer.py; "none" has no processed view). Per-stage seconds
+    are returned under "_stages" (decode / detect / persist).
+    """
+    t0 = time.perf_counter()
+    nparr = np.frombuffer(img_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    t1 = time.perf_counter()
+
+    if detector is None and mode == "fast" and device_id is not None:
+        detector = device_detector(device_id)
+    if use_cache:
+        banana_cnt, mean_rgb, ripeness, proportions = analyze_banana_cached(img_data, img=img, mode=mode,
+                                                                            detector=detector)
+    elif mode == "fast" and detector is not None:
+        banana_cnt, mean_rgb, ripeness, proportions = detector.analyze(img)
+    else:
+        banana_cnt, mean_rgb, ripeness, proportions = ANALYZERS[mode](img)
+    t2 = time.perf_counter()
+
+    target_dir = os.path.join(image_dir, subdir)
+    os.makedirs(target_dir, exist_ok=True)
+
+    fields = geometry_fields(banana_cnt, img.shape)
+    processed_filename = None
+    if overlay == "lazy":
+        processed_filename = f"processed_{timestamp}.jpg"  # rendered when first requested
+    elif overlay != "none":
+        vis = img.copy()
+        if ripeness is not None:
+            draw_overlay(vis, banana_cnt, ripeness, mean_rgb)
+        ext, data = encode_overlay(vis, overlay, quality, thumb_side)
+        processed_filename = f"processed_{timestamp}{ext}"
+        with open(os.path.join(target_dir, processed_filename), "wb") as f:
+            f.write(data)
+    if processed_filename:
+        fields["processed_image_path"] = f"{subdir}/{processed_filename}" if subdir else processed_filename
+
+    raw_filename = f"raw_{timestamp}.jpg"
+    with open(os.path.join(target_dir, raw_filename), "wb") as f:
+        f.write(img_data)
+    fields["image_path"] = f"{subdir}/{raw_filename}" if subdir else raw_filename
+    fields["_stages"] = {"decode": t1 - t0, "detect": t2 - t1, "persist": time.perf_counter() - t2}
+
+    if mean_rgb:
+        fields["avg_R"], fields["avg_G"], fields["avg_B"] = mean_rgb
+    if ripeness is not None:
+        fields["ripeness"] = ripeness
+    if proportions:
+        for color, value in proportions.items():
+            fields[f"{color}_%"] = value
+    return fields
+
+
+# ---------------------------------------------------
+# Bounded worker pipeline
+# ---------------------------------------------------
+class IngestPipeline:
+    """
+    Bounded FIFO in front of a pool of worker threads.
+
+    handler(item) runs on a worker thread. With executor="process" the
+    handler receives the pool as a second argument and is expected to
+    offload its CPU-heavy part with pool.submit(...).result().
+    """
+
+    def __init__(self, handler, workers=2, max_queue=8, policy="drop_oldest",
+                 executor="thread", block_timeout=5.0, name="ingest"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {POLICIES}")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}', expected 'thread' or 'process'")
+
+        self.handler = handler
+        self.max_queue = max(1, int(max_queue))
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._pool = ProcessPoolExecutor(max_workers=workers) if executor == "process" else None
+
+        self._stats = {
+            "submitted": 0, "processed": 0, "failed": 0,
+            "dropped_oldest": 0, "dropped_newest": 0,
+            "max_depth": 0, "busy_workers": 0,
+            "total_process_s": 0.0, "last_process_ms": None,
+        }
+
+        self._stages = {}  # stage → recent durations (seconds)
+
+        self._threads = []
+        for i in range(max(1, int(workers))):
+            t = threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    # ---------------------------------------------------
+    # Producer side (called from the MQTT callback)
+    # ---------------------------------------------------
+    def submit(self, item):
+        """Enqueue without doing any work. Returns False if the item was dropped."""
+        with self._cond:
+            if not self._running:
+                return False
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_newest":
+                    self._stats["dropped_newest"] += 1
+                    print(f"⚠️ {self.name} queue full ({self.max_queue}), dropping newest item")
+                    return False
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self._stats["dropped_oldest"] += 1
+                    print(f"⚠️ {self.name} queue full ({self.max_queue}), dropping oldest item")
+                else:  # block → backpressure onto the broker connection
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_queue and self._running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["dropped_newest"] += 1
+                            print(f"⚠️ {self.name} queue still full after {self.block_timeout}s, dropping item")
+                            return False
+                        self._cond.wait(remaining)
+            self._queue.append((time.monotonic(), item))
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], len(self._queue))
+            self._cond.notify_all()
+            return True
+
+    # ---------------------------------------------------
+    # Consumer side
+    # ---------------------------------------------------
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                _, item = self._queue.popleft()
+                self._stats["busy_workers"] += 1
+                self._cond.notify_all()
+
+            start = time.perf_counter()
+            ok = True
+            try:
+                if self._pool is not None:
+                    self.handler(item, self._pool)
+                else:
+                    self.handler(item)
+            except Exception as e:
+                ok = False
+                print(f"❌ {self.name} worker error:", e)
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                self._stats["busy_workers"] -= 1
+                self._stats["processed" if ok else "failed"] += 1
+                self._stats["total_process_s"] += elapsed
+                self._stats["last_process_ms"] = round(elapsed * 1000, 2)
+                self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until the queue is drained and no worker is busy."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._stats["busy_workers"]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, drain=True):
+        if drain:
+            self.join()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def record_stage(self, stage, seconds):
+        with self._cond:
+            samples = self._stages.get(stage)
+            if samples is None:
+                samples = self._stages[stage] = deque(maxlen=1024)
+            samples.append(seconds)
+
+    def stage_metrics(self):
+        """p50 / p99 / mean milliseconds over the last 1024 samples of each stage."""
+        with self._cond:
+            stages = {k: sorted(v) for k, v in self._stages.items()}
+        out = {}
+        for stage, lat in stages.items():
+            if not lat:
+                continue
+            out[stage] = {
+                "count": len(lat),
+                "mean_ms": round(sum(lat) / len(lat) * 1000, 2),
+                "p50_ms": round(lat[len(lat) // 2] * 1000, 2),
+                "p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000, 2),
+            }
+        return out
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            depth = len(self._queue)
+            oldest_wait = time.monotonic() - self._queue[0][0] if self._queue else 0.0
+        done = stats["processed"] + stats["failed"]
+        stats["avg_process_ms"] = round(stats.pop("total_process_s") / done * 1000, 2) if done else None
+        stats.update({
+            "depth": depth,
+            "capacity": self.max_queue,
+            "policy": self.policy,
+            "oldest_wait_s": round(oldest_wait, 3),
+            "stages": self.stage_metrics(),
+        })
+        return stats
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+📺 Fruiture Live Feed
+---------------------------------------------------------------
+In-memory state behind the dashboard, so page loads never touch the CSVs:
+ - Per-device ring buffer of the last N saved records (seeded once from
+   the record store's tail when a device session is created)
+ - Latest summary / prediction per device
+ - Every update is also an event with a sequence id; stream() turns them
+   into Server-Sent Events for any number of browsers, with Last-Event-ID
+   catch-up from a bounded event history and keep-alive comments
+"""
+
+import json
+import threading
+from collections import deque
+
+LIVE_BUFFER_SIZE = 200        # records kept per device
+EVENT_HISTORY = 1000          # events kept for reconnecting viewers
+HEARTBEAT_SECONDS = 15
+
+
+def plain(value):
+    """numpy scalars → Python numbers and NaN → None, so records can go straight to JSON."""
+    value = value.item() if hasattr(value, "item") else value
+    return None if isinstance(value, float) and value != value else value
+
+
+class LiveFeed:
+    def __init__(self, size=LIVE_BUFFER_SIZE, history=EVENT_HISTORY):
+        self.size = size
+        self._records = {}     # device → deque of record dicts (oldest first)
+        self._latest = {}      # device → last summary event payload
+        self._events = deque(maxlen=history)  # (seq, kind, device, payload)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.viewers = 0
+
+    # ---------------------------------------------------
+    # Updates (ingestion / summary threads)
+    # ---------------------------------------------------
+    def seed(self, device_id, records):
+        """Start a device's buffer from stored records (no-op if it already has one)."""
+        with self._cond:
+            if device_id not in self._records:
+                self._records[device_id] = deque((self._clean(r) for r in records), maxlen=self.size)
+
+    def add_record(self, device_id, record):
+        record = self._clean(record)
+        with self._cond:
+            self._records.setdefault(device_id, deque(maxlen=self.size)).append(record)
+            self._publish("record", device_id, record)
+
+    def add_summary(self, device_id, summary, prediction=None):
+        payload = {"summary": self._clean(summary), "prediction": self._clean(prediction or {}) or None}
+        with self._cond:
+            self._latest[device_id] = payload
+            self._publish("summary", device_id, payload)
+
+    def _clean(self, record):
+        return {k: plain(v) for k, v in record.items() if not k.startswith("_")}
+
+    def _publish(self, kind, device_id, payload):
+        self._seq += 1
+        self._events.append((self._seq, kind, device_id, payload))
+        self._cond.notify_all()
+
+    # ---------------------------------------------------
+    # Reads (Flask routes)
+    # ---------------------------------------------------
+    def recent(self, device_id, n=10):
+        with self._cond:
+            records = self._records.get(device_id, ())
+            return list(records)[-n:] if n > 0 else []
+
+    def find(self, field, value):
+        """Newest buffered record (any device) whose `field` equals value, or None."""
+        with self._cond:
+            for records in self._records.values():
+                for record in reversed(records):
+                    if record.get(field) == value:
+                        return record
+        return None
+
+    def latest(self, device_id):
+        with self._cond:
+            return self._latest.get(device_id)
+
+    @property
+    def last_id(self):
+        return self._seq
+
+    def events_since(self, last_id, device_id=None, timeout=HEARTBEAT_SECONDS):
+        """Events after last_id (optionally for one device); waits up to timeout for the first one."""
+        with self._cond:
+            if self._seq <= last_id:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e[0] > last_id and (device_id is None or e[2] == device_id)], self._seq
+
+    def stream(self, device_id=None, last_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """SSE generator: `id / event / data` blocks, plus a comment line when idle."""
+        # An id ahead of ours (e.g. from before a server restart) would hide new events until we caught up
+        last_id = self.last_id if last_id is None else min(last_id, self.last_id)
+        with self._cond:
+            self.viewers += 1
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events, last_id = self.events_since(last_id, device_id, heartbeat)
+                if not events:
+                    yield ": keep-alive\n\n"
+                for seq, kind, device, payload in events:
+                    data = json.dumps({"device": device, **payload}, default=str)
+                    yield f"id: {seq}\nevent: {kind}\ndata: {data}\n\n"
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+    def metrics(self):
+        with self._cond:
+            return {"viewers": self.viewers, "last_event_id": self._seq,
+                    "buffered": {d: len(r) for d, r in self._records.items()}}
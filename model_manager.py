@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+🔁 Fruiture Model Manager
+---------------------------------------------------------------
+Hot reload of the regression model without restarting the collector:
+ - Watches artifacts/banana_regression_<version>/ folders written by
+   train_regression.py (half-written *.tmp folders are ignored)
+ - New versions are loaded on a background thread (compiled forest when
+   the artifact has one, sklearn otherwise) and checked against the
+   feature registry via manifest.json
+ - Every candidate must pass a held-out sample before it goes live: the
+   artifact's own holdout.npz (and its recorded test MAE), or dataset3
+   app.xlsx for older artifacts; predictions must be finite and the MAE
+   at most MAX_VALIDATION_MAE days
+ - The live predictor is swapped with a single reference assignment, so
+   callers never see a half-loaded model; the previous version is kept
+   for an instant rollback()
+ - status() reports the active / previous version, load latency,
+   validation scores and rejected versions
+ - With no usable artifact the installed banana_regression_model.pkl is
+   served as version "live"
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from batch_predictor import MODEL_FILE, SCALER_FILE, BatchPredictor
+from compiled_forest import COMPILED_FILE
+from feature_registry import REGRESSION
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_DIR = os.path.join(BASE_DIR, "artifacts")
+ARTIFACT_PREFIX = "banana_regression_"
+DATASET_FILE = os.path.join(BASE_DIR, "dataset3 app.xlsx")
+
+POLL_SECONDS = 30
+MAX_VALIDATION_MAE = 1.0       # days; one servo step
+RECORDED_MAE_TOLERANCE = 1e-3  # holdout MAE must reproduce metrics.json (4-decimal rounding)
+LIVE_VERSION = "live"
+
+
+# ---------------------------------------------------
+# Artifacts
+# ---------------------------------------------------
+def available_versions(artifact_dir=ARTIFACT_DIR):
+    """(version, folder) of every complete artifact, oldest first."""
+    found = []
+    for path in sorted(glob.glob(os.path.join(artifact_dir, ARTIFACT_PREFIX + "*"))):
+        name = os.path.basename(path)
+        if name.endswith(".tmp") or not os.path.isdir(path):
+            continue
+        if all(os.path.exists(os.path.join(path, f)) for f in ("model.pkl", "scaler.pkl", "manifest.json")):
+            found.append((name[len(ARTIFACT_PREFIX):], path))
+    return found
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dataset_sample(path=DATASET_FILE):
+    """(X, y) from the labelled dataset, for artifacts that carry no holdout.npz."""
+    try:
+        import pandas as pd
+        df = pd.read_excel(path)
+        return REGRESSION.frame_matrix(df), df[REGRESSION.target].to_numpy(dtype=np.float64)
+    except Exception as e:
+        print(f"⚠️ No validation sample from {os.path.basename(path)} ({e})")
+        return None
+
+
+class ModelVersion:
+    def __init__(self, version, path, predictor, load_ms, validation):
+        self.version = version
+        self.path = path
+        self.predictor = predictor
+        self.load_ms = load_ms
+        self.validation = validation
+        self.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def describe(self):
+        return {"version": self.version, "path": self.path, "load_ms": self.load_ms,
+                "validation": self.validation, "loaded_at": self.loaded_at}
+
+
+# ---------------------------------------------------
+# Manager
+# ---------------------------------------------------
+class ModelManager:
+    def __init__(self, artifact_dir=ARTIFACT_DIR, poll_interval=POLL_SECONDS,
+                 max_mae=MAX_VALIDATION_MAE, sample=None):
+        self.artifact_dir = artifact_dir
+        self.poll_interval = poll_interval
+        self.max_mae = max_mae
+        self._sample = sample  # (X, y) used when an artifact has no holdout.npz; loaded lazily
+        self._active = None
+        self._previous = None
+        self._rejected = {}    # version → reason; never retried
+        self._lock = threading.Lock()  # serialises loads / swaps, never taken by predictions
+        self._stop = threading.Event()
+        self._thread = None
+        self.swaps = 0
+
+    @property
+    def predictor(self):
+        """The live BatchPredictor (or None); read once per prediction cycle."""
+        active = self._active
+        return active.predictor if active else None
+
+    @property
+    def active(self):
+        return self._active
+
+    # ---------------------------------------------------
+    # Loading / validation
+    # ---------------------------------------------------
+    def shared_sample(self):
+        if self._sample is None:
+            self._sample = dataset_sample() or ()
+        return self._sample or None
+
+    def validate(self, predictor, path):
+        """Score a candidate on held-out rows; raises ValueError if it may not go live."""
+        holdout = os.path.join(path, "holdout.npz") if path else None
+        recorded = None
+        if holdout and os.path.exists(holdout):
+            with np.load(holdout, allow_pickle=False) as data:
+                X, y = data["X"], data["y"]
+            recorded = ((read_json(os.path.join(path, "metrics.json")) or {}).get("test") or {}).get("mae")
+            source = "holdout.npz"
+        else:
+            sample = self.shared_sample()
+            if sample is None:
+                return {"source": None, "rows": 0}
+            X, y = sample
+            source = os.path.basename(DATASET_FILE)
+
+        day = predictor.predict(X)["day"]
+        if not np.all(np.isfinite(day)):
+            raise ValueError(f"non-finite predictions on {source}")
+        mae = float(np.mean(np.abs(day - y)))
+        if mae > self.max_mae:
+            raise ValueError(f"MAE {mae:.3f} on {source} exceeds {self.max_mae}")
+        if recorded is not None and abs(mae - recorded) > RECORDED_MAE_TOLERANCE:
+            raise ValueError(f"MAE {mae:.4f} on {source} does not reproduce the recorded {recorded}")
+        return {"source": source, "rows": int(len(y)), "mae": round(mae, 4)}
+
+    def load_version(self, version, path):
+        """Load + validate one artifact folder → ModelVersion (raises on any problem)."""
+        start = time.perf_counter()
+        manifest = read_json(os.path.join(path, "manifest.json"))
+        predictor = BatchPredictor.load(os.path.join(path, "model.pkl"), os.path.join(path, "scaler.pkl"),
+                                        os.path.join(path, "model.npz"), manifest)
+        validation = self.validate(predictor, path)
+        load_ms = round((time.perf_counter() - start) * 1000, 1)
+        return ModelVersion(version, path, predictor, load_ms, validation)
+
+    def load_live(self):
+        """The installed model files, used when no artifact is available."""
+        start = time.perf_counter()
+        predictor = BatchPredictor.load(MODEL_FILE, SCALER_FILE, COMPILED_FILE)
+        validation = self.validate(predictor, None)
+        load_ms = round((time.perf_counter() - start) * 1000, 1)
+        return ModelVersion(LIVE_VERSION, os.path.dirname(MODEL_FILE), predictor, load_ms, validation)
+
+    # ---------------------------------------------------
+    # Swapping
+    # ---------------------------------------------------
+    def activate(self, candidate):
+        with self._lock:
+            self._previous, self._active = self._active, candidate
+            self.swaps += 1
+        print(f"🔁 Model {candidate.version} live (loaded in {candidate.load_ms} ms, "
+              f"validation {candidate.validation})")
+
+    def rollback(self):
+        """Put the previous version back; the rolled-back one is not picked up again."""
+        with self._lock:
+            if self._previous is None:
+                raise RuntimeError("No previous model version to roll back to")
+            bad = self._active
+            self._active, self._previous = self._previous, bad
+            self._rejected[bad.version] = "rolled back"
+            self.swaps += 1
+        print(f"↩️ Rolled back model {bad.version} → {self._active.version}")
+        return self._active
+
+    def check(self):
+        """One poll: go live with the newest valid artifact newer than the active one. True if swapped."""
+        active = self._active
+        newer = [(v, p) for v, p in available_versions(self.artifact_dir)
+                 if v not in self._rejected and (active is None or active.version == LIVE_VERSION
+                                                 or v > active.version)]
+        for version, path in reversed(newer):
+            try:
+                candidate = self.load_version(version, path)
+            except Exception as e:
+                self._rejected[version] = str(e)
+                print(f"❌ Model {version} rejected: {e}")
+                continue
+            self.activate(candidate)
+            return True
+
+        if self._active is None:
+            try:
+                self.activate(self.load_live())
+                return True
+            except Exception as e:
+                print("⚠️ ML model/scaler not loaded (will still publish summaries, retrying):", e)
+        return False
+
+    # ---------------------------------------------------
+    # Background watcher
+    # ---------------------------------------------------
+    def start(self):
+        """Load the best available model now, then keep watching artifact_dir in the background."""
+        if self._active is None:
+            self.check()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="model-manager", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                print("⚠️ Model watcher error:", e)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self):
+        active, previous = self._active, self._previous
+        return {
+            "active": active.describe() if active else None,
+            "previous": previous.describe() if previous else None,
+            "swaps": self.swaps,
+            "rejected": dict(self._rejected),
+            "artifact_dir": self.artifact_dir,
+            "poll_interval": self.poll_interval,
+        }
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+🎨 Fruiture Overlay Renderer
+---------------------------------------------------------------
+Draws the processed view (contour, bounding box, ripeness label) only
+when somebody asks for it:
+ - Detection stores the banana geometry with the record: bbox
+   "[x, y, w, h]" and contour {"size": [w, h], "points": [...]}
+   (simplified to within CONTOUR_EPSILON px, so a row stays small)
+ - /images/<subdir>/processed_<ts>.<jpg|webp|png> that is not on disk is
+   rendered from raw_<ts>.jpg (hot folder or archive tier) with the
+   record's geometry, scaled to the frame actually served
+ - Geometry comes from lookup(raw path) (the collector's live records),
+   else from the detection cache / one detection run on the raw frame
+ - Rendered bytes are kept in an LRU bounded by CACHE_BYTES
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from banana_detector_no_grey import analyze_banana_cached, draw_overlay
+from image_store import OVERLAY_QUALITY, encode_overlay
+
+CACHE_BYTES = 32 * 1024 * 1024
+CONTOUR_EPSILON = 1.0
+PROCESSED_RE = re.compile(r"^(?P<dir>(?:.*/)?)processed_(?P<ts>[\d_-]+)\.(?P<ext>jpg|webp|png)$")
+FORMATS = {"jpg": ("jpeg", "image/jpeg"), "webp": ("webp", "image/webp"), "png": ("png", "image/png")}
+
+
+# ---------------------------------------------------
+# Geometry ↔ record fields
+# ---------------------------------------------------
+def geometry_fields(banana_cnt, frame_shape):
+    """Contour from detection → {"bbox", "contour"} text columns (both None without a banana)."""
+    if banana_cnt is None:
+        return {"bbox": None, "contour": None}
+    simple = cv2.approxPolyDP(banana_cnt, CONTOUR_EPSILON, True)
+    h, w = frame_shape[:2]
+    return {
+        "bbox": json.dumps(list(cv2.boundingRect(banana_cnt))),
+        "contour": json.dumps({"size": [w, h], "points": simple.reshape(-1, 2).tolist()}, separators=(",", ":")),
+    }
+
+
+def contour_from_fields(record, frame_shape):
+    """Record geometry → contour array in the coordinates of a frame of frame_shape (None if absent)."""
+    try:
+        geometry = json.loads(record.get("contour") or "null")
+    except (TypeError, ValueError):
+        return None
+    if not geometry or not geometry.get("points"):
+        return None
+    points = np.asarray(geometry["points"], dtype=np.float64)
+    w, h = geometry.get("size") or (frame_shape[1], frame_shape[0])
+    points *= (frame_shape[1] / w, frame_shape[0] / h)
+    return np.round(points).astype(np.int32).reshape(-1, 1, 2)
+
+
+def label_values(record):
+    rgb = [record.get(k) for k in ("avg_R", "avg_G", "avg_B")]
+    mean_rgb = tuple(int(v) for v in rgb) if all(v is not None and v == v for v in rgb) else None
+    ripeness = record.get("ripeness")
+    return (int(ripeness) if ripeness is not None and ripeness == ripeness else None), mean_rgb
+
+
+# ---------------------------------------------------
+# Renderer
+# ---------------------------------------------------
+class OverlayRenderer:
+    def __init__(self, images, lookup=None, mode="full", quality=OVERLAY_QUALITY, cache_bytes=CACHE_BYTES):
+        self.images = images          # ImageStore: read() serves hot files and the archive tier
+        self.lookup = lookup          # raw path → record dict with geometry, or None
+        self.mode = mode
+        self.quality = quality
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()   # processed path → bytes
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "renders": 0, "from_record": 0, "from_detection": 0, "missing": 0,
+                      "last_render_ms": None}
+
+    @staticmethod
+    def handles(rel_path):
+        return PROCESSED_RE.match(rel_path) is not None
+
+    def render(self, rel_path):
+        """(bytes, mimetype) of the processed view for rel_path, or None when its raw frame is gone."""
+        m = PROCESSED_RE.match(rel_path)
+        if m is None:
+            return None
+        fmt, mimetype = FORMATS[m.group("ext")]
+        with self._lock:
+            data = self._cache.get(rel_path)
+            if data is not None:
+                self._cache.move_to_end(rel_path)
+                self.stats["hits"] += 1
+                return data, mimetype
+
+        start = time.perf_counter()
+        raw_path = f"{m.group('dir')}raw_{m.group('ts')}.jpg"
+        raw = self.images.read(raw_path)
+        img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR) if raw else None
+        if img is None:
+            self._count("missing")
+            return None
+
+        record = self.lookup(raw_path) if self.lookup else None
+        banana_cnt = contour_from_fields(record, img.shape) if record else None
+        if banana_cnt is not None:
+            ripeness, mean_rgb = label_values(record)
+            self._count("from_record")
+        else:
+            # No detector passed: stateless full-frame analysis, never a camera's ROI tracker
+            banana_cnt, mean_rgb, ripeness, _ = analyze_banana_cached(raw, img=img, mode=self.mode)
+            self._count("from_detection")
+        if banana_cnt is not None and ripeness is not None:
+            draw_overlay(img, banana_cnt, ripeness, mean_rgb)
+        data = encode_overlay(img, fmt, self.quality)[1]
+
+        with self._lock:
+            self.stats["renders"] += 1
+            self.stats["last_render_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if len(data) <= self.cache_bytes and rel_path not in self._cache:
+                self._cache[rel_path] = data
+                self._size += len(data)
+                while self._size > self.cache_bytes:
+                    _, old = self._cache.popitem(last=False)
+                    self._size -= len(old)
+        return data, mimetype
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "cached": len(self._cache), "cached_bytes": self._size}
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+🧊 Fruiture Parquet Archive
+---------------------------------------------------------------
+Long-term, columnar home for the collector's history once a day is over:
+ - One partition per table / device / local day:
+   archive/<table>/device=<id>/date=<YYYY-MM-DD>/part-<HHMMSS>.parquet
+   (Hive layout, so pandas / pyarrow / DuckDB read it as one dataset)
+ - Typed columns: timestamp[s], float64 values, string image paths;
+   zstd-compressed, sorted by time, ROW_GROUP_ROWS rows per row group with
+   min / max statistics, so a time filter skips whole row groups
+ - Reads only open the partitions of the requested devices and days and
+   decode only the requested columns (read() for replay / analysis,
+   query() with the same result shape as HistoryStore.query)
+ - Part files are written to *.tmp and renamed; archiving a day again
+   after a crash rewrites the same part instead of duplicating it
+"""
+
+import glob
+import os
+
+import numpy as np
+
+from history_store import bucket_stats, format_times, nan_to_none, regroup
+
+ARCHIVE_DIR_NAME = "archive"
+ROW_GROUP_ROWS = 8192          # ~4.5 h of 2-second sensor samples
+COMPRESSION = "zstd"
+DAY = 86400
+
+
+def day_string(seconds):
+    return format_times([seconds])[0][:10]
+
+
+def day_start(day):
+    """'YYYY-MM-DD' → naive seconds of its midnight."""
+    return int(np.datetime64(day, "s").astype(np.int64))
+
+
+def arrow_schema(table):
+    """Archive schema for a storage Table (timestamp + typed value / text columns)."""
+    import pyarrow as pa
+
+    fields = [("timestamp", pa.timestamp("s"))]
+    fields += [(c, pa.float64()) for c in table.value_columns]
+    fields += [(c, pa.string()) for c in table.text_columns]
+    return pa.schema(fields)
+
+
+class ParquetArchive:
+    def __init__(self, root):
+        self.root = root
+
+    def device_dir(self, table, device_id):
+        return os.path.join(self.root, table, f"device={device_id}")
+
+    def days(self, table, device_id):
+        """Archived days of one device, oldest first."""
+        return sorted(os.path.basename(p)[len("date="):]
+                      for p in glob.glob(os.path.join(self.device_dir(table, device_id), "date=*")))
+
+    def devices(self, table):
+        return sorted(os.path.basename(p)[len("device="):]
+                      for p in glob.glob(os.path.join(self.root, table, "device=*")))
+
+    def until(self, table, device_id):
+        """Naive seconds where the archive ends (midnight after the last archived day), or None."""
+        days = self.days(table, device_id)
+        return day_start(days[-1]) + DAY if days else None
+
+    def files(self, table, device_id, start=None, end=None):
+        """Part files of the days overlapping [start, end) — the partition pruning step."""
+        first = day_string(start) if start is not None else ""
+        last = day_string(end - 1) if end is not None else "9999"
+        out = []
+        for day in self.days(table, device_id):
+            if first <= day <= last:
+                out += sorted(glob.glob(os.path.join(self.device_dir(table, device_id), f"date={day}", "*.parquet")))
+        return out
+
+    # ---------------------------------------------------
+    # Writing
+    # ---------------------------------------------------
+    def write(self, table, device_id, seconds, values, texts=None):
+        """
+        Archive rows of one storage Table for one device: seconds (naive, int),
+        values (N×len(value_columns) float64), texts (column → list of str/None).
+        Rows are split into one part per day; returns {day: rows}.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        seconds = np.asarray(seconds, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(seconds), len(table.value_columns))
+        texts = texts or {}
+        schema = arrow_schema(table)
+        order = np.argsort(seconds, kind="stable")
+        seconds, values = seconds[order], values[order]
+        texts = {c: [texts[c][i] for i in order] if c in texts else [None] * len(order) for c in table.text_columns}
+
+        written = {}
+        day_keys = seconds - seconds % DAY
+        for key in np.unique(day_keys):
+            idx = np.flatnonzero(day_keys == key)
+            day = day_string(int(key))
+            columns = [pa.array(seconds[idx], type=pa.timestamp("s"))]
+            columns += [pa.array(values[idx, j], from_pandas=True) for j in range(len(table.value_columns))]
+            columns += [pa.array([texts[c][i] for i in idx], type=pa.string()) for c in table.text_columns]
+            part_dir = os.path.join(self.device_dir(table.name, device_id), f"date={day}")
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f"part-{format_times([seconds[idx[0]]])[0][11:].replace(':', '')}.parquet")
+            tmp = path + ".tmp"
+            pq.write_table(pa.Table.from_arrays(columns, schema=schema), tmp, compression=COMPRESSION,
+                           row_group_size=ROW_GROUP_ROWS, write_statistics=True)
+            os.replace(tmp, path)
+            written[day] = len(idx)
+        return written
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def read_arrow(self, table, device_id, start=None, end=None, columns=None):
+        """Arrow table of one device's archived rows in [start, end), timestamp + `columns` only."""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        files = self.files(table, device_id, start, end)
+        if not files:
+            return None
+        dataset = ds.dataset(files, format="parquet")
+        names = ["timestamp"] + [c for c in (columns or dataset.schema.names) if c != "timestamp"]
+        row_filter = None
+        if start is not None:
+            row_filter = ds.field("timestamp") >= pa.scalar(int(start), type=pa.timestamp("s"))
+        if end is not None:
+            upper = ds.field("timestamp") < pa.scalar(int(end), type=pa.timestamp("s"))
+            row_filter = upper if row_filter is None else row_filter & upper
+        result = dataset.to_table(columns=names, filter=row_filter)
+        return result.sort_by("timestamp") if len(files) > 1 else result
+
+    def read(self, table, devices=None, start=None, end=None, columns=None):
+        """DataFrame of archived rows (plus a `device` column) for replay, training or analysis."""
+        import pandas as pd
+
+        frames = []
+        for device_id in devices or self.devices(table):
+            data = self.read_arrow(table, device_id, start, end, columns)
+            if data is not None and data.num_rows:
+                frames.append(data.to_pandas().assign(device=device_id))
+        if not frames:
+            return pd.DataFrame(columns=["timestamp"] + list(columns or []) + ["device"])
+        return pd.concat(frames, ignore_index=True).sort_values(["timestamp", "device"], kind="stable")
+
+    def query(self, table, device_id, start, end, resolution, columns, limit, cursor=None):
+        """(data, next_cursor) in HistoryStore.query's shape."""
+        if resolution is None:
+            return self._raw(table, device_id, start, end, columns, limit, cursor)
+        if cursor is not None:
+            start = int(cursor)
+        seconds, values = self._arrays(self.read_arrow(table.name, device_id, start, end, columns), columns)
+        if len(seconds) == 0:
+            return {"t": [], "count": [], "columns": {c: {"min": [], "max": [], "mean": []} for c in columns}}, None
+        keys, stats = regroup(*bucket_stats(seconds, values, resolution), resolution)
+        next_cursor = None
+        if len(keys) > limit:
+            next_cursor = str(int(keys[limit]))
+            keys, stats = keys[:limit], stats[:limit]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = stats[:, 1] / stats[:, 0]
+        return {
+            "t": format_times(keys),
+            "count": stats[:, 0].max(axis=1).astype(int).tolist() if columns else [0] * len(keys),
+            "columns": {c: {"min": nan_to_none(stats[:, 2, j]), "max": nan_to_none(stats[:, 3, j]),
+                            "mean": nan_to_none(mean[:, j])} for j, c in enumerate(columns)},
+        }, next_cursor
+
+    def _raw(self, table, device_id, start, end, columns, limit, cursor):
+        """Raw rows, one day partition at a time until the page is full; cursor = "<seconds>:<skip>"."""
+        skip = 0
+        if cursor is not None:
+            start, skip = (int(x) for x in cursor.split(":"))
+        parts, taken = [], 0
+        day = start - start % DAY
+        while day < end and taken <= limit + skip:
+            data = self.read_arrow(table.name, device_id, max(start, day), min(end, day + DAY), columns)
+            if data is not None and data.num_rows:
+                parts.append(self._arrays(data, columns))
+                taken += data.num_rows
+            day += DAY
+        if not parts:
+            return {"t": [], "columns": {c: [] for c in columns}}, None
+        seconds = np.concatenate([p[0] for p in parts])[skip:]
+        values = np.vstack([p[1] for p in parts])[skip:]
+        next_cursor = None
+        if len(seconds) > limit:
+            resume = int(seconds[limit])
+            # Rows sharing the resume second that are already on this page (plus the cursor's own skip)
+            already = int(np.count_nonzero(seconds[:limit] == resume))
+            next_cursor = f"{resume}:{already + (skip if resume == start else 0)}"
+            seconds, values = seconds[:limit], values[:limit]
+        return {"t": format_times(seconds),
+                "columns": {c: nan_to_none(values[:, j]) for j, c in enumerate(columns)}}, next_cursor
+
+    @staticmethod
+    def _arrays(data, columns):
+        if data is None or data.num_rows == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(columns)))
+        seconds = data.column("timestamp").to_numpy().astype("datetime64[s]").astype(np.int64)
+        values = np.column_stack([data.column(c).to_numpy(zero_copy_only=False).astype(np.float64)
+                                  for c in columns]) if columns else np.empty((len(seconds), 0))
+        return seconds, values
+
+    def describe(self, table, device_id):
+        days = self.days(table, device_id)
+        files = self.files(table, device_id)
+        if not files:
+            return None
+        import pyarrow.parquet as pq
+        return {"days": len(days), "first_day": days[0], "last_day": days[-1], "files": len(files),
+                "rows": sum(pq.ParquetFile(f).metadata.num_rows for f in files),
+                "bytes": sum(os.path.getsize(f) for f in files)}
+
+
+# ---------------------------------------------------
+# Live history + archive in one query
+# ---------------------------------------------------
+ARCHIVE_CURSOR = "archive:"
+LIVE_CURSOR = "live"
+
+
+def query_with_archive(archive, live_query, table, device_id, start, end, resolution, columns, limit, cursor):
+    """
+    Answer [start, end) from the archive up to where it ends, then from live
+    storage (live_query(start, end, cursor, limit) → (data, next_cursor)).
+    Archive pages carry an "archive:<offset>" cursor and "live" hands over to
+    live storage; buckets are exact for resolutions that divide a day.
+    """
+    boundary = archive.until(table.name, device_id) if archive is not None else None
+    if boundary is None:
+        return live_query(start, end, cursor, limit)
+    if cursor == LIVE_CURSOR:
+        return live_query(max(start, boundary), end, None, limit)
+    if not (cursor or "").startswith(ARCHIVE_CURSOR) and (cursor is not None or start >= boundary):
+        return live_query(max(start, boundary), end, cursor, limit)
+
+    inner = cursor[len(ARCHIVE_CURSOR):] if cursor else None
+    data, next_cursor = archive.query(table, device_id, start, min(end, boundary), resolution,
+                                      columns, limit, inner or None)
+    if next_cursor is not None:
+        return data, ARCHIVE_CURSOR + next_cursor
+    if end <= boundary:
+        return data, None
+    room = limit - len(data["t"])
+    if room <= 0:
+        return data, LIVE_CURSOR
+    live, next_cursor = live_query(boundary, end, None, room)
+    return concat_pages(data, live), next_cursor
+
+
+def concat_pages(a, b):
+    out = {"t": a["t"] + b["t"]}
+    if "count" in a:
+        out["count"] = a["count"] + b["count"]
+        out["columns"] = {c: {k: a["columns"][c][k] + b["columns"][c][k] for k in ("min", "max", "mean")}
+                          for c in a["columns"]}
+    else:
+        out["columns"] = {c: a["columns"][c] + b["columns"][c] for c in a["columns"]}
+    return out
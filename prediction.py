@@ -6,14 +6,34 @@ Uses trained RandomForest regression model to:
  - Load ml_input.json (latest average sensor data)
  - Predict banana ripeness (Day 1–5)
  - Send Telegram notification with natural description
+
+Runs as a resident service by default: the model stays loaded, one MQTT
+session listens on fruiture/ml_input (and fruiture/<device>/ml_input) and
+answers each summary on the matching servo_angle topic (only when the
+forest's trees agree at MIN_CONFIDENCE). Summaries that already carry a
+"prediction" come from a collector with PUBLISH_PREDICTIONS on, which
+commanded the servo itself; they only drive alerts, so the servo gets one
+command per cycle. Telegram alerts go through telegram_notifier.py:
+queued and fanned out on a pooled session with rate limits and retries,
+and only sent when a bowl's predicted day changes.
+
+Usage:
+    python prediction.py                # serve summaries from MQTT
+    python prediction.py --watch        # also re-predict when ml_input.json changes
+    python prediction.py --once         # old behaviour: predict ml_input.json once and exit
+    python prediction.py --telegram-api http://127.0.0.1:8081   # local stub Bot API
 """
 
+import argparse
 import os
 import json
-import pandas as pd
-import joblib
+import threading
+import time
 import paho.mqtt.client as mqtt
-import requests
+
+from batch_predictor import BatchPredictor, MicroBatcher, SUMMARY_KEYS, confident
+from device_sessions import DEFAULT_DEVICE, device_topic, parse_topic
+from telegram_notifier import TELEGRAM_API, DayTransitionFilter, TelegramDispatcher
 
 # ---------------------------------------------------
 # Configuration
@@ -27,122 +47,265 @@ BOT_FILE = os.path.join(BASE_DIR, "BotAPI.txt")
 MQTT_BROKER = "test.mosquitto.org"
 MQTT_PORT = 1883
 MQTT_TOPIC = "fruiture/servo_angle"
+SUMMARY_SUBSCRIPTIONS = ("fruiture/ml_input", "fruiture/+/ml_input")
 
-# ---------------------------------------------------
-# Load model and scaler
-# ---------------------------------------------------
-print("🧠 Loading trained model and scaler...")
-model = joblib.load(MODEL_FILE)
-scaler = joblib.load(SCALER_FILE)
-print("✅ Model and scaler loaded successfully.")
+BATCH_WINDOW_SECONDS = 0.05  # summaries from several bowls arriving together share one predict call
+TELEGRAM_FLUSH_SECONDS = 30  # how long shutdown / --once waits for queued alerts
 
-# ---------------------------------------------------
-# Read input JSON
-# ---------------------------------------------------
-if not os.path.exists(JSON_FILE):
-    raise FileNotFoundError(f"❌ {JSON_FILE} not found. Run your data collector first!")
+STATUS_MESSAGES = {
+    1: "🍃 Very fresh — around 4 days until it spoils.",
+    2: "🌿 Still fresh — about 3 days remaining.",
+    3: "🍌 Nicely ripe — good for eating now.",
+    4: "🍯 Getting soft — best to eat today or tomorrow.",
+    5: "⚠️ Overripe — eat soon or it will spoil!",
+}
 
-with open(JSON_FILE, "r") as f:
-    data = json.load(f)
-print(f"📄 Loaded ml_input.json → {data}")
 
 # ---------------------------------------------------
-# Prepare data for prediction
+# Model
 # ---------------------------------------------------
-data_fixed = {
-    "Max_gas": data["max_gas"],
-    "Average_Gas": data["average_gas"],
-    "temperature": data["average_temperature"],
-    "humidity": data["average_humidity"],
-    "R": data["average_R"],
-    "G": data["average_G"],
-    "B": data["average_B"]
-}
+def load_model(model_file=MODEL_FILE, scaler_file=SCALER_FILE):
+    print("🧠 Loading trained model and scaler...")
+    predictor = BatchPredictor.load(model_file, scaler_file)
+    print("✅ Model and scaler loaded successfully.")
+    return predictor
+
+
+def with_status(result):
+    if result is None:
+        raise ValueError(f"Summary is missing one of {SUMMARY_KEYS}")
+    return {**result, "status": STATUS_MESSAGES[result["predicted_day"]]}
+
+
+def predict_summary(predictor, data):
+    return with_status(predictor.predict_summaries([data])[0])
 
-features = ["Max_gas", "Average_Gas", "temperature", "humidity", "R", "G", "B"]
-X_input = pd.DataFrame([[data_fixed[f] for f in features]], columns=features)
 
 # ---------------------------------------------------
-# Predict banana ripeness (regression)
+# Telegram
 # ---------------------------------------------------
-X_scaled = scaler.transform(X_input)
-predicted_day = float(model.predict(X_scaled)[0])
-predicted_day_rounded = int(round(predicted_day))
-predicted_day_clamped = min(max(predicted_day_rounded, 1), 5)
-
-servo_angle = int((predicted_day_clamped - 1) * 45)
-
-# 🧾 Generate a natural-language description
-if predicted_day_clamped == 1:
-    status_msg = "🍃 Very fresh — around 4 days until it spoils."
-elif predicted_day_clamped == 2:
-    status_msg = "🌿 Still fresh — about 3 days remaining."
-elif predicted_day_clamped == 3:
-    status_msg = "🍌 Nicely ripe — good for eating now."
-elif predicted_day_clamped == 4:
-    status_msg = "🍯 Getting soft — best to eat today or tomorrow."
-else:  # Day 5
-    status_msg = "⚠️ Overripe — eat soon or it will spoil!"
-
-print("\n🍌 === Banana Prediction Result ===")
-print(f"Predicted Day : {predicted_day_clamped}")
-print(f"Status        : {status_msg}")
-print(f"Servo Angle (0–180°) : {servo_angle}°")
+def load_bot_config(bot_file=BOT_FILE):
+    """(token, chat_ids) from BotAPI.txt, or None if it is missing."""
+    if not os.path.exists(bot_file):
+        return None
+    with open(bot_file, "r") as f:
+        lines = [line.strip() for line in f.readlines() if line.strip()]
+    return lines[0], lines[1:]  # token, then all remaining lines are chat ids
+
+
+def telegram_message(result, timestamp, device_id=DEFAULT_DEVICE):
+    where = "" if device_id == DEFAULT_DEVICE else f" ({device_id})"
+    return (
+        f"🍌 *Fruiture Banana Update!*{where}\n"
+        f"Predicted ripeness: *Day {result['predicted_day']}*\n"
+        f"{result['status']}\n"
+        f"Timestamp: {timestamp}"
+    )
+
+
+def telegram_dispatcher(bot_file=BOT_FILE, base_url=TELEGRAM_API, transport=None):
+    """TelegramDispatcher for the chats in BotAPI.txt, or None if it is missing."""
+    bot = load_bot_config(bot_file)
+    if bot is None:
+        return None
+    token, chat_ids = bot
+    return TelegramDispatcher(token, chat_ids, transport=transport, base_url=base_url)
 
 
 # ---------------------------------------------------
-# Publish result to ESP32 via MQTT (no servo angle printed)
+# Resident service
 # ---------------------------------------------------
-payload = json.dumps({
-    "predicted_day": predicted_day_clamped,
-    "servo_angle": servo_angle,
-    "timestamp": data.get("timestamp", "N/A")
-})
-
-try:
-    print(f"\n📡 Connecting to MQTT broker {MQTT_BROKER}...")
-    client = mqtt.Client()
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_start()
-    client.publish(MQTT_TOPIC, payload)
-    print(f"✅ Published to {MQTT_TOPIC}: {payload}")
-    client.loop_stop()
-    client.disconnect()
-except Exception as e:
-    print(f"⚠️ MQTT publish failed: {e}")
+class PredictionService:
+    """Warm model + one persistent MQTT client + a background Telegram dispatcher."""
+
+    def __init__(self, broker=MQTT_BROKER, port=MQTT_PORT, bot_file=BOT_FILE, telegram_api=TELEGRAM_API,
+                 transport=None):
+        self.predictor = load_model()
+        self.telegram = telegram_dispatcher(bot_file, telegram_api, transport)
+        if self.telegram is None:
+            print("⚠️ No BotAPI.txt found, Telegram alerts disabled.")
+        self.alerts = DayTransitionFilter()
+        self.broker = broker
+        self.port = port
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.lock = threading.Lock()
+        self.stats = {"predictions": 0, "errors": 0, "last_predict_ms": None, "avg_predict_ms": None}
+
+        # Warm-up: the first predict pays for lazy allocations inside sklearn
+        predict_summary(self.predictor, dict.fromkeys(SUMMARY_KEYS, 0.0))
+        self.batcher = MicroBatcher(self.predictor, window=BATCH_WINDOW_SECONDS)
+
+    def record_latency(self, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            n = self.stats["predictions"] = self.stats["predictions"] + 1
+            avg = self.stats["avg_predict_ms"] or elapsed_ms
+            self.stats["avg_predict_ms"] = round(avg + (elapsed_ms - avg) / n, 3)
+            self.stats["last_predict_ms"] = round(elapsed_ms, 3)
+
+    def submit(self, data, device_id=DEFAULT_DEVICE):
+        """Queue a summary on the micro-batcher; the answer is published from its callback."""
+        start = time.perf_counter()
+
+        def done(future):
+            try:
+                result = with_status(future.result())
+                self.record_latency(start)
+                self.publish(result, data, device_id)
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                print(f"❌ [{device_id}] Prediction failed:", e)
+
+        self.batcher.submit(data).add_done_callback(done)
+
+    def handle_summary(self, data, device_id=DEFAULT_DEVICE):
+        """Predict and publish synchronously (file watcher)."""
+        if data.get("prediction"):
+            return self.alert(with_status(data["prediction"]), data.get("timestamp", "N/A"), device_id)
+        start = time.perf_counter()
+        result = predict_summary(self.predictor, data)
+        self.record_latency(start)
+        return self.publish(result, data, device_id)
+
+    def publish(self, result, data, device_id=DEFAULT_DEVICE):
+        timestamp = data.get("timestamp", "N/A")
+        topic = device_topic(MQTT_TOPIC, device_id)
+        if confident(result):
+            payload = json.dumps({
+                "predicted_day": result["predicted_day"],
+                "servo_angle": result["servo_angle"],
+                "timestamp": timestamp
+            })
+            self.client.publish(topic, payload)
+            print(f"🤖 [{device_id}] Day {result['predicted_day']} ({result['day']}) → Servo "
+                  f"{result['servo_angle']}° on {topic} [{self.stats['last_predict_ms']} ms]")
+        else:
+            print(f"⚠️ [{device_id}] Low confidence ({result['confidence'] * 100:.1f}%), skipping servo command.")
+        return self.alert(result, timestamp, device_id)
+
+    def alert(self, result, timestamp, device_id=DEFAULT_DEVICE):
+        if self.telegram is not None and self.alerts.should_alert(device_id, result["predicted_day"]):
+            self.telegram.send(telegram_message(result, timestamp, device_id))
+        return result
+
+    def on_connect(self, client, userdata, flags, rc):
+        print("✅ Connected to MQTT broker with result code:", rc)
+        for topic in SUMMARY_SUBSCRIPTIONS:
+            client.subscribe(topic)
+            print(f"📡 Subscribed to topic: {topic}")
+
+    def on_message(self, client, userdata, message):
+        device_id, _ = parse_topic(message.topic)
+        try:
+            data = json.loads(message.payload.decode("utf-8"))
+            if data.get("prediction"):  # the collector already commanded the servo
+                self.alert(with_status(data["prediction"]), data.get("timestamp", "N/A"), device_id)
+                return
+            self.submit(data, device_id)
+        except Exception as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            print(f"❌ [{device_id}] Prediction failed for '{message.topic}':", e)
+
+    def watch_file(self, path=JSON_FILE, interval=2.0):
+        """Re-predict whenever the collector rewrites ml_input.json."""
+        last_mtime = None
+        while True:
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    with open(path, "r") as f:
+                        self.handle_summary(json.load(f))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ Failed to predict from {path}:", e)
+            time.sleep(interval)
+
+    def serve_forever(self, watch=False):
+        print(f"📡 Connecting to MQTT broker {self.broker}...")
+        self.client.connect(self.broker, self.port, 60)
+        if watch:
+            threading.Thread(target=self.watch_file, daemon=True).start()
+        # loop_forever reconnects on its own; the session (and model) stay up between cycles
+        try:
+            self.client.loop_forever(retry_first_connection=True)
+        finally:
+            self.batcher.stop()
+            if self.telegram is not None:
+                self.telegram.close(TELEGRAM_FLUSH_SECONDS)
 
 
 # ---------------------------------------------------
-# Send Telegram notifications (multi-user)
+# One-shot mode (the original script)
 # ---------------------------------------------------
-if os.path.exists(BOT_FILE):
-    with open(BOT_FILE, "r") as f:
-        lines = [line.strip() for line in f.readlines() if line.strip()]
-        TOKEN = lines[0]
-        CHAT_IDS = lines[1:]  # all remaining lines
-
-    TELEGRAM_URL = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
-    message = (
-        f"🍌 *Fruiture Banana Update!*\n"
-        f"Predicted ripeness: *Day {predicted_day_clamped}*\n"
-        f"{status_msg}\n"
-        f"Timestamp: {data.get('timestamp', 'N/A')}"
-    )
+def run_once(json_file=JSON_FILE, telegram_api=TELEGRAM_API):
+    predictor = load_model()
+    if not os.path.exists(json_file):
+        raise FileNotFoundError(f"❌ {json_file} not found. Run your data collector first!")
+
+    with open(json_file, "r") as f:
+        data = json.load(f)
+    print(f"📄 Loaded ml_input.json → {data}")
 
-    for chat_id in CHAT_IDS:
+    result = predict_summary(predictor, data)
+    print("\n🍌 === Banana Prediction Result ===")
+    print(f"Predicted Day : {result['predicted_day']}")
+    print(f"Status        : {result['status']}")
+    print(f"Servo Angle (0–180°) : {result['servo_angle']}°")
+
+    payload = json.dumps({
+        "predicted_day": result["predicted_day"],
+        "servo_angle": result["servo_angle"],
+        "timestamp": data.get("timestamp", "N/A")
+    })
+    if not confident(result):
+        print(f"⚠️ Low confidence ({result['confidence'] * 100:.1f}%), skipping servo command.")
+    else:
         try:
-            r = requests.post(TELEGRAM_URL, json={
-                "chat_id": chat_id,
-                "text": message,
-                "parse_mode": "Markdown"
-            })
-            if r.status_code == 200:
-                print(f"✅ Telegram alert sent to {chat_id}")
-            else:
-                print(f"⚠️ Telegram failed for {chat_id}: {r.status_code} {r.text}")
+            print(f"\n📡 Connecting to MQTT broker {MQTT_BROKER}...")
+            client = mqtt.Client()
+            client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            client.loop_start()
+            client.publish(MQTT_TOPIC, payload).wait_for_publish(timeout=10)
+            print(f"✅ Published to {MQTT_TOPIC}: {payload}")
+            client.loop_stop()
+            client.disconnect()
         except Exception as e:
-            print(f"⚠️ Telegram send error for {chat_id}: {e}")
-else:
-    print("⚠️ No BotAPI.txt found, skipping Telegram alert.")
+            print(f"⚠️ MQTT publish failed: {e}")
+
+    telegram = telegram_dispatcher(base_url=telegram_api)
+    if telegram is None:
+        print("⚠️ No BotAPI.txt found, skipping Telegram alert.")
+    elif DayTransitionFilter().should_alert(DEFAULT_DEVICE, result["predicted_day"]):
+        telegram.send(telegram_message(result, data.get("timestamp", "N/A")))
+        telegram.close(TELEGRAM_FLUSH_SECONDS)
+    else:
+        print(f"ℹ️ Still day {result['predicted_day']}, no Telegram alert.")
+        telegram.close()
+
+    print("\n🎯 Done! Prediction completed and Telegram alerts sent.")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banana age prediction service.")
+    parser.add_argument("--once", action="store_true", help="predict ml_input.json once and exit")
+    parser.add_argument("--watch", action="store_true", help="also re-predict when ml_input.json changes")
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--telegram-api", default=TELEGRAM_API, help="Bot API base URL (e.g. a local stub)")
+    args = parser.parse_args()
+
+    if args.once:
+        run_once(telegram_api=args.telegram_api)
+    else:
+        PredictionService(args.broker, args.port, telegram_api=args.telegram_api).serve_forever(watch=args.watch)
+
 
-print("\n🎯 Done! Prediction completed and Telegram alerts sent.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+🔁 Fruiture Batch Re-analysis
+---------------------------------------------------------------
+Re-runs banana detection over stored raw images so the feature columns
+(avg_R/G/B, ripeness, green/yellow/brown/black_%) can be rebuilt after
+the HSV thresholds in banana_detector_no_grey are tuned:
+ - Input: a folder of raw_<timestamp>.jpg images, or a CSV with image_path
+ - Detection runs in a process pool across all cores
+ - Results are appended to <out>.progress.jsonl as they finish, keyed by
+   sha256(image bytes) + detector fingerprint → re-runs skip finished images
+ - Writes a new dataset file; the input CSV is never modified
+
+Usage:
+    python reanalyze.py --images images --out esp32_data_reanalyzed.csv
+    python reanalyze.py --csv data/day1_left.csv --image-dir images --out day1_left_v2.csv
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from banana_detector_no_grey import detect_banana_cached, detector_fingerprint
+
+FEATURE_COLUMNS = [
+    "ripeness", "avg_R", "avg_G", "avg_B",
+    "green_%", "yellow_%", "brown_%", "black_%",
+]
+RAW_NAME_RE = re.compile(r"raw_(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})")
+
+
+# ---------------------------------------------------
+# Worker (runs in the process pool)
+# ---------------------------------------------------
+def analyze_image(path, mode="full"):
+    """
+    Detection features for one image file, or None if it cannot be decoded.
+    Goes through the shared detection cache, so images seen before with the
+    same thresholds are not decoded or analysed again.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        _, mean_rgb, ripeness, proportions = detect_banana_cached(data, mode=mode, with_vis=False)
+    except ValueError:
+        return None
+
+    features = {c: None for c in FEATURE_COLUMNS}
+    if mean_rgb:
+        features["avg_R"], features["avg_G"], features["avg_B"] = mean_rgb
+    features["ripeness"] = ripeness
+    if proportions:
+        for color, value in proportions.items():
+            features[f"{color}_%"] = value
+    return features
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ---------------------------------------------------
+# Inputs
+# ---------------------------------------------------
+def rows_from_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "**", "raw_*.jpg"), recursive=True))
+    rows = []
+    for path in paths:
+        rel = os.path.relpath(path, image_dir).replace(os.sep, "/")
+        m = RAW_NAME_RE.search(os.path.basename(path))
+        timestamp = f"{m.group(1)} {m.group(2)}:{m.group(3)}:{m.group(4)}" if m else None
+        rows.append({"timestamp": timestamp, "image_path": rel})
+    return pd.DataFrame(rows, columns=["timestamp", "image_path"])
+
+
+def rows_from_csv(csv_path):
+    df = pd.read_csv(csv_path)
+    if "image_path" not in df.columns:
+        raise ValueError(f"{csv_path} has no image_path column")
+    return df
+
+
+# ---------------------------------------------------
+# Progress (resume) log
+# ---------------------------------------------------
+def load_progress(progress_file, fingerprint):
+    done = {}
+    if not os.path.exists(progress_file):
+        return done
+    with open(progress_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line after a crash
+            if item.get("detector") == fingerprint:
+                done[item["sha256"]] = item["features"]
+    return done
+
+
+# ---------------------------------------------------
+# Main
+# ---------------------------------------------------
+def reanalyze(df, image_dir, out_file, mode="full", workers=None):
+    fingerprint = detector_fingerprint(mode)
+    progress_file = out_file + ".progress.jsonl"
+    done = load_progress(progress_file, fingerprint)
+    print(f"🔑 Detector fingerprint {fingerprint} | {len(done)} images already analysed")
+
+    # Hash every input once; identical frames are analysed once
+    hashes = []
+    todo = {}
+    for rel in df["image_path"]:
+        path = os.path.join(image_dir, str(rel)) if isinstance(rel, str) else None
+        if path is None or not os.path.exists(path):
+            hashes.append(None)
+            continue
+        digest = file_sha256(path)
+        hashes.append(digest)
+        if digest not in done:
+            todo.setdefault(digest, path)
+
+    missing = sum(h is None for h in hashes)
+    if missing:
+        print(f"⚠️ {missing} rows have no image on disk; their feature columns are left unchanged")
+    print(f"🧮 {len(todo)} images to analyse with {workers or os.cpu_count()} workers")
+
+    start = time.perf_counter()
+    with open(progress_file, "a", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_image, path, mode): digest for digest, path in todo.items()}
+        for i, future in enumerate(as_completed(futures), 1):
+            digest = futures[future]
+            try:
+                features = future.result()
+            except Exception as e:
+                print(f"❌ {todo[digest]}: {e}")
+                continue
+            if features is None:
+                print(f"⚠️ Could not decode {todo[digest]}")
+                continue
+            done[digest] = features
+            progress.write(json.dumps({"sha256": digest, "detector": fingerprint,
+                                       "path": todo[digest], "features": features}) + "\n")
+            progress.flush()
+            if i % 50 == 0 or i == len(futures):
+                rate = i / max(time.perf_counter() - start, 1e-9)
+                print(f"⏱️ {i}/{len(futures)} images ({rate:.1f} img/s)")
+
+    out = df.copy()
+    for col in FEATURE_COLUMNS:
+        if col not in out.columns:
+            out[col] = np.nan
+        out[col] = out[col].astype(object)
+    for idx, digest in zip(out.index, hashes):
+        features = done.get(digest) if digest else None
+        if features:
+            for col in FEATURE_COLUMNS:
+                out.at[idx, col] = features[col]
+
+    out.to_csv(out_file, index=False)
+    print(f"✅ Wrote {len(out)} rows to {out_file}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run banana detection over stored raw images.")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--images", help="folder with raw_<timestamp>.jpg images (searched recursively)")
+    src.add_argument("--csv", help="dataset CSV with an image_path column")
+    parser.add_argument("--image-dir", default="images", help="base folder for image_path values (with --csv)")
+    parser.add_argument("--out", required=True, help="new dataset CSV to write")
+    parser.add_argument("--mode", choices=["full", "fast"], default="full", help="detector to use")
+    parser.add_argument("--workers", type=int, default=None, help="process count (default: all cores)")
+    args = parser.parse_args()
+
+    if args.images:
+        df, image_dir = rows_from_images(args.images), args.images
+    else:
+        df, image_dir = rows_from_csv(args.csv), args.image_dir
+    reanalyze(df, image_dir, args.out, mode=args.mode, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+🗃️ Fruiture Record Store
+---------------------------------------------------------------
+Append-only CSV storage for completed ESP32 records:
+ - O(1) appends through a persistent buffered writer (no read-concat-rewrite)
+ - Crash-safe flushing (flush + fsync) on a record count or time threshold
+ - Repairs a torn last line left behind by a crash on open, and adds
+   columns missing from an older file's header (e.g. bbox / contour)
+ - Cheap tail() reads for the dashboard without parsing the whole file
+ - truncate_before() hands rows older than a cutoff to the archiver and
+   rewrites the file without them
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+
+RECORD_COLUMNS = [
+    "timestamp", "temperature", "humidity", "gas",
+    "ripeness", "avg_R", "avg_G", "avg_B",
+    "green_%", "yellow_%", "brown_%", "black_%",
+    "image_path", "processed_image_path",
+    "bbox", "contour"
+]
+
+
+def _coerce(value):
+    """Turn a CSV cell back into the number / None pandas would have given us."""
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if number.is_integer() and "." not in value and "e" not in value.lower():
+        return int(number)
+    return number
+
+
+def split_csv(path, cutoff, on_rows=None):
+    """
+    Drop rows whose timestamp (first column) sorts before `cutoff`
+    ('YYYY-MM-DD HH:MM:SS'). on_rows(header, rows) sees them first; if it
+    raises, the file is left untouched. Returns the number of rows dropped.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = list(reader)
+    old = [r for r in rows if r and r[0] < cutoff]
+    if header is None or not old:
+        return 0
+    if on_rows is not None:
+        on_rows(header, old)
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(r for r in rows if r and r[0] >= cutoff)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(old)
+
+
+def add_columns(path, columns):
+    """Rewrite a CSV with `columns` appended to its header; existing rows get empty cells."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    width = len(header) + len(columns)
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header + list(columns))
+        writer.writerows(r + [""] * (width - len(r)) for r in rows if r)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RecordStore:
+    """
+    Append-only record file shared by the MQTT writer, the Flask routes and
+    the summary thread. All access goes through one lock so readers never
+    see a half-written row.
+    """
+
+    def __init__(self, path, columns=None, flush_every=1, flush_interval=5.0, fsync=True):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+        self._repair_torn_tail()
+        wanted = list(columns or RECORD_COLUMNS)
+        header = self._read_header()
+        missing = [c for c in wanted if c not in header] if header else []
+        if missing:
+            # DictWriter(extrasaction="ignore") would silently drop these fields otherwise
+            add_columns(self.path, missing)
+            print(f"🧩 Added column(s) {', '.join(missing)} to {self.path}")
+            header += missing
+        self.columns = header or wanted
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+        self._fh = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._fh, fieldnames=self.columns, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+            self._sync()
+        self._count = self._count_rows()
+
+    # ---------------------------------------------------
+    # Opening helpers
+    # ---------------------------------------------------
+    def _read_header(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+
+    def _repair_torn_tail(self):
+        """Drop a partial last row (no trailing newline) left by a crash mid-write."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            size = f.tell()
+            block = 4096
+            pos = size
+            while pos > 0:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                idx = f.read(step).rfind(b"\n")
+                if idx != -1:
+                    f.truncate(pos + idx + 1)
+                    print(f"🩹 Repaired torn last row in {self.path}")
+                    return
+            # Not even a complete header survived
+            f.truncate(0)
+
+    def _count_rows(self):
+        with open(self.path, "rb") as f:
+            lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        return max(0, lines - 1)
+
+    # ---------------------------------------------------
+    # Writing
+    # ---------------------------------------------------
+    def _sync(self):
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def append(self, record):
+        with self._lock:
+            self._writer.writerow({k: ("" if record.get(k) is None else record.get(k)) for k in self.columns})
+            self._count += 1
+            self._pending += 1
+            if (self._pending >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._fh.closed:
+                self._sync()
+                self._fh.close()
+
+    def __len__(self):
+        return self._count
+
+    def truncate_before(self, cutoff, on_rows=None):
+        """split_csv() on this file (appends wait meanwhile); returns the rows dropped."""
+        with self._lock:
+            self._sync()
+            self._fh.close()
+            try:
+                dropped = split_csv(self.path, cutoff, on_rows)
+            finally:
+                self._fh = open(self.path, "a", newline="", encoding="utf-8")
+                self._writer = csv.DictWriter(self._fh, fieldnames=self.columns, extrasaction="ignore")
+            self._count -= dropped
+            return dropped
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def tail(self, n=10):
+        """Return the last n records as dicts, reading only the end of the file."""
+        with self._lock:
+            self.flush()
+            if n <= 0 or self._count == 0:
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                pos = f.tell()
+                data = b""
+                while pos > 0 and data.count(b"\n") <= n + 1:
+                    step = min(8192, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        if pos == 0:
+            lines = lines[1:]  # skip header
+        rows = csv.reader(io.StringIO("\n".join(lines[-n:])))
+        return [{k: _coerce(v) for k, v in zip(self.columns, row)} for row in rows]
+
+    def read_frame(self):
+        """Full read as a DataFrame (offline analysis and legacy callers)."""
+        with self._lock:
+            self.flush()
+            return pd.read_csv(self.path)
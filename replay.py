@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+⏪ Fruiture Replay
+---------------------------------------------------------------
+Re-drives the collector from recorded sessions in data/ on a virtual clock:
+ - Every CSV row becomes the firmware's temp / humidity / mq2gas messages
+   plus a camera frame, fed through the collector's real on_message
+ - Frames use the raw image (Base64 through the image pipeline) when it is
+   found under --image-dir, otherwise the recorded detection features
+ - The virtual clock steps to each row's timestamp; with --speed N the
+   replay sleeps 1/N of the real gap (--speed 0 = as fast as possible)
+ - Summaries, ML prediction and servo commands fire every
+   SUMMARY_INTERVAL_SECONDS of virtual time, so a multi-day experiment
+   runs in seconds; MQTT publishes are recorded (or sent with --broker)
+ - Output goes to a throw-away FRUITURE_DATA_DIR unless --data-dir is given
+ - --archive replays archived records instead (only the chosen devices'
+   day partitions and the replayed columns are read)
+
+Usage:
+    python replay.py --speed 0
+    python replay.py data/day1_left.csv data/day_2_left.csv --group single --speed 600
+    python replay.py --image-dir images --speed 60 --broker test.mosquitto.org
+    python replay.py --archive archive --start 2025-11-01 --end 2025-11-08 --devices left right
+"""
+
+import argparse
+import base64
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import types
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_GLOB = os.path.join(BASE_DIR, "data", "*.csv")
+SIDE_RE = re.compile(r"(left|right)", re.IGNORECASE)
+FRAME_FIELDS = [
+    "ripeness", "avg_R", "avg_G", "avg_B",
+    "green_%", "yellow_%", "brown_%", "black_%",
+    "image_path", "processed_image_path",
+]
+
+
+class VirtualClock:
+    """Stepped clock: time() is whatever the replay last set it to."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def set(self, ts):
+        self.now = max(self.now, ts)
+
+
+class RecordingClient:
+    """Stand-in MQTT client that keeps what the collector publishes (optionally forwarding it)."""
+
+    def __init__(self, forward=None):
+        self.forward = forward
+        self.published = []
+
+    def publish(self, topic, payload, *args, **kwargs):
+        self.published.append((topic, payload))
+        if self.forward is not None:
+            self.forward.publish(topic, payload, *args, **kwargs)
+
+
+# ---------------------------------------------------
+# Inputs
+# ---------------------------------------------------
+def default_files():
+    """Recorded sessions, without the *_with_days_left copies of the same rows."""
+    return sorted(p for p in glob.glob(DATA_GLOB) if not p.endswith("_with_days_left.csv"))
+
+
+def device_for(path, group):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if group == "single":
+        return "default"
+    if group == "side":
+        m = SIDE_RE.search(stem)
+        return m.group(1).lower() if m else "default"
+    return stem
+
+
+def local_seconds(times):
+    """Naive local timestamps (as written by the collector) → epoch seconds on this host's clock."""
+    return times.map(lambda x: time.mktime(x.timetuple()) + x.microsecond / 1e6)
+
+
+def load_rows(files, group):
+    frames = []
+    for path in files:
+        df = pd.read_csv(path)
+        df["ts"] = local_seconds(pd.to_datetime(df["timestamp"], format="mixed"))
+        df["device"] = device_for(path, group)
+        df["source"] = os.path.basename(path)
+        frames.append(df)
+    rows = pd.concat(frames, ignore_index=True)
+    return rows.sort_values(["ts", "device"], kind="stable").reset_index(drop=True)
+
+
+def load_archive_rows(archive_dir, devices=None, start=None, end=None):
+    """Archived records (one device per archive device) in the same shape as load_rows()."""
+    from history_store import parse_time
+    from parquet_archive import ParquetArchive
+
+    columns = ["temperature", "humidity", "gas"] + FRAME_FIELDS
+    rows = ParquetArchive(archive_dir).read("records", devices, parse_time(start), parse_time(end), columns)
+    rows["ts"] = local_seconds(rows["timestamp"])
+    rows["source"] = "archive"
+    return rows.reset_index(drop=True)
+
+
+def sensor_messages(row):
+    """The strings mqtt_dht11_11.ino would have published for this row."""
+    messages = []
+    if pd.notna(row.get("temperature")):
+        messages.append(("temp", f"{row['temperature']:.1f}°C"))
+    if pd.notna(row.get("humidity")):
+        messages.append(("humidity", f"{row['humidity']:.1f}%"))
+    if pd.notna(row.get("gas")):
+        messages.append(("mq2gas", f"{row['gas']:.2f} ppm"))
+    return messages
+
+
+def recorded_fields(row):
+    return {k: (None if pd.isna(row.get(k)) else row.get(k)) for k in FRAME_FIELDS}
+
+
+# ---------------------------------------------------
+# Replay
+# ---------------------------------------------------
+def replay(rows, collector, speed=0.0, image_dir=None, client=None, max_sleep=1.0):
+    vclock = VirtualClock(rows["ts"].iloc[0])
+    collector.set_clock(vclock.time)
+    predictor = collector.load_models()
+    client = client or RecordingClient()
+    interval = collector.SUMMARY_INTERVAL_SECONDS
+    next_summary = rows["ts"].iloc[0] + interval
+    stats = {"rows": 0, "sensor_messages": 0, "images": 0, "recorded_frames": 0, "summaries": 0}
+
+    def deliver(device, leaf, payload):
+        topic = f"fruiture/{leaf}" if device == "default" else f"fruiture/{device}/{leaf}"
+        collector.on_message(client, None, types.SimpleNamespace(topic=topic, payload=payload))
+
+    def advance(ts):
+        nonlocal next_summary
+        while ts >= next_summary:
+            vclock.set(next_summary)
+            for session in collector.devices.sessions():
+                session.joiner.poll()
+            collector.publish_summaries(client, predictor)
+            stats["summaries"] += 1
+            next_summary += interval
+        vclock.set(ts)
+
+    start = time.perf_counter()
+    prev_ts = rows["ts"].iloc[0]
+    for row in rows.to_dict("records"):
+        ts = row["ts"]
+        if speed > 0 and ts > prev_ts:
+            time.sleep(min((ts - prev_ts) / speed, max_sleep))
+        prev_ts = ts
+        advance(ts)
+        stats["rows"] += 1
+
+        device = row["device"]
+        for leaf, payload in sensor_messages(row):
+            deliver(device, leaf, payload.encode("utf-8"))
+            stats["sensor_messages"] += 1
+
+        raw = row.get("image_path")
+        raw_path = os.path.join(image_dir, raw) if image_dir and isinstance(raw, str) else None
+        if raw_path and os.path.exists(raw_path):
+            with open(raw_path, "rb") as f:
+                deliver(device, "Base64image", base64.b64encode(f.read()))
+            # One frame at a time, so the virtual clock never runs ahead of a frame being detected
+            collector.image_pipeline.join()
+            stats["images"] += 1
+        else:
+            session = collector.get_session(device)
+            session.joiner.add_frame(ts, recorded_fields(row))
+            stats["recorded_frames"] += 1
+
+    # Flush the last frames and publish a final summary
+    advance(max(vclock.time() + collector.JOIN_TOLERANCE_SECONDS, next_summary))
+    stats["wall_s"] = round(time.perf_counter() - start, 3)
+    stats["virtual_s"] = round(vclock.time() - rows["ts"].iloc[0], 1)
+    stats["speedup"] = round(stats["virtual_s"] / stats["wall_s"], 1) if stats["wall_s"] else None
+    stats["published"] = {}
+    for topic, _ in client.published:
+        stats["published"][topic] = stats["published"].get(topic, 0) + 1
+    stats["servo_commands"] = [
+        json.loads(payload) for topic, payload in client.published if topic.endswith("servo_angle")
+    ]
+    stats["records_saved"] = {s.device_id: len(s.store) for s in collector.devices.sessions()}
+    stats["timestamp_check"] = check_timestamps(rows, collector)
+    stats["join"] = {s.device_id: s.joiner.metrics() for s in collector.devices.sessions()}
+    return stats
+
+
+def check_timestamps(rows, collector):
+    """Round trip: every buffered replayed record must carry the timestamp of one of its device's source rows."""
+    source = pd.to_datetime(rows["timestamp"], format="mixed").dt.strftime("%Y-%m-%d %H:%M:%S")
+    expected = source.groupby(rows["device"]).agg(set).to_dict()
+    checked, mismatched = 0, []
+    for session in collector.devices.sessions():
+        for record in collector.feed.recent(session.device_id, collector.LIVE_RECORDS):
+            checked += 1
+            if record.get("timestamp") not in expected.get(session.device_id, ()):
+                mismatched.append(f"{session.device_id} {record.get('timestamp')}")
+    return {"checked": checked, "mismatched": len(mismatched), "examples": mismatched[:5]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded CSV sessions through the data collector.")
+    parser.add_argument("files", nargs="*", help="session CSVs (default: data/*.csv)")
+    parser.add_argument("--group", choices=["side", "file", "single"], default="side",
+                        help="device per bowl side (left/right), per file, or one device")
+    parser.add_argument("--speed", type=float, default=0.0, help="N× real time; 0 = as fast as possible")
+    parser.add_argument("--max-sleep", type=float, default=1.0, help="cap on real seconds slept per gap")
+    parser.add_argument("--image-dir", default=None, help="folder holding the raw_*.jpg files named in image_path")
+    parser.add_argument("--mode", choices=["full", "fast"], default=None, help="detector path for images")
+    parser.add_argument("--data-dir", default=None, help="where to write CSVs/images (default: temp dir)")
+    parser.add_argument("--archive", default=None, help="replay records from this Parquet archive instead of CSVs")
+    parser.add_argument("--start", default=None, help="with --archive: first day / time to replay")
+    parser.add_argument("--end", default=None, help="with --archive: replay up to (not including) this time")
+    parser.add_argument("--devices", nargs="*", default=None, help="with --archive: devices (default: all)")
+    parser.add_argument("--broker", default=None, help="also publish summaries/servo commands to this broker")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--json", default=None, help="write the replay report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the collector's own log output")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="fruiture_replay_")
+    os.environ["FRUITURE_DATA_DIR"] = data_dir
+    if args.archive:
+        rows = load_archive_rows(args.archive, args.devices, args.start, args.end)
+        if rows.empty:
+            print(f"❌ No archived records in {args.archive} for that range")
+            return 1
+        print(f"⏪ Replaying {len(rows)} archived rows ({', '.join(rows['device'].unique())}) → {data_dir}")
+    else:
+        files = args.files or default_files()
+        rows = load_rows(files, args.group)
+        print(f"⏪ Replaying {len(rows)} rows from {len(files)} file(s) → {data_dir}")
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    forward = None
+    with quiet:
+        import data_collector_final as collector
+        if args.mode:
+            collector.DETECTOR_MODE = args.mode
+        collector.PUBLISH_PREDICTIONS = True  # no prediction service here: the replay reproduces servo commands
+        if args.broker:
+            import paho.mqtt.client as mqtt
+            forward = mqtt.Client()
+            forward.connect(args.broker, args.port, 60)
+            forward.loop_start()
+        try:
+            stats = replay(rows, collector, args.speed, args.image_dir,
+                           RecordingClient(forward), args.max_sleep)
+        finally:
+            collector.image_pipeline.stop()
+            collector.devices.close()
+            if forward is not None:
+                forward.loop_stop()
+                forward.disconnect()
+
+    print(f"✅ {stats['rows']} rows, {stats['images']} images, {stats['recorded_frames']} recorded frames")
+    print(f"🕒 {stats['virtual_s']:.0f}s of virtual time in {stats['wall_s']}s (×{stats['speedup']})")
+    print(f"💾 Records saved: {stats['records_saved']}")
+    check = stats["timestamp_check"]
+    if check["mismatched"]:
+        print(f"⚠️ {check['mismatched']}/{check['checked']} replayed records do not match a source timestamp: "
+              f"{check['examples']}")
+    print(f"📡 Published: {stats['published']} ({stats['summaries']} summary cycles)")
+    for command in stats["servo_commands"][-5:]:
+        print(f"   🤖 {command}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2, default=str)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
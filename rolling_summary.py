@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+📈 Fruiture Rolling Summary
+---------------------------------------------------------------
+Streaming replacement for re-reading esp32_data.csv every 10 minutes:
+ - Fed one completed record at a time (from on_message / image workers)
+ - O(1) running sums, counts and a monotonic-deque max per field
+ - Sliding window (last N seconds), tumbling window (records since the
+   previous summary) or all-time (window_seconds=None)
+ - summary() returns the same dict written to ml_input.json
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# summary key → (record column, statistic)
+SUMMARY_FIELDS = {
+    "average_temperature": ("temperature", "mean"),
+    "average_humidity": ("humidity", "mean"),
+    "average_gas": ("gas", "mean"),
+    "max_gas": ("gas", "max"),
+    "average_R": ("avg_R", "mean"),
+    "average_G": ("avg_G", "mean"),
+    "average_B": ("avg_B", "mean"),
+}
+
+WINDOW_MODES = ("sliding", "tumbling")
+
+
+def _as_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value  # NaN → None
+
+
+class RollingAggregator:
+    def __init__(self, window_seconds=600, mode="sliding", clock=time.time):
+        if mode not in WINDOW_MODES:
+            raise ValueError(f"Unknown window mode '{mode}', expected one of {WINDOW_MODES}")
+        self.window_seconds = window_seconds
+        self.mode = mode
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        self._columns = sorted({col for col, _ in SUMMARY_FIELDS.values()})
+        self._max_columns = sorted({col for col, stat in SUMMARY_FIELDS.values() if stat == "max"})
+        self._reset()
+
+    def _reset(self):
+        self._records = deque()                  # (ts, {column: value}) for eviction
+        self._count = 0
+        self._sums = {c: 0.0 for c in self._columns}
+        self._counts = {c: 0 for c in self._columns}
+        self._maxes = {c: deque() for c in self._max_columns}  # decreasing (ts, value)
+
+    # ---------------------------------------------------
+    # Feeding
+    # ---------------------------------------------------
+    def add(self, record, ts=None):
+        ts = self.clock() if ts is None else ts
+        values = {c: _as_float(record.get(c)) for c in self._columns}
+        with self._lock:
+            self._evict(ts)
+            self._records.append((ts, values))
+            self._count += 1
+            for c, v in values.items():
+                if v is None:
+                    continue
+                self._sums[c] += v
+                self._counts[c] += 1
+                if c in self._maxes:
+                    window = self._maxes[c]
+                    while window and window[-1][1] <= v:
+                        window.pop()
+                    window.append((ts, v))
+
+    def _evict(self, now):
+        if self.mode != "sliding" or self.window_seconds is None:
+            return
+        cutoff = now - self.window_seconds
+        while self._records and self._records[0][0] < cutoff:
+            _, values = self._records.popleft()
+            self._count -= 1
+            for c, v in values.items():
+                if v is not None:
+                    self._sums[c] -= v
+                    self._counts[c] -= 1
+        for window in self._maxes.values():
+            while window and window[0][0] < cutoff:
+                window.popleft()
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def summary(self, now=None):
+        """
+        Summary dict for the current window, or None if the window is empty.
+        In tumbling mode the window is closed (reset) after it is read.
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            self._evict(now)
+            if self._count == 0:
+                return None
+
+            summary = {
+                "timestamp": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+                "record_count": int(self._count),
+            }
+            for key, (col, stat) in SUMMARY_FIELDS.items():
+                if stat == "mean":
+                    n = self._counts[col]
+                    summary[key] = round(self._sums[col] / n, 3) if n else None
+                else:
+                    window = self._maxes[col]
+                    summary[key] = round(window[0][1], 3) if window else None
+
+            if self.mode == "tumbling":
+                self._reset()
+            return summary
+
+    def __len__(self):
+        return self._count
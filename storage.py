@@ -0,0 +1,862 @@
+# -*- coding: utf-8 -*-
+"""
+🗄️ Fruiture Storage Backends
+---------------------------------------------------------------
+One interface for everything the collector persists (sensor log, joined
+records, ML summary history), with two interchangeable backends:
+ - Writes are group-committed: append() only adds the row to an in-memory
+   buffer; a background writer thread commits it once BATCH_SIZE rows are
+   waiting or the oldest is FLUSH_SECONDS old (reads flush first, so they
+   always see every appended row); a failed batch is requeued and retried
+   with backoff, then committed row by row so only bad rows are dropped
+ - Durability: "flush" (hand batches to the OS / SQLite synchronous=NORMAL)
+   or "fsync" (fsync every batch / synchronous=FULL)
+ - SqliteStorage: one fruiture.sqlite in WAL mode (readers never block the
+   writer), (device, ts) and ts indexes, one transaction per batch,
+   per-minute count / sum / min / max rollups kept up to date on insert,
+   and a retention policy that drops old raw rows while their rollups stay
+ - CsvStorage: the original per-device CSV files (RecordStore for
+   records), each file opened once per batch; history queries are
+   answered by history_store.py
+ - Both offer append / tail / count / query / describe / flush / close;
+   store_for(device) gives the RecordStore-like view a DeviceSession uses
+ - Daily rollover: archive_before() moves every finished day into the
+   Parquet archive (parquet_archive.py) and only then deletes it from the
+   live DB / CSVs; query() answers the archived part of a range from
+   Parquet and the rest from live storage
+ - CLI: import existing CSVs into SQLite, export a table back to CSV,
+   apply retention, archive finished days
+
+Usage:
+    python storage.py import                        # CSVs in FRUITURE_DATA_DIR → fruiture.sqlite
+    python storage.py export --table sensor --device default --out sensor_log.csv
+    python storage.py retention
+    python storage.py archive --backend csv          # days before today → archive/
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from device_sessions import DEFAULT_DEVICE, device_path
+from history_store import HistoryStore, bucket_stats, format_times, merge_stats, nan_to_none, now_seconds
+from parquet_archive import ARCHIVE_DIR_NAME, ParquetArchive, query_with_archive
+from record_store import RECORD_COLUMNS, RecordStore, _coerce, split_csv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("FRUITURE_DATA_DIR", BASE_DIR)
+SQLITE_FILE = os.path.join(DATA_DIR, "fruiture.sqlite")
+ARCHIVE_DIR = os.path.join(DATA_DIR, ARCHIVE_DIR_NAME)
+
+BATCH_SIZE = 200
+FLUSH_SECONDS = 2.0
+COMMIT_RETRIES = 5            # failed batches are retried this often before going row by row
+RETRY_BACKOFF_SECONDS = 0.5   # doubled after every failed attempt …
+MAX_BACKOFF_SECONDS = 10.0    # … up to this
+DURABILITY = "flush"   # "flush" | "fsync"
+DURABILITY_MODES = ("flush", "fsync")
+ROLLUP_SECONDS = 60
+MAX_LIMIT = 10000
+DAY = 86400
+
+SUMMARY_COLUMNS = [
+    "timestamp", "record_count",
+    "average_temperature", "average_humidity",
+    "average_gas", "max_gas",
+    "average_R", "average_G", "average_B",
+    "predicted_day", "confidence", "servo_angle"
+]
+
+
+class Table:
+    def __init__(self, name, csv_file, columns, text_columns=(), rollup=False,
+                 retention_days=None, rollup_retention_days=None):
+        self.name = name
+        self.csv_file = csv_file      # default-device CSV name (CsvStorage / export)
+        self.columns = list(columns)  # CSV header, "timestamp" first
+        self.value_columns = [c for c in self.columns[1:] if c not in text_columns]
+        self.text_columns = list(text_columns)
+        self.rollup = rollup
+        self.retention_days = retention_days
+        self.rollup_retention_days = rollup_retention_days
+
+
+# Raw 2-second sensor rows are kept 30 days, their per-minute rollups a year;
+# records (which point at images) and summaries are small and kept forever.
+TABLES = {t.name: t for t in (
+    Table("sensor", "sensor_log.csv", ["timestamp", "temperature", "humidity", "gas"],
+          rollup=True, retention_days=30, rollup_retention_days=365),
+    Table("records", "esp32_data.csv", RECORD_COLUMNS,
+          text_columns=("image_path", "processed_image_path", "bbox", "contour"), rollup=True),
+    Table("summaries", "ml_input_history.csv", SUMMARY_COLUMNS),
+)}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def naive_ts(timestamp):
+    """'YYYY-MM-DD HH:MM:SS' (local) → naive seconds, as history_store.py uses."""
+    return int((datetime.fromisoformat(str(timestamp)) - EPOCH).total_seconds())
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def get_table(name):
+    try:
+        return TABLES[name]
+    except KeyError:
+        raise ValueError(f"Unknown table '{name}', expected one of {sorted(TABLES)}") from None
+
+
+class DeviceTable:
+    """RecordStore-shaped view of one device's rows in a storage backend."""
+
+    def __init__(self, storage, table, device_id):
+        self.storage = storage
+        self.table = table
+        self.device_id = device_id
+        self.path = f"{getattr(storage, 'path', '')}#{table}/{device_id}"
+
+    def append(self, record):
+        self.storage.append(self.table, self.device_id, record)
+
+    def tail(self, n=10):
+        return self.storage.tail(self.table, self.device_id, n)
+
+    def __len__(self):
+        return self.storage.count(self.table, self.device_id)
+
+    def flush(self):
+        self.storage.flush()
+
+    def close(self):
+        self.storage.flush()
+
+
+def check_durability(durability):
+    if durability not in DURABILITY_MODES:
+        raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_MODES}")
+    return durability
+
+
+def run_query(storage, live_query, name, device_id, start, end, resolution, columns, limit, cursor):
+    """Parameter checks + archive / live split shared by both backends (HistoryStore.query's result shape)."""
+    t = get_table(name)
+    end = now_seconds() + 1 if end is None else end
+    start = end - DAY if start is None else start
+    if start >= end:
+        raise ValueError("start must be before end")
+    columns = list(columns or t.value_columns)
+    unknown = [c for c in columns if c not in t.value_columns]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown} for '{name}', expected some of {t.value_columns}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    t0 = time.perf_counter()
+    data, next_cursor = query_with_archive(storage.archive, live_query, t, device_id, start, end, resolution,
+                                           columns, limit, cursor)
+    return {
+        "series": name,
+        "device": device_id,
+        "start": format_times([start])[0],
+        "end": format_times([end])[0],
+        "resolution": resolution or "raw",
+        **data,
+        "next_cursor": next_cursor,
+        "query_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+def archive_values(t, header, rows):
+    """CSV rows (lists of strings) → (seconds, float matrix, text columns) for ParquetArchive.write."""
+    index = {c: i for i, c in enumerate(header)}
+    seconds = [naive_ts(r[0]) for r in rows]
+    values = np.array([[_float(r, index.get(c)) for c in t.value_columns] for r in rows], dtype=np.float64)
+    texts = {c: [(r[index[c]] or None) if c in index and index[c] < len(r) else None for r in rows]
+             for c in t.text_columns}
+    return seconds, values.reshape(len(rows), len(t.value_columns)), texts
+
+
+def _float(row, i):
+    try:
+        return float(row[i])
+    except (TypeError, ValueError, IndexError):
+        return np.nan
+
+
+def rollover_cutoff(now=None):
+    """Midnight of today (naive seconds): everything before it is a finished day."""
+    now = now_seconds() if now is None else now
+    return now - now % DAY
+
+
+# ---------------------------------------------------
+# Group commit
+# ---------------------------------------------------
+class GroupCommitWriter:
+    """
+    add() appends (table, device, row) to a buffer and returns; the writer
+    thread passes the whole buffer to commit(batch) when it holds
+    batch_size rows, its oldest row is flush_seconds old, or flush() asks.
+    A batch whose commit raises goes back to the head of the buffer and is
+    retried with exponential backoff; after `retries` failed attempts its
+    rows are committed one by one and only the rows that still fail are lost.
+    """
+
+    def __init__(self, commit, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS, name="storage-writer",
+                 retries=COMMIT_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+        self.commit = commit
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = flush_seconds
+        self.retries = max(1, int(retries))
+        self.backoff = backoff
+        self._attempts = 0    # consecutive failed commits of the batch at the head of the buffer
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._oldest = None
+        self._added = 0       # rows ever added …
+        self._done = 0        # … and committed (or given up on)
+        self._flush_to = 0    # flush() wants everything up to this row committed now
+        self._stop = False
+        self.stats = {"batches": 0, "rows": 0, "failed": 0, "retries": 0, "max_batch": 0,
+                      "last_batch_ms": None}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, item):
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("Storage writer is closed")
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(item)
+            self._added += 1
+            if len(self._buffer) == 1 or len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()  # first row starts the flush timer; a full batch goes now
+
+    def _due(self):
+        return (len(self._buffer) >= self.batch_size or self._flush_to > self._done or self._stop
+                or time.monotonic() - self._oldest >= self.flush_seconds)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._buffer and self._due()):
+                    if self._stop and not self._buffer:
+                        return
+                    timeout = None if not self._buffer else max(0.0, self._oldest + self.flush_seconds - time.monotonic())
+                    self._cond.wait(timeout)
+                batch, self._buffer = self._buffer, []
+
+            start = time.perf_counter()
+            try:
+                self.commit(batch)
+            except Exception as e:
+                self._attempts += 1
+                if self._attempts < self.retries:
+                    self._requeue(batch, e)
+                    continue
+                print(f"⚠️ Storage write failed {self._attempts} times, committing {len(batch)} rows one by one:", e)
+                self._commit_rows(batch)
+            else:
+                self.stats["batches"] += 1
+                self.stats["rows"] += len(batch)
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+                self.stats["last_batch_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            self._attempts = 0
+            with self._cond:
+                self._done += len(batch)
+                self._cond.notify_all()
+
+    def _requeue(self, batch, error):
+        """Put a failed batch back in front of newer rows and wait before the next attempt."""
+        delay = min(self.backoff * 2 ** (self._attempts - 1), MAX_BACKOFF_SECONDS)
+        self.stats["retries"] += 1
+        print(f"⚠️ Storage write failed ({error}); retrying {len(batch)} rows in {delay:.1f}s "
+              f"(attempt {self._attempts}/{self.retries})")
+        with self._cond:
+            self._buffer[:0] = batch
+            self._oldest = time.monotonic() - self.flush_seconds  # due again as soon as the backoff ends
+        time.sleep(delay)
+
+    def _commit_rows(self, batch):
+        """Last resort: one commit per row, so a single bad row can't sink the rest."""
+        for item in batch:
+            try:
+                self.commit([item])
+                self.stats["rows"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print("⚠️ Storage write failed, row lost:", e)
+        self.stats["batches"] += 1
+
+    def flush(self):
+        """Block until every row added before this call is committed."""
+        with self._cond:
+            target = self._added
+            if self._done >= target:
+                return
+            self._flush_to = max(self._flush_to, target)
+            self._cond.notify_all()
+            while self._done < target:
+                self._cond.wait()
+
+    def pending(self):
+        with self._cond:
+            return self._added - self._done
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def metrics(self):
+        return {"pending": self.pending(), **self.stats}
+
+
+# ---------------------------------------------------
+# SQLite
+# ---------------------------------------------------
+class SqliteStorage:
+    def __init__(self, path=SQLITE_FILE, tables=TABLES, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 durability=DURABILITY, archive=None):
+        self.path = path
+        self.tables = dict(tables)
+        self.durability = check_durability(durability)
+        self.archive = archive
+        self._write = self._connect()
+        self._write.execute(f"PRAGMA synchronous={'FULL' if durability == 'fsync' else 'NORMAL'}")
+        self._write_lock = threading.Lock()   # writer thread vs retention
+        self._local = threading.local()       # one read connection per thread (WAL: reads never block)
+        self._counts = {}                     # (table, device) → row count, kept current on append
+        self._count_lock = threading.Lock()
+        self.stats = {"deleted": 0, "archived": 0}
+        self._create_schema()
+        self.writer = GroupCommitWriter(self._commit, batch_size, flush_seconds, "sqlite-writer")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: a power cut loses at most the last batch
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _create_schema(self):
+        with self._write_lock:
+            for t in self.tables.values():
+                cols = ", ".join(f"{quote(c)} REAL" for c in t.value_columns)
+                text = "".join(f", {quote(c)} TEXT" for c in t.text_columns)
+                self._write.execute(f"CREATE TABLE IF NOT EXISTS {t.name} (device TEXT NOT NULL, ts INTEGER NOT NULL, "
+                                    f"timestamp TEXT NOT NULL, {cols}{text})")
+                present = {r[1] for r in self._write.execute(f"PRAGMA table_info({t.name})")}
+                for c in t.value_columns + t.text_columns:  # columns added since the file was created
+                    if c not in present:
+                        kind = "TEXT" if c in t.text_columns else "REAL"
+                        self._write.execute(f"ALTER TABLE {t.name} ADD COLUMN {quote(c)} {kind}")
+                self._write.execute(f"CREATE INDEX IF NOT EXISTS {t.name}_device_ts ON {t.name} (device, ts)")
+                self._write.execute(f"CREATE INDEX IF NOT EXISTS {t.name}_ts ON {t.name} (ts)")
+                if t.rollup:
+                    stats = ", ".join(f"{quote(c + suffix)} REAL" for c in t.value_columns
+                                      for suffix in ("_n", "_sum", "_min", "_max"))
+                    self._write.execute(f"CREATE TABLE IF NOT EXISTS {t.name}_1m (device TEXT NOT NULL, "
+                                        f"bucket INTEGER NOT NULL, {stats}, PRIMARY KEY (device, bucket)) WITHOUT ROWID")
+
+    # ---------------------------------------------------
+    # Writing (group commit)
+    # ---------------------------------------------------
+    def append(self, table, device_id, row):
+        t = self.tables[table]
+        values = [row.get(c) for c in t.value_columns]
+        values = [None if v is None or v == "" or v != v else float(v) for v in values]
+        item = (device_id, naive_ts(row["timestamp"]), str(row["timestamp"]),
+                *values, *[row.get(c) for c in t.text_columns])
+        with self._count_lock:
+            self.writer.add((table, item))
+            if (table, device_id) in self._counts:
+                self._counts[(table, device_id)] += 1
+
+    def flush(self):
+        self.writer.flush()
+
+    def _commit(self, batch):
+        """Writer thread: one transaction for the whole batch."""
+        by_table = {}
+        for table, item in batch:
+            by_table.setdefault(table, []).append(item)
+        with self._write_lock:
+            self._write.execute("BEGIN IMMEDIATE")
+            try:
+                for name, items in by_table.items():
+                    t = self.tables[name]
+                    names = ["device", "ts", "timestamp"] + t.value_columns + t.text_columns
+                    self._write.executemany(
+                        f"INSERT INTO {name} ({', '.join(quote(c) for c in names)}) "
+                        f"VALUES ({', '.join('?' * len(names))})", items)
+                    if t.rollup:
+                        self._update_rollup(t, items)
+                self._write.execute("COMMIT")
+            except Exception:
+                self._write.execute("ROLLBACK")
+                raise
+
+    def _update_rollup(self, t, items):
+        k = len(t.value_columns)
+        stat_cols = [c + s for c in t.value_columns for s in ("_n", "_sum", "_min", "_max")]
+        select = f"SELECT {', '.join(quote(c) for c in stat_cols)} FROM {t.name}_1m WHERE device = ? AND bucket = ?"
+        upsert = (f"INSERT OR REPLACE INTO {t.name}_1m (device, bucket, {', '.join(quote(c) for c in stat_cols)}) "
+                  f"VALUES (?, ?, {', '.join('?' * len(stat_cols))})")
+        by_device = {}
+        for item in items:
+            by_device.setdefault(item[0], []).append(item)
+        for device, rows in by_device.items():
+            seconds = np.array([r[1] for r in rows], dtype=np.int64)
+            values = np.array([[np.nan if v is None else v for v in r[3:3 + k]] for r in rows], dtype=np.float64)
+            keys, stats = bucket_stats(seconds, values, ROLLUP_SECONDS)
+            for key, stat in zip(keys.tolist(), stats):
+                old = self._write.execute(select, (device, key)).fetchone()
+                if old is not None:
+                    stat = merge_stats(np.array(old, dtype=np.float64).reshape(k, 4).T, stat)
+                flat = [None if v != v else float(v) for v in stat.T.reshape(-1)]
+                self._write.execute(upsert, (device, key, *flat))
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def store_for(self, device_id):
+        return DeviceTable(self, "records", device_id)
+
+    def count(self, table, device_id):
+        key = (table, device_id)
+        with self._count_lock:  # no appends between the flush and the COUNT
+            if key not in self._counts:
+                self.flush()
+                self._counts[key] = self._reader().execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE device = ?", (device_id,)).fetchone()[0]
+            return self._counts[key]
+
+    def tail(self, table, device_id, n=10):
+        self.flush()
+        t = self.tables[table]
+        cols = t.columns
+        rows = self._reader().execute(
+            f"SELECT {', '.join(quote(c) for c in cols)} FROM {table} WHERE device = ? "
+            f"ORDER BY ts DESC, rowid DESC LIMIT ?", (device_id, n)).fetchall()
+        return [dict(zip(cols, row)) for row in reversed(rows)]
+
+    def query(self, name, device_id, start=None, end=None, resolution=None, columns=None,
+              limit=1000, cursor=None):
+        """Same contract and result shape as HistoryStore.query."""
+        self.flush()
+        db = self._reader()
+        t = get_table(name)
+        columns = list(columns or t.value_columns)
+
+        def live(start, end, cursor, limit):
+            if resolution is None:
+                return self._raw(db, t, device_id, start, end, columns, limit, cursor)
+            return self._buckets(db, t, device_id, start, end, resolution, columns, limit, cursor)
+
+        return run_query(self, live, name, device_id, start, end, resolution, columns, limit, cursor)
+
+    def _raw(self, db, t, device_id, start, end, columns, limit, cursor):
+        after_ts, after_id = (int(x) for x in cursor.split(":")) if cursor else (start - 1, 0)
+        rows = db.execute(
+            f"SELECT ts, rowid, {', '.join(quote(c) for c in columns)} FROM {t.name} "
+            f"WHERE device = ? AND ts >= ? AND ts < ? AND (ts > ? OR (ts = ? AND rowid > ?)) "
+            f"ORDER BY ts, rowid LIMIT ?",
+            (device_id, start, end, after_ts, after_ts, after_id, limit + 1)).fetchall()
+        next_cursor = f"{rows[limit - 1][0]}:{rows[limit - 1][1]}" if len(rows) > limit else None
+        rows = rows[:limit]
+        return {"t": format_times([r[0] for r in rows]),
+                "columns": {c: [None if r[j + 2] is None else round(r[j + 2], 4) for r in rows]
+                            for j, c in enumerate(columns)}}, next_cursor
+
+    def _buckets(self, db, t, device_id, start, end, resolution, columns, limit, cursor):
+        if cursor is not None:
+            start = int(cursor)
+        start -= start % resolution
+        if t.rollup and resolution % ROLLUP_SECONDS == 0:
+            source, time_col = f"{t.name}_1m", "bucket"
+            aggs = [f"SUM({quote(c + '_n')}), SUM({quote(c + '_sum')}), MIN({quote(c + '_min')}), "
+                    f"MAX({quote(c + '_max')})" for c in columns]
+        else:
+            source, time_col = t.name, "ts"
+            aggs = [f"COUNT({quote(c)}), SUM({quote(c)}), MIN({quote(c)}), MAX({quote(c)})" for c in columns]
+        rows = db.execute(
+            f"SELECT {time_col} - {time_col} % ? AS b, {', '.join(aggs)} FROM {source} "
+            f"WHERE device = ? AND {time_col} >= ? AND {time_col} < ? GROUP BY b ORDER BY b LIMIT ?",
+            (resolution, device_id, start, end, limit + 1)).fetchall()
+        next_cursor = str(rows[limit][0]) if len(rows) > limit else None
+        rows = rows[:limit]
+        stats = np.array([[np.nan if v is None else v for v in r[1:]] for r in rows],
+                         dtype=np.float64).reshape(len(rows), len(columns), 4)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = stats[:, :, 1] / stats[:, :, 0]
+        return {
+            "t": format_times([r[0] for r in rows]),
+            "count": np.nan_to_num(stats[:, :, 0]).max(axis=1).astype(int).tolist() if rows else [],
+            "columns": {c: {"min": nan_to_none(stats[:, j, 2]), "max": nan_to_none(stats[:, j, 3]),
+                            "mean": nan_to_none(mean[:, j])} for j, c in enumerate(columns)},
+        }, next_cursor
+
+    def describe(self, device_id):
+        self.flush()
+        db = self._reader()
+        out = {}
+        for t in self.tables.values():
+            n, first, last = db.execute(f"SELECT COUNT(*), MIN(ts), MAX(ts) FROM {t.name} WHERE device = ?",
+                                        (device_id,)).fetchone()
+            out[t.name] = {"rows": n, "columns": t.value_columns,
+                           "first": format_times([first])[0] if first is not None else None,
+                           "last": format_times([last])[0] if last is not None else None}
+            if self.archive is not None:
+                out[t.name]["archive"] = self.archive.describe(t.name, device_id)
+        return out
+
+    # ---------------------------------------------------
+    # Retention / export
+    # ---------------------------------------------------
+    def apply_retention(self, now=None):
+        """Delete raw rows (and rollups) older than each table's retention; returns rows deleted."""
+        now = now_seconds() if now is None else now
+        self.flush()
+        deleted = 0
+        with self._write_lock:
+            for t in self.tables.values():
+                if t.retention_days is not None:
+                    deleted += self._write.execute(f"DELETE FROM {t.name} WHERE ts < ?",
+                                                   (now - t.retention_days * DAY,)).rowcount
+                if t.rollup and t.rollup_retention_days is not None:
+                    deleted += self._write.execute(f"DELETE FROM {t.name}_1m WHERE bucket < ?",
+                                                   (now - t.rollup_retention_days * DAY,)).rowcount
+            with self._count_lock:
+                self._counts.clear()
+            self.stats["deleted"] += deleted
+        if deleted:
+            print(f"🧹 Retention removed {deleted} rows from {self.path}")
+        return deleted
+
+    def archive_before(self, cutoff=None):
+        """
+        Move raw rows older than cutoff (default: today's midnight) into the
+        Parquet archive, then delete them here; rollups stay. Returns
+        {table: {device: rows}}.
+        """
+        if self.archive is None:
+            raise RuntimeError("No archive configured for this storage")
+        cutoff = rollover_cutoff() if cutoff is None else cutoff
+        self.flush()
+        db = self._reader()
+        moved = {}
+        for t in self.tables.values():
+            devices = [r[0] for r in db.execute(f"SELECT DISTINCT device FROM {t.name} WHERE ts < ?", (cutoff,))]
+            for device_id in devices:
+                rows = db.execute(
+                    f"SELECT rowid, ts, {', '.join(quote(c) for c in t.value_columns + t.text_columns)} "
+                    f"FROM {t.name} WHERE device = ? AND ts < ? ORDER BY ts, rowid", (device_id, cutoff)).fetchall()
+                k = len(t.value_columns)
+                values = np.array([[np.nan if v is None else v for v in r[2:2 + k]] for r in rows],
+                                  dtype=np.float64).reshape(len(rows), k)
+                texts = {c: [r[2 + k + j] for r in rows] for j, c in enumerate(t.text_columns)}
+                self.archive.write(t, device_id, [r[1] for r in rows], values, texts)
+                with self._write_lock:  # only the rows just archived, even if late ones arrived meanwhile
+                    self._write.execute(f"DELETE FROM {t.name} WHERE device = ? AND ts < ? AND rowid <= ?",
+                                        (device_id, cutoff, max(r[0] for r in rows)))
+                moved.setdefault(t.name, {})[device_id] = len(rows)
+                self.stats["archived"] += len(rows)
+        with self._count_lock:
+            self._counts.clear()
+        report_archive(moved, self.path)
+        return moved
+
+    def devices(self):
+        return sorted({r[0] for t in self.tables for r in
+                       self._reader().execute(f"SELECT DISTINCT device FROM {t}")})
+
+    def export_csv(self, table, device_id, out_file):
+        """Write one device's rows of a table in the original CSV layout."""
+        t = get_table(table)
+        self.flush()
+        cur = self._reader().execute(
+            f"SELECT {', '.join(quote(c) for c in t.columns)} FROM {table} WHERE device = ? ORDER BY ts, rowid",
+            (device_id,))
+        n = 0
+        with open(out_file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(t.columns)
+            for row in cur:
+                writer.writerow(["" if v is None else v for v in row])
+                n += 1
+        print(f"📤 Exported {n} {table} rows for '{device_id}' → {out_file}")
+        return n
+
+    def metrics(self):
+        return {"backend": "sqlite", "path": self.path, "durability": self.durability,
+                **self.writer.metrics(), **self.stats}
+
+    def close(self):
+        self.writer.close()
+        with self._write_lock:
+            self._write.close()
+
+
+# ---------------------------------------------------
+# CSV (original layout)
+# ---------------------------------------------------
+class CsvStorage:
+    """Per-device CSV files, exactly as the collector always wrote them."""
+
+    def __init__(self, data_dir=DATA_DIR, tables=TABLES, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 durability=DURABILITY, archive=None):
+        self.data_dir = data_dir
+        self.tables = dict(tables)
+        self.durability = check_durability(durability)
+        self.archive = archive
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()  # writer thread vs archive rollover rewriting a file
+        self.stats = {"archived": 0}
+        self.history = HistoryStore({name: (lambda device, t=t: self.csv_path(t.name, device))
+                                     for name, t in self.tables.items()})
+        self.writer = GroupCommitWriter(self._commit, batch_size, flush_seconds, "csv-writer")
+
+    def csv_path(self, table, device_id):
+        return device_path(os.path.join(self.data_dir, self.tables[table].csv_file), device_id)
+
+    def store_for(self, device_id):
+        with self._lock:
+            store = self._stores.get(device_id)
+            if store is None:
+                store = self._stores[device_id] = RecordStore(self.csv_path("records", device_id),
+                                                              fsync=self.durability == "fsync")
+            return store
+
+    def append(self, table, device_id, row):
+        if table == "records":
+            return self.store_for(device_id).append(row)
+        # Values are copied now: callers (e.g. the collector's live entry) keep mutating their dict
+        self.writer.add((table, device_id, ["" if row.get(c) is None else row.get(c)
+                                            for c in self.tables[table].columns]))
+
+    def _commit(self, batch):
+        """Writer thread: each file is opened once per batch."""
+        by_path = {}
+        for table, device_id, values in batch:
+            by_path.setdefault((table, self.csv_path(table, device_id)), []).append(values)
+        with self._file_lock:
+            sizes = {}
+            try:
+                for (table, path), rows in by_path.items():
+                    sizes[path] = os.path.getsize(path) if os.path.exists(path) else 0
+                    self._write_rows(table, path, rows)
+            except Exception:
+                # Undo the files already written so the writer's retry doesn't duplicate rows
+                for path, size in sizes.items():
+                    if os.path.exists(path):
+                        with open(path, "r+b") as f:
+                            f.truncate(size)
+                raise
+
+    def _write_rows(self, table, path, rows):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(self.tables[table].columns)
+            writer.writerows(rows)
+            if self.durability == "fsync":
+                f.flush()
+                os.fsync(f.fileno())
+
+    def count(self, table, device_id):
+        if table == "records":
+            return len(self.store_for(device_id))
+        self.writer.flush()
+        return self.history.series(table, device_id).rows
+
+    def tail(self, table, device_id, n=10):
+        if table == "records":
+            return self.store_for(device_id).tail(n)
+        self.writer.flush()
+        path = self.csv_path(table, device_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))[-n:]
+        return [{k: _coerce(v) for k, v in r.items()} for r in rows]
+
+    def query(self, name, device_id, start=None, end=None, resolution=None, columns=None,
+              limit=1000, cursor=None):
+        self.flush()
+        columns = list(columns or get_table(name).value_columns)
+
+        def live(start, end, cursor, limit):
+            if not os.path.exists(self.csv_path(name, device_id)):  # everything is in the archive
+                if resolution is None:
+                    return {"t": [], "columns": {c: [] for c in columns}}, None
+                return {"t": [], "count": [], "columns": {c: {"min": [], "max": [], "mean": []} for c in columns}}, None
+            result = self.history.query(name, device_id, start, end, resolution, columns, limit, cursor)
+            return {k: result[k] for k in ("t", "count", "columns") if k in result}, result["next_cursor"]
+
+        return run_query(self, live, name, device_id, start, end, resolution, columns, limit, cursor)
+
+    def describe(self, device_id):
+        self.flush()
+        out = self.history.describe(device_id)
+        if self.archive is not None:
+            for name in out:
+                out[name]["archive"] = self.archive.describe(name, device_id)
+        return out
+
+    def devices(self):
+        found = set()
+        for t in self.tables.values():
+            root, ext = os.path.splitext(t.csv_file)
+            for name in os.listdir(self.data_dir):
+                if name == t.csv_file:
+                    found.add(DEFAULT_DEVICE)
+                elif name.startswith(root + "_") and name.endswith(ext):
+                    found.add(name[len(root) + 1:-len(ext)])
+        return sorted(found)
+
+    def archive_before(self, cutoff=None):
+        """Move rows older than cutoff (default: today's midnight) into the archive, then drop them from the CSVs."""
+        if self.archive is None:
+            raise RuntimeError("No archive configured for this storage")
+        cutoff = rollover_cutoff() if cutoff is None else cutoff
+        cutoff_text = format_times([cutoff])[0]
+        self.flush()
+        moved = {}
+        for t in self.tables.values():
+            for device_id in self.devices():
+                path = self.csv_path(t.name, device_id)
+
+                def to_archive(header, rows, t=t, device_id=device_id):
+                    self.archive.write(t, device_id, *archive_values(t, header, rows))
+
+                if t.name == "records":
+                    if not os.path.exists(path):
+                        continue
+                    n = self.store_for(device_id).truncate_before(cutoff_text, to_archive)
+                else:
+                    with self._file_lock:
+                        n = split_csv(path, cutoff_text, to_archive)
+                if n:
+                    moved.setdefault(t.name, {})[device_id] = n
+                    self.stats["archived"] += n
+        report_archive(moved, self.data_dir)
+        return moved
+
+    def flush(self):
+        self.writer.flush()
+        for store in list(self._stores.values()):
+            store.flush()
+
+    def apply_retention(self, now=None):
+        return 0  # CSV files are append-only; archive them instead
+
+    def metrics(self):
+        return {"backend": "csv", "path": self.data_dir, "durability": self.durability,
+                **self.writer.metrics(), **self.stats}
+
+    def close(self):
+        self.writer.close()
+        for store in list(self._stores.values()):
+            store.close()
+
+
+def open_storage(backend, data_dir=DATA_DIR, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 durability=DURABILITY, archive_dir=None):
+    """archive_dir: Parquet archive for daily rollover and old-range queries (None = no archive)."""
+    archive = ParquetArchive(archive_dir) if archive_dir else None
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(data_dir, os.path.basename(SQLITE_FILE)), batch_size=batch_size,
+                             flush_seconds=flush_seconds, durability=durability, archive=archive)
+    if backend == "csv":
+        return CsvStorage(data_dir, batch_size=batch_size, flush_seconds=flush_seconds, durability=durability,
+                          archive=archive)
+    raise ValueError(f"Unknown storage backend '{backend}', expected 'sqlite' or 'csv'")
+
+
+def report_archive(moved, where):
+    for table, devices in moved.items():
+        for device_id, n in devices.items():
+            print(f"🧊 Archived {n} {table} rows for '{device_id}' from {where}")
+
+
+# ---------------------------------------------------
+# CLI
+# ---------------------------------------------------
+def import_csvs(storage, data_dir=DATA_DIR):
+    """Load the collector's existing CSVs (every device) into a SqliteStorage."""
+    for t in storage.tables.values():
+        root, ext = os.path.splitext(t.csv_file)
+        for name in sorted(os.listdir(data_dir)):
+            if not (name == t.csv_file or (name.startswith(root + "_") and name.endswith(ext))):
+                continue
+            device = DEFAULT_DEVICE if name == t.csv_file else name[len(root) + 1:-len(ext)]
+            n = 0
+            with open(os.path.join(data_dir, name), newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if row.get("timestamp"):
+                        storage.append(t.name, device, row)
+                        n += 1
+            storage.flush()
+            print(f"📥 {name}: {n} rows → {t.name} ({device})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fruiture storage maintenance.")
+    parser.add_argument("command", choices=["import", "export", "retention", "archive"])
+    parser.add_argument("--db", default=SQLITE_FILE)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--backend", choices=["sqlite", "csv"], default="sqlite", help="storage to archive from")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--before", default=None,
+                        help="archive rows before this day (YYYY-MM-DD, default: today)")
+    parser.add_argument("--table", choices=sorted(TABLES), default="sensor")
+    parser.add_argument("--device", default=DEFAULT_DEVICE)
+    parser.add_argument("--out", help="CSV file for export (default: the table's original file name)")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        if args.backend == "csv":
+            storage = CsvStorage(args.data_dir, archive=ParquetArchive(args.archive_dir))
+        else:
+            storage = SqliteStorage(args.db, archive=ParquetArchive(args.archive_dir))
+        try:
+            storage.archive_before(naive_ts(args.before + " 00:00:00") if args.before else None)
+        finally:
+            storage.close()
+        return
+
+    storage = SqliteStorage(args.db)
+    try:
+        if args.command == "import":
+            import_csvs(storage, args.data_dir)
+        elif args.command == "export":
+            out = args.out or device_path(TABLES[args.table].csv_file, args.device)
+            storage.export_csv(args.table, args.device, out)
+        else:
+            storage.apply_retention()
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
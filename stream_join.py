@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+🔗 Fruiture Stream Join
+---------------------------------------------------------------
+Pairs each camera frame with the sensor samples taken around it instead
+of "whatever was seen last":
+ - Time-indexed buffer per sensor channel (bisect lookups, pruned by age)
+ - A frame is joined once every channel has a sample at/after the frame
+   time, or once its tolerance window has passed
+ - "nearest" picks the closest sample within ±tolerance seconds,
+   "interpolate" linearly interpolates between the samples around it
+ - Frames without a sample inside the tolerance are counted as unmatched
+   and still saved with empty sensor fields (their raw / processed images
+   are already on disk); with keep_unmatched=False they are dropped and
+   the image files they leave behind are counted as orphaned_files
+ - Join-latency (frame arrival → record emitted) and skew metrics
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+
+JOIN_MODES = ("nearest", "interpolate")
+DEFAULT_CHANNELS = ("temperature", "humidity", "gas")
+
+
+class SensorBuffer:
+    """Samples for one channel, kept sorted by timestamp."""
+
+    def __init__(self):
+        self.times = []
+        self.values = []
+
+    def add(self, ts, value):
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.values.append(value)
+        else:  # late / out-of-order sample
+            idx = bisect_left(self.times, ts)
+            self.times.insert(idx, ts)
+            self.values.insert(idx, value)
+
+    def prune(self, cutoff):
+        idx = bisect_left(self.times, cutoff)
+        if idx:
+            del self.times[:idx]
+            del self.values[:idx]
+
+    def latest_time(self):
+        return self.times[-1] if self.times else None
+
+    def around(self, ts):
+        """(before_ts, before_val, after_ts, after_val) bracketing ts; missing sides are None."""
+        idx = bisect_left(self.times, ts)
+        before = (self.times[idx - 1], self.values[idx - 1]) if idx > 0 else (None, None)
+        if idx < len(self.times):
+            after = (self.times[idx], self.values[idx])
+        else:
+            after = (None, None)
+        return before + after
+
+    def lookup(self, ts, tolerance, mode):
+        """Joined value for ts, the skew it was taken at, or (None, None)."""
+        t0, v0, t1, v1 = self.around(ts)
+        ok0 = t0 is not None and ts - t0 <= tolerance
+        ok1 = t1 is not None and t1 - ts <= tolerance
+        if mode == "interpolate" and ok0 and ok1:
+            if t1 == t0:
+                return v1, 0.0
+            w = (ts - t0) / (t1 - t0)
+            return round(v0 + (v1 - v0) * w, 3), max(ts - t0, t1 - ts)
+        if ok0 and (not ok1 or ts - t0 <= t1 - ts):
+            return v0, ts - t0
+        if ok1:
+            return v1, t1 - ts
+        return None, None
+
+
+class StreamJoiner:
+    """
+    Joins frames with sensor channels. on_record(record, ts) is called
+    (under the joiner lock, in frame order) for every joined frame, and
+    for unmatched frames too (sensor fields None) unless keep_unmatched=False.
+    """
+
+    def __init__(self, on_record, channels=DEFAULT_CHANNELS, tolerance=10.0,
+                 mode="interpolate", horizon=300.0, clock=time.time, keep_unmatched=True):
+        if mode not in JOIN_MODES:
+            raise ValueError(f"Unknown join mode '{mode}', expected one of {JOIN_MODES}")
+        self.on_record = on_record
+        self.channels = tuple(channels)
+        self.tolerance = tolerance
+        self.mode = mode
+        self.horizon = max(horizon, tolerance * 2)
+        self.clock = clock
+        self.keep_unmatched = keep_unmatched
+
+        self._lock = threading.Lock()
+        self._buffers = {c: SensorBuffer() for c in self.channels}
+        self._pending = deque()   # (frame_ts, fields, arrived_monotonic), ordered by frame_ts
+        self._stats = {"frames": 0, "joined": 0, "unmatched": 0, "orphaned_files": 0, "samples": 0}
+        self._latencies = deque(maxlen=512)
+        self._max_skew = 0.0
+
+    # ---------------------------------------------------
+    # Inputs
+    # ---------------------------------------------------
+    def add_sample(self, channel, ts, value):
+        if channel not in self._buffers:
+            return
+        with self._lock:
+            self._buffers[channel].add(ts, value)
+            self._stats["samples"] += 1
+            self._resolve(self.clock())
+
+    def add_frame(self, ts, fields):
+        with self._lock:
+            self._stats["frames"] += 1
+            entry = (ts, fields, time.monotonic())
+            if not self._pending or ts >= self._pending[-1][0]:
+                self._pending.append(entry)
+            else:
+                insort(self._pending, entry, key=lambda e: e[0])
+            self._resolve(self.clock())
+
+    def poll(self, now=None):
+        """Flush frames whose tolerance window has passed (call periodically)."""
+        with self._lock:
+            self._resolve(self.clock() if now is None else now)
+
+    # ---------------------------------------------------
+    # Join
+    # ---------------------------------------------------
+    def _ready(self, frame_ts, now):
+        if now - frame_ts >= self.tolerance:
+            return True
+        return all((b.latest_time() is not None and b.latest_time() >= frame_ts)
+                   for b in self._buffers.values())
+
+    def _resolve(self, now):
+        while self._pending and self._ready(self._pending[0][0], now):
+            frame_ts, fields, arrived = self._pending.popleft()
+            record = dict(fields)
+            skew = 0.0
+            matched = True
+            for channel, buf in self._buffers.items():
+                value, channel_skew = buf.lookup(frame_ts, self.tolerance, self.mode)
+                if value is None:
+                    matched = False
+                    break
+                record[channel] = value
+                skew = max(skew, channel_skew)
+
+            if not matched:
+                self._stats["unmatched"] += 1
+                if not self.keep_unmatched:
+                    # raw_<ts>.jpg (and any processed overlay) stay on disk with no record pointing at them
+                    self._stats["orphaned_files"] += sum(
+                        1 for k in ("image_path", "processed_image_path") if fields.get(k))
+                    print(f"⚠️ Frame at {frame_ts:.1f} has no sensor samples within ±{self.tolerance}s; not saved")
+                    continue
+                record.update({c: None for c in self.channels})
+                print(f"⚠️ Frame at {frame_ts:.1f} has no sensor samples within ±{self.tolerance}s; "
+                      f"saved without sensor readings")
+                self.on_record(record, frame_ts)
+                continue
+
+            self._stats["joined"] += 1
+            self._latencies.append(time.monotonic() - arrived)
+            self._max_skew = max(self._max_skew, skew)
+            self.on_record(record, frame_ts)
+
+        cutoff = now - self.horizon
+        if self._pending:
+            cutoff = min(cutoff, self._pending[0][0] - self.tolerance)
+        for buf in self._buffers.values():
+            buf.prune(cutoff)
+
+    # ---------------------------------------------------
+    # Metrics
+    # ---------------------------------------------------
+    def metrics(self):
+        with self._lock:
+            lat = sorted(self._latencies)
+            stats = dict(self._stats)
+            stats["pending_frames"] = len(self._pending)
+            stats["buffered_samples"] = {c: len(b.times) for c, b in self._buffers.items()}
+            stats["max_skew_s"] = round(self._max_skew, 3)
+        if lat:
+            stats["join_latency_ms"] = {
+                "p50": round(lat[len(lat) // 2] * 1000, 2),
+                "p99": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000, 2),
+                "max": round(lat[-1] * 1000, 2),
+            }
+        else:
+            stats["join_latency_ms"] = None
+        return stats
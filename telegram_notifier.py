@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+📣 Fruiture Telegram Notifier
+---------------------------------------------------------------
+Non-blocking alert delivery for prediction.py:
+ - TelegramDispatcher.send() only queues the message; a thread pool fans
+   it out to every chat id concurrently (messages to one chat stay in order)
+ - Rate limits that follow Telegram's bot limits: one message per second
+   per chat, 30 per second overall
+ - Retries with exponential backoff + jitter on timeouts, connection
+   errors, 5xx and 429 (honouring Telegram's retry_after)
+ - Pluggable transport: RequestsTransport (pooled keep-alive session with
+   timeouts, any base URL so a local stub server can stand in for
+   api.telegram.org) or MemoryTransport (records messages, no network)
+ - DayTransitionFilter: alert only when a device's predicted day changes,
+   and only after the new day was seen CONFIRM_PREDICTIONS times in a row
+   (no flapping between two days); state survives restarts and --once runs
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("FRUITURE_DATA_DIR", BASE_DIR)  # test / replay runs keep their own alert state
+TELEGRAM_API = "https://api.telegram.org"
+ALERT_STATE_FILE = os.path.join(DATA_DIR, "telegram_state.json")
+
+SEND_WORKERS = 8
+HTTP_TIMEOUT_SECONDS = 10
+PER_CHAT_INTERVAL_SECONDS = 1.0   # Telegram: ~1 message / second to the same chat
+GLOBAL_RATE_PER_SECOND = 30       # Telegram: ~30 messages / second per bot
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5             # 0.5, 1, 2, 4 s (+ jitter)
+MAX_BACKOFF_SECONDS = 30
+CONFIRM_PREDICTIONS = 2           # same new day twice in a row before alerting
+
+
+# ---------------------------------------------------
+# Transports
+# ---------------------------------------------------
+class RequestsTransport:
+    """Pooled keep-alive HTTPS client; post() returns (status, parsed JSON body or {})."""
+
+    def __init__(self, token, base_url=TELEGRAM_API, pool_size=SEND_WORKERS, timeout=HTTP_TIMEOUT_SECONDS):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = f"{base_url.rstrip('/')}/bot{token}/"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, method, payload):
+        r = self.session.post(self.url + method, json=payload, timeout=self.timeout)
+        try:
+            body = r.json()
+        except ValueError:
+            body = {"description": r.text[:200]}
+        return r.status_code, body
+
+    def close(self):
+        self.session.close()
+
+
+class MemoryTransport:
+    """Records every call instead of sending it; `responses` may queue (status, body) answers."""
+
+    def __init__(self, responses=()):
+        self.sent = []
+        self.responses = deque(responses)
+        self.lock = threading.Lock()
+
+    def post(self, method, payload):
+        with self.lock:
+            self.sent.append((method, payload))
+            return self.responses.popleft() if self.responses else (200, {"ok": True})
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------
+class RateLimiter:
+    """Spaces calls at least `interval` seconds apart; acquire() sleeps until the next slot."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def hold(self, seconds):
+        """Server asked us to back off (429 retry_after)."""
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+# ---------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------
+class TelegramDispatcher:
+    def __init__(self, token, chat_ids, transport=None, base_url=TELEGRAM_API, workers=SEND_WORKERS,
+                 per_chat_interval=PER_CHAT_INTERVAL_SECONDS, global_rate=GLOBAL_RATE_PER_SECOND,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+        self.chat_ids = list(chat_ids)
+        self.transport = transport or RequestsTransport(token, base_url, pool_size=workers)
+        self.per_chat_interval = per_chat_interval
+        self.global_limit = RateLimiter(1.0 / global_rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="telegram")
+        self._cond = threading.Condition()
+        self._queues = {}   # chat_id → deque of pending messages
+        self._limits = {}   # chat_id → RateLimiter
+        self._active = set()  # chats with a drain task running
+        self._closed = False
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retries": 0, "rate_limited": 0,
+                      "last_send_ms": None}
+
+    def send(self, text, parse_mode="Markdown"):
+        """Queue `text` for every chat id and return immediately."""
+        payload = {"text": text, "parse_mode": parse_mode} if parse_mode else {"text": text}
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("TelegramDispatcher is closed")
+            for chat_id in self.chat_ids:
+                self._queues.setdefault(chat_id, deque()).append({**payload, "chat_id": chat_id})
+                self.stats["queued"] += 1
+                if chat_id not in self._active:
+                    self._active.add(chat_id)
+                    self.pool.submit(self._drain, chat_id)
+
+    def _drain(self, chat_id):
+        limit = self._limits.setdefault(chat_id, RateLimiter(self.per_chat_interval))
+        while True:
+            with self._cond:
+                queue = self._queues[chat_id]
+                if not queue:
+                    self._active.discard(chat_id)
+                    self._cond.notify_all()
+                    return
+                payload = queue.popleft()
+            self._deliver(payload, limit)
+
+    def _deliver(self, payload, limit):
+        chat_id = payload["chat_id"]
+        for attempt in range(self.max_retries + 1):
+            limit.acquire()
+            self.global_limit.acquire()
+            start = time.perf_counter()
+            try:
+                status, body = self.transport.post("sendMessage", payload)
+            except Exception as e:  # timeout / connection reset: worth another try
+                status, body = None, {"description": str(e)}
+            if status == 200:
+                self._count("sent", last_send_ms=round((time.perf_counter() - start) * 1000, 1))
+                print(f"✅ Telegram alert sent to {chat_id}")
+                return True
+
+            delay = min(MAX_BACKOFF_SECONDS, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if status == 429:
+                self._count("rate_limited")
+                # Waited out by the next limit.acquire(), so the chat's later messages back off too
+                limit.hold((body.get("parameters") or {}).get("retry_after") or delay)
+            elif status is not None and status < 500:
+                break  # bad token / chat id / markup: retrying will not help
+            if attempt < self.max_retries:
+                self._count("retries")
+                if status != 429:
+                    time.sleep(delay)
+
+        self._count("failed")
+        print(f"⚠️ Telegram failed for {chat_id}: {status} {body.get('description', '')}")
+        return False
+
+    def _count(self, key, **values):
+        with self._cond:
+            self.stats[key] += 1
+            self.stats.update(values)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self._queues.values()) + len(self._active)
+
+    def flush(self, timeout=None):
+        """Wait until every queued message was delivered or given up on; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        with self._cond:
+            self._closed = True
+        self.flush(timeout)
+        self.pool.shutdown(wait=timeout is None)
+        self.transport.close()
+
+
+# ---------------------------------------------------
+# Dedup / hysteresis
+# ---------------------------------------------------
+class DayTransitionFilter:
+    """
+    should_alert(device, day) is True for a device's first prediction and
+    whenever its day changes and the new day has been predicted `confirm`
+    times in a row; repeats of the alerted day are swallowed.
+    """
+
+    def __init__(self, confirm=CONFIRM_PREDICTIONS, state_file=ALERT_STATE_FILE):
+        self.confirm = max(1, confirm)
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        self.state = self._load()  # device → {"alerted": day, "candidate": day, "count": n}
+        self.suppressed = 0
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable {self.state_file}: {e}")
+            return {}
+
+    def _save(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+
+    def should_alert(self, device_id, day):
+        day = int(day)
+        with self.lock:
+            entry = self.state.get(device_id)
+            if entry is None:
+                entry = self.state[device_id] = {"alerted": day, "candidate": day, "count": 1}
+                fire = True
+            elif day == entry["alerted"]:
+                entry.update(candidate=day, count=0)
+                fire = False
+            else:
+                entry["count"] = entry["count"] + 1 if day == entry["candidate"] else 1
+                entry["candidate"] = day
+                fire = entry["count"] >= self.confirm
+                if fire:
+                    entry.update(alerted=day, count=0)
+            if not fire:
+                self.suppressed += 1
+            self._save()
+            return fire
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+🏋️ Banana Age Regression — Training Pipeline
+---------------------------------------------------------------
+Reproducible, parallel replacement for model_regression.py:
+ - Dataset parsed from Excel once, then cached as .npz keyed by the
+   file's sha256 (re-runs skip openpyxl entirely); --data also accepts the
+   Parquet/Feather session table from build_dataset.py (only the feature
+   and target columns are decoded)
+ - Seeded noise on temperature / humidity (same spread as before), with
+   optional extra noisy copies of the training rows as augmentation
+   (copies of one row always stay in the same CV fold)
+ - k-fold CV with grid or random search over forest size / depth / leaf
+   size, folds × candidates spread over all cores (n_jobs=-1)
+ - Best model refit, scored on a held-out split, then written as an
+   artifact folder: model.pkl, scaler.pkl, metrics.json, manifest.json
+   (feature schema: columns, order, summary keys, training ranges),
+   holdout.npz (the test rows) and model.npz (compiled forest); the
+   collector's model_manager.py picks new folders up without a restart
+ - --install copies the model/scaler over the live .pkl files and
+   re-exports the compiled forest
+
+Usage:
+    python train_regression.py
+    python train_regression.py --search random --n-iter 40 --folds 10 --seed 7
+    python train_regression.py --data data/sessions.parquet
+    python train_regression.py --install
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import GridSearchCV, GroupKFold, KFold, RandomizedSearchCV, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from feature_registry import REGRESSION
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_FILE = os.path.join(BASE_DIR, "dataset3 app.xlsx")
+CACHE_DIR = os.path.join(BASE_DIR, ".dataset_cache")
+ARTIFACT_DIR = os.path.join(BASE_DIR, "artifacts")
+MODEL_FILE = os.path.join(BASE_DIR, "banana_regression_model.pkl")
+SCALER_FILE = os.path.join(BASE_DIR, "banana_scaler.pkl")
+
+FEATURES = REGRESSION.names
+TARGET = REGRESSION.target
+
+# Noise that suppresses the unreliable temperature / humidity signal (as in model_regression.py)
+NOISE = {"temperature": (10.0, 15, 40), "humidity": (25.0, 10, 90)}  # column → (std, clip_lo, clip_hi)
+
+GRID = {
+    "rf__n_estimators": [100, 200, 400],
+    "rf__max_depth": [None, 4, 8],
+    "rf__min_samples_leaf": [1, 2, 4],
+}
+RANDOM_SPACE = {
+    "rf__n_estimators": [50, 100, 150, 200, 300, 400, 600],
+    "rf__max_depth": [None, 3, 4, 5, 6, 8, 10, 12],
+    "rf__min_samples_leaf": [1, 2, 3, 4, 6],
+    "rf__max_features": [1.0, "sqrt", 0.5],
+}
+
+
+# ---------------------------------------------------
+# Dataset (Excel → cached .npz)
+# ---------------------------------------------------
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_dataset(path=DATASET_FILE, cache_dir=CACHE_DIR):
+    """DataFrame of FEATURES + TARGET, read from the binary cache when the Excel file is unchanged."""
+    digest = file_sha256(path)
+    if path.endswith((".parquet", ".feather")):
+        # Session table from build_dataset.py: windowed summary features, already columnar
+        from build_dataset import load_table
+        table = load_table(path, columns=REGRESSION.sources + [TARGET])
+        df = pd.DataFrame(REGRESSION.frame_matrix(table), columns=FEATURES)
+        df[TARGET] = table[TARGET].to_numpy(dtype=np.float64)
+        print(f"⚡ Loaded session table {path} ({len(df)} valid rows)")
+        return df, digest
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}.{digest[:16]}.npz")
+    if os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as data:
+            df = pd.DataFrame(data["values"], columns=[str(c) for c in data["columns"]])
+        print(f"⚡ Loaded cached dataset {cache_file}")
+        return df, digest
+
+    start = time.perf_counter()
+    df = pd.read_excel(path)[FEATURES + [TARGET]].astype(np.float64)
+    tmp = cache_file + ".tmp.npz"
+    np.savez(tmp, values=df.to_numpy(), columns=np.array(df.columns, dtype=str))
+    os.replace(tmp, cache_file)
+    print(f"📄 Parsed {path} in {time.perf_counter() - start:.2f}s → cached as {cache_file}")
+    return df, digest
+
+
+def add_noise(df, rng, copies=0):
+    """Seeded temperature/humidity noise; copies > 0 appends that many extra noisy copies (same index)."""
+    parts = []
+    for _ in range(1 + copies):
+        noisy = df.copy()
+        for column, (std, lo, hi) in NOISE.items():
+            noisy[column] = (noisy[column] + rng.normal(0, std, len(noisy))).clip(lo, hi)
+        parts.append(noisy)
+    return pd.concat(parts)
+
+
+# ---------------------------------------------------
+# Training
+# ---------------------------------------------------
+def regression_metrics(y_true, y_pred):
+    return {
+        "mae": round(float(mean_absolute_error(y_true, y_pred)), 4),
+        "rmse": round(float(np.sqrt(mean_squared_error(y_true, y_pred))), 4),
+        "r2": round(float(r2_score(y_true, y_pred)), 4),
+        "day_accuracy": round(float(np.mean(np.clip(np.rint(y_pred), 1, 5) == y_true)), 4),
+    }
+
+
+def build_search(search, folds, n_iter, seed, n_jobs, grouped=False):
+    pipeline = Pipeline([
+        ("scale", StandardScaler()),
+        # one core per forest; the search parallelises across candidates × folds instead
+        ("rf", RandomForestRegressor(random_state=seed, n_jobs=1)),
+    ])
+    # With augmentation, noisy copies of a row share a group so they never straddle train/validation
+    cv = GroupKFold(n_splits=folds) if grouped else KFold(n_splits=folds, shuffle=True, random_state=seed)
+    scoring = {"mae": "neg_mean_absolute_error", "rmse": "neg_root_mean_squared_error", "r2": "r2"}
+    if search == "grid":
+        return GridSearchCV(pipeline, GRID, cv=cv, scoring=scoring, refit="mae", n_jobs=n_jobs)
+    return RandomizedSearchCV(pipeline, RANDOM_SPACE, n_iter=n_iter, cv=cv, scoring=scoring,
+                              refit="mae", n_jobs=n_jobs, random_state=seed)
+
+
+def cv_summary(search):
+    i = search.best_index_
+    res = search.cv_results_
+    return {
+        "mae": round(float(-res["mean_test_mae"][i]), 4),
+        "mae_std": round(float(res["std_test_mae"][i]), 4),
+        "rmse": round(float(-res["mean_test_rmse"][i]), 4),
+        "rmse_std": round(float(res["std_test_rmse"][i]), 4),
+        "r2": round(float(res["mean_test_r2"][i]), 4),
+        "r2_std": round(float(res["std_test_r2"][i]), 4),
+        "candidates": len(res["params"]),
+    }
+
+
+def feature_manifest(X_train):
+    """The registry's schema plus the training range of every feature."""
+    schema = REGRESSION.manifest()
+    for entry in schema["features"]:
+        column = X_train[entry["name"]]
+        entry.update({
+            "min": round(float(column.min()), 4),
+            "max": round(float(column.max()), 4),
+            "mean": round(float(column.mean()), 4),
+            "std": round(float(column.std()), 4),
+        })
+    return schema
+
+
+def train(args):
+    rng = np.random.default_rng(args.seed)
+    df, data_sha = load_dataset(args.data, args.cache_dir)
+    # Split the clean rows first so augmented copies never leak into the test set
+    train_df, test_df = train_test_split(df, test_size=args.test_size, random_state=args.seed)
+    train_df = add_noise(train_df, rng, args.augment)
+    test_df = add_noise(test_df, rng)
+    X_train, y_train = train_df[FEATURES], train_df[TARGET]
+    X_test, y_test = test_df[FEATURES], test_df[TARGET]
+
+    search = build_search(args.search, args.folds, args.n_iter, args.seed, args.n_jobs, grouped=args.augment > 0)
+    start = time.perf_counter()
+    search.fit(X_train, y_train, groups=train_df.index.to_numpy() if args.augment > 0 else None)
+    search_s = time.perf_counter() - start
+    best = search.best_estimator_
+    print(f"🔎 {args.search} search: {len(search.cv_results_['params'])} candidates × {args.folds} folds "
+          f"in {search_s:.1f}s → {search.best_params_}")
+
+    scaler = best.named_steps["scale"]
+    model = best.named_steps["rf"]
+    model.set_params(n_jobs=None)  # serving predicts one summary at a time; no thread pool needed
+    test_metrics = regression_metrics(y_test.to_numpy(), best.predict(X_test))
+
+    metrics = {
+        "cv": cv_summary(search),
+        "test": test_metrics,
+        "best_params": {k.removeprefix("rf__"): v for k, v in search.best_params_.items()},
+        "search_seconds": round(search_s, 2),
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+    }
+    manifest = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model_type": type(model).__name__,
+        "dataset": os.path.basename(args.data),
+        "dataset_sha256": data_sha,
+        "seed": args.seed,
+        "noise": {c: std for c, (std, _, _) in NOISE.items()},
+        "augment_copies": args.augment,
+        "search": args.search,
+        "folds": args.folds,
+        "versions": {"python": platform.python_version(), "sklearn": sklearn.__version__,
+                     "numpy": np.__version__, "pandas": pd.__version__},
+        "schema": feature_manifest(X_train),
+    }
+    REGRESSION.validate(model=model, scaler=scaler, manifest=manifest)
+    holdout = (X_test.to_numpy(dtype=np.float64), y_test.to_numpy(dtype=np.float64))
+    return model, scaler, metrics, manifest, holdout
+
+
+def write_artifact(model, scaler, metrics, manifest, holdout, artifact_dir=ARTIFACT_DIR):
+    """
+    artifacts/banana_regression_<version>/ with the .pkl files, metrics,
+    manifest, the held-out test rows (model_manager.py re-scores them
+    before a hot swap) and a compiled forest for sklearn-free loading.
+    """
+    from compiled_forest import export_forest
+
+    version = time.strftime("%Y%m%d-%H%M%S")
+    out = os.path.join(artifact_dir, f"banana_regression_{version}")
+    tmp = out + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+    joblib.dump(model, os.path.join(tmp, "model.pkl"))
+    joblib.dump(scaler, os.path.join(tmp, "scaler.pkl"))
+    np.savez(os.path.join(tmp, "holdout.npz"), X=holdout[0], y=holdout[1])
+    export_forest(os.path.join(tmp, "model.pkl"), os.path.join(tmp, "scaler.pkl"),
+                  os.path.join(tmp, "model.npz"), extra_rows=holdout[0])
+    manifest = {**manifest, "version": version}
+    for name, payload in (("metrics.json", metrics), ("manifest.json", manifest)):
+        with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    os.replace(tmp, out)  # the folder appears complete or not at all
+    return out
+
+
+def install(artifact):
+    """Make an artifact the live model: copy the .pkl files and re-export the compiled forest."""
+    from compiled_forest import export_forest, training_rows
+
+    shutil.copyfile(os.path.join(artifact, "model.pkl"), MODEL_FILE)
+    shutil.copyfile(os.path.join(artifact, "scaler.pkl"), SCALER_FILE)
+    print(f"📦 Installed {artifact} → {MODEL_FILE}, {SCALER_FILE}")
+    export_forest(extra_rows=training_rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the banana age regression model.")
+    parser.add_argument("--data", default=DATASET_FILE)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default=ARTIFACT_DIR, help="artifact root folder")
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--n-iter", type=int, default=30, help="candidates for --search random")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--augment", type=int, default=0, help="extra noisy copies of the dataset")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--install", action="store_true", help="also make the result the live model")
+    args = parser.parse_args()
+
+    model, scaler, metrics, manifest, holdout = train(args)
+    print("=== Banana Age Prediction Results ===")
+    print(f"CV   MAE: {metrics['cv']['mae']:.3f} ± {metrics['cv']['mae_std']:.3f} | "
+          f"RMSE: {metrics['cv']['rmse']:.3f} | R²: {metrics['cv']['r2']:.3f}")
+    print(f"Test MAE: {metrics['test']['mae']:.3f} | RMSE: {metrics['test']['rmse']:.3f} | "
+          f"R²: {metrics['test']['r2']:.3f} | day accuracy: {metrics['test']['day_accuracy']:.0%}")
+
+    artifact = write_artifact(model, scaler, metrics, manifest, holdout, args.out)
+    print(f"💾 Artifact written to {artifact}")
+    if args.install:
+        install(artifact)
+
+
+if __name__ == "__main__":
+    main()